@@ -0,0 +1,138 @@
+# bench_categorize.py - 分類計分吞吐量比較
+"""比較舊版 _smart_categorize（每個關鍵字各掃一次全文）與 CategoryMatcher（Aho-Corasick 單次掃描），
+並逐筆確認分類結果相同。--scale 會加入大量合成關鍵字，模擬 categories 表越長越大的情況。
+
+用法：
+    python benchmarks/bench_categorize.py
+    python benchmarks/bench_categorize.py --scale 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from category_matcher import CategoryMatcher  # noqa: E402
+
+# main.load_categories 的預設分類
+CATEGORIES = {
+    '餐費': ['餐廳', '小吃', '咖啡', '便當', '火鍋', '燒烤', '飲料', '麥當勞', '肯德基', '星巴克', '85度C'],
+    '交通費': ['加油', '停車', '高鐵', '計程車', '捷運', '公車', '機票', '台鐵', '客運', 'Uber'],
+    '辦公用品': ['文具', '紙張', '印表機', '電腦', '筆', '資料夾', '誠品', '金石堂'],
+    '軟體服務': ['訂閱', 'SaaS', 'Office', 'Adobe', 'Google', 'AWS', 'Microsoft', 'Apple'],
+    '設備採購': ['電腦', '螢幕', '鍵盤', '滑鼠', '椅子', '桌子', '3C', '燦坤', '全國電子'],
+    '購物': ['百貨', '量販', '家樂福', '全聯', '好市多', '大潤發', '購物', '來麵屋'],
+    '醫療費用': ['藥局', '醫院', '診所', '健保', '醫療', '康是美', '屈臣氏'],
+    '娛樂費用': ['電影', 'KTV', '遊戲', '娛樂', '威秀', '國賓'],
+    '雜費': ['水電', '電話', '網路', '清潔', '維修', '銀行', '郵局']
+}
+
+MERCHANTS = ['來麵屋', '星巴克咖啡', '全家便利商店', '家樂福', '台灣大車隊', 'Apple Store', '大樹藥局',
+             '未知商家', '誠品書店', '威秀影城', '中華電信', 'Google Cloud Taiwan']
+LINES = ['統一發票', 'PA50921578', '114年06月16日', '統編: 12345678', '拉麵 120', '美式咖啡 130',
+         '停車費 60', 'Office 365 訂閱', '螢幕 5990', '電影票 2 張', '網路月租 999', '總計: 126',
+         'microsoft surface', 'Uber trip', '健保卡', '御飯糰 x2', 'adobe creative cloud']
+
+
+def legacy_categorize(categories: dict, merchant: str, full_text: str) -> str:
+    """舊版 FreeReceiptAI._smart_categorize（原樣保留作為對照組）"""
+
+    if not merchant:
+        return '雜費'
+
+    # 合併商家名稱和發票內容進行分析
+    analysis_text = f"{merchant} {full_text}".lower()
+
+    # 計算每個分類的匹配分數
+    category_scores = {}
+
+    for category, keywords in categories.items():
+        score = 0
+        for keyword in keywords:
+            keyword_lower = keyword.lower()
+
+            # 商家名稱完全匹配：高分
+            if keyword_lower in merchant.lower():
+                score += 10
+
+            # 發票內容包含：中等分
+            elif keyword_lower in analysis_text:
+                score += 3
+
+            # 部分匹配：低分
+            elif any(part in analysis_text for part in keyword_lower.split() if len(part) > 2):
+                score += 1
+
+        category_scores[category] = score
+
+    # 選擇分數最高的分類
+    if category_scores:
+        best_category = max(category_scores.items(), key=lambda x: x[1])
+        if best_category[1] > 0:  # 有匹配分數
+            return best_category[0]
+
+    return '雜費'  # 預設分類
+
+
+def scaled_categories(scale: int, rng: random.Random) -> dict:
+    """每個分類再加 scale × 10 個合成關鍵字（含多字片語，會觸發部分匹配）"""
+    categories = {name: list(keywords) for name, keywords in CATEGORIES.items()}
+    syllables = '店行館坊屋社料理茶飯麵車票油電網費品器材書藥診影遊'
+    for name in categories:
+        for _ in range(scale * 10):
+            word = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+            if rng.random() < 0.2:
+                word += ' ' + ''.join(rng.choice('abcdefgh') for _ in range(rng.randint(3, 6)))
+            categories[name].append(word)
+    return categories
+
+
+def throughput(categorize, corpus: list, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for merchant, text in corpus:
+            categorize(merchant, text)
+        best = min(best, time.perf_counter() - started)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分類計分吞吐量比較")
+    parser.add_argument("--receipts", type=int, default=3000, help="測試發票數")
+    parser.add_argument("--scale", type=int, default=0, help="每個分類額外加入 scale×10 個合成關鍵字")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--rounds", type=int, default=3, help="重複輪數（取最佳）")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    categories = scaled_categories(args.scale, rng)
+    corpus = [(rng.choice(MERCHANTS), '\n'.join(rng.sample(LINES, rng.randint(3, 10))))
+              for _ in range(args.receipts)]
+
+    started = time.perf_counter()
+    matcher = CategoryMatcher(categories)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    keywords = sum(len(k) for k in categories.values())
+    mismatches = [(m, t) for m, t in corpus
+                  if legacy_categorize(categories, m, t) != matcher.categorize(m, t)]
+    print(f"關鍵字數: {keywords}，自動機狀態數: {len(matcher._goto)}，建立耗時: {build_ms:.1f} ms")
+    print(f"結果一致: {len(corpus) - len(mismatches)}/{len(corpus)}")
+
+    legacy = throughput(lambda m, t: legacy_categorize(categories, m, t), corpus, args.rounds)
+    automaton = throughput(matcher.categorize, corpus, args.rounds)
+
+    print(f"舊版 _smart_categorize : {legacy:>10,.0f} 張/秒 ({1e6 / legacy:.1f} µs/張)")
+    print(f"CategoryMatcher        : {automaton:>10,.0f} 張/秒 ({1e6 / automaton:.1f} µs/張)")
+    print(f"加速: {automaton / legacy:.2f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
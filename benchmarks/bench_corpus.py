@@ -0,0 +1,173 @@
+# bench_corpus.py - 解析與分類的速度/準確度基準
+"""用 receipt_corpus 產生的合成發票量測 receipt_parser.parse 與 CategoryMatcher.categorize：
+
+* 吞吐量（張/秒，取最佳一輪）與逐張延遲的 p50/p99
+* 各欄位準確度（與語料的正確答案完全相同才算對）
+
+--json 存下結果，之後用 --baseline 比較：吞吐量掉超過 --tolerance 或任一欄位準確度下降時結束碼為 1，
+解析熱路徑的退步馬上看得出來。
+
+用法：
+    python benchmarks/bench_corpus.py
+    python benchmarks/bench_corpus.py --receipts 20000 --noise 0.03 --json corpus.json
+    python benchmarks/bench_corpus.py --baseline corpus.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import receipt_parser  # noqa: E402
+from bench_categorize import CATEGORIES  # noqa: E402
+from category_matcher import CategoryMatcher  # noqa: E402
+from receipt_corpus import generate  # noqa: E402
+
+PARSE_FIELDS = ('invoice_number', 'date', 'merchant', 'amount', 'tax_amount', 'supplier_tax_id')
+
+# 準確度允許的下降（浮點誤差）
+ACCURACY_EPSILON = 1e-9
+
+
+def supplier_tax_id(text: str) -> str:
+    """與 FreeReceiptAI._resolve_supplier 查不到供應商時相同：有標籤的第一個統編"""
+    labeled, _ = receipt_parser.tax_id_candidates(text)
+    return labeled[0] if labeled else ''
+
+
+def latencies(function, args_list: list) -> dict:
+    """逐張計時（微秒）"""
+    samples = []
+    for args in args_list:
+        started = time.perf_counter_ns()
+        function(*args)
+        samples.append((time.perf_counter_ns() - started) / 1000)
+
+    samples.sort()
+    return {
+        "p50_us": round(statistics.median(samples), 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        "max_us": round(samples[-1], 2)
+    }
+
+
+def throughput(function, args_list: list, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for args in args_list:
+            function(*args)
+        best = min(best, time.perf_counter() - started)
+    return len(args_list) / best
+
+
+def accuracy(corpus: list, matcher: CategoryMatcher) -> dict:
+    """各欄位答對的比例；分類以解析出的商家名稱計分（與 _analyze 相同）"""
+    correct = dict.fromkeys(PARSE_FIELDS + ('category',), 0)
+    by_template = {}
+
+    for receipt in corpus:
+        text = receipt['text']
+        truth = receipt['truth']
+        parsed = receipt_parser.parse(text)
+        parsed['supplier_tax_id'] = supplier_tax_id(text)
+        parsed['category'] = matcher.categorize(parsed['merchant'], text)
+
+        hits = {field: parsed[field] == truth[field] for field in correct}
+        for field, hit in hits.items():
+            correct[field] += hit
+
+        template = by_template.setdefault(receipt['template'], {"receipts": 0, "all_fields": 0})
+        template["receipts"] += 1
+        template["all_fields"] += all(hits.values())
+
+    total = len(corpus)
+    return {
+        "fields": {field: round(count / total, 4) for field, count in correct.items()},
+        "templates": {name: round(t["all_fields"] / t["receipts"], 4) for name, t in sorted(by_template.items())}
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """回傳退步項目"""
+    regressions = []
+    for stage in ('parse', 'categorize'):
+        now = result[stage]["receipts_per_s"]
+        before = baseline[stage]["receipts_per_s"]
+        if now < before * (1 - tolerance):
+            regressions.append(f"{stage} 吞吐量 {before:,.0f} → {now:,.0f} 張/秒")
+
+    for field, before in baseline["accuracy"]["fields"].items():
+        now = result["accuracy"]["fields"].get(field, 0)
+        if now < before - ACCURACY_EPSILON:
+            regressions.append(f"{field} 準確度 {before:.2%} → {now:.2%}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析與分類的速度/準確度基準")
+    parser.add_argument("--receipts", type=int, default=5000, help="合成發票張數")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--noise", type=float, default=0.02, help="OCR誤認機率（每字）")
+    parser.add_argument("--rounds", type=int, default=3, help="吞吐量重複輪數（取最佳）")
+    parser.add_argument("--json", help="結果輸出成 JSON 檔")
+    parser.add_argument("--baseline", help="與先前 --json 的結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允許的吞吐量下降比例")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    corpus = generate(args.receipts, args.seed, args.noise)
+    generate_ms = (time.perf_counter() - started) * 1000
+    matcher = CategoryMatcher(CATEGORIES)
+
+    texts = [(receipt['text'],) for receipt in corpus]
+    merchants = [(receipt_parser.parse(text)['merchant'], text) for (text,) in texts]
+
+    result = {
+        "corpus": {"receipts": len(corpus), "seed": args.seed, "noise": args.noise,
+                   "generate_ms": round(generate_ms, 1)},
+        "parse": {"receipts_per_s": round(throughput(receipt_parser.parse, texts, args.rounds)),
+                  **latencies(receipt_parser.parse, texts)},
+        "categorize": {"receipts_per_s": round(throughput(matcher.categorize, merchants, args.rounds)),
+                       **latencies(matcher.categorize, merchants)},
+        "accuracy": accuracy(corpus, matcher)
+    }
+
+    print(f"語料: {len(corpus)} 張（種子 {args.seed}，誤認率 {args.noise}，產生 {generate_ms:.0f} ms）")
+    for stage, label in (('parse', 'receipt_parser.parse'), ('categorize', 'CategoryMatcher')):
+        r = result[stage]
+        print(f"{label:<22}: {r['receipts_per_s']:>10,} 張/秒  p50 {r['p50_us']:.1f} µs  p99 {r['p99_us']:.1f} µs")
+    print("欄位準確度:")
+    for field, value in result["accuracy"]["fields"].items():
+        print(f"  {field:<16} {value:.2%}")
+    print("整張全對（依版型）:")
+    for template, value in result["accuracy"]["templates"].items():
+        print(f"  {template:<16} {value:.2%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if {k: baseline["corpus"][k] for k in ('receipts', 'seed', 'noise')} != \
+                {k: result["corpus"][k] for k in ('receipts', 'seed', 'noise')}:
+            print(f"⚠️ 語料參數與基準不同（基準: {baseline['corpus']}），準確度無法直接比較")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("⚠️ 退步:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("✅ 沒有退步")
+
+
+if __name__ == "__main__":
+    main()
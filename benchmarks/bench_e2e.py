@@ -0,0 +1,261 @@
+# bench_e2e.py - 端到端發票處理延遲基準
+"""把一組圖片重複送進完整流程（ai.process_receipt → insert_receipt），在不同並行數下量測：
+
+* 各階段耗時：decode、resize（含其他前處理步驟）、detect、recognize、parse、categorize、db_insert
+* 每張的總延遲 p50/p99、吞吐量（張/秒）
+* 記憶體峰值（RSS，每個並行數各自取樣，多程序後端包含工作程序）
+
+結果寫成 JSON，不同版本之間可以用 --baseline 直接比較吞吐量與延遲。
+為了不動到正式資料庫，預設在暫存目錄建立新的 receipts.db，也不使用OCR快取。
+
+用法：
+    python benchmarks/bench_e2e.py                                   # uploads/ 全部圖片，並行 1,2,4
+    python benchmarks/bench_e2e.py --repeat 5 --concurrency 1,4,8 --json e2e.json
+    python benchmarks/bench_e2e.py --images "uploads/*.jpg" --no-qr --baseline e2e.json
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 回報用的階段順序；前處理的其他步驟（exif、gray、crop、deskew）併在 preprocess_other
+STAGES = ('decode', 'resize', 'preprocess_other', 'detect', 'recognize', 'ocr_other', 'parse', 'categorize',
+          'db_insert')
+PREPROCESS_OTHER = ('exif_ms', 'gray_ms', 'crop_ms', 'deskew_ms')
+
+
+class RSSSampler:
+    """背景執行緒每隔一段時間取樣本程序加上子程序（多程序後端的工作程序）的 RSS，記下峰值（MB）"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_mb = tree_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, tree_rss_mb())
+
+
+def rss_mb(pid) -> float:
+    """/proc/<pid>/status 的 VmRSS（MB）；沒有 /proc 的系統退回 ru_maxrss"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if pid == 'self' else 0.0
+
+
+def tree_rss_mb() -> float:
+    """本程序 + 直接子程序的 RSS 合計"""
+    total = rss_mb('self')
+    for children in glob.glob('/proc/self/task/*/children'):
+        try:
+            with open(children) as f:
+                total += sum(rss_mb(pid) for pid in f.read().split())
+        except OSError:
+            pass
+    return total
+
+
+def stage_timings(data: dict, insert_ms: float) -> dict:
+    """把 ocr_timings 整理成固定的階段"""
+    timings = data.get('ocr_timings') or {}
+    stages = {
+        'decode': timings.get('decode_ms', 0),
+        'resize': timings.get('resize_ms', 0),
+        'preprocess_other': sum(timings.get(k, 0) for k in PREPROCESS_OTHER),
+        'detect': timings.get('detect_ms', 0),
+        'recognize': timings.get('recognize_ms', 0),
+        'parse': timings.get('parse_ms', 0) + timings.get('layout_ms', 0),
+        'categorize': timings.get('categorize_ms', 0),
+        'db_insert': insert_ms,
+    }
+    # 分段辨識（長條收據）沒有分開偵測/辨識，整段算在 ocr_other
+    stages['ocr_other'] = max(0.0, timings.get('ocr_ms', 0) - stages['detect'] - stages['recognize'])
+    return stages
+
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(values), 2),
+        "p99_ms": round(values[min(len(values) - 1, int(len(values) * 0.99))], 2),
+        "mean_ms": round(statistics.fmean(values), 2)
+    }
+
+
+async def run_level(main, images: list, repeat: int, concurrency: int) -> dict:
+    """同時最多 concurrency 張，把每張圖片跑 repeat 次"""
+    semaphore = asyncio.Semaphore(concurrency)
+    conn = main.db.connect()
+    samples = []
+
+    async def one(name: str, image_data: bytes):
+        async with semaphore:
+            started = time.perf_counter()
+            data = await main.ai.process_receipt(image_data)
+
+            insert_started = time.perf_counter()
+            cursor = conn.cursor()
+            memo_deltas = {}
+            main.insert_receipt(cursor, None, data, memo_deltas)
+            conn.commit()
+            main.merchant_memo.apply(memo_deltas)
+            finished = time.perf_counter()
+
+            samples.append({
+                "image": name,
+                "source": data['ocr_source'],
+                "total_ms": (finished - started) * 1000,
+                "stages": stage_timings(data, (finished - insert_started) * 1000)
+            })
+
+    jobs = [(name, image_data) for _ in range(repeat) for name, image_data in images]
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(name, image_data) for name, image_data in jobs))
+        wall = time.perf_counter() - started
+    conn.close()
+
+    sources = {}
+    for sample in samples:
+        sources[sample['source']] = sources.get(sample['source'], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(samples) / wall, 3),
+        "latency": summarize([s['total_ms'] for s in samples]),
+        "stages": {stage: summarize([s['stages'][stage] for s in samples]) for stage in STAGES},
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "sources": sources,
+        "executor": main.ocr_executor.stats()
+    }
+
+
+async def run_all(main, images: list, repeat: int, levels: list, verbose: bool) -> list:
+    results = []
+    for concurrency in levels:
+        print(f"▶ 並行 {concurrency}：{len(images)} 張 × {repeat} 次")
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+        with output:
+            level = await run_level(main, images, repeat, concurrency)
+        results.append(level)
+
+        latency = level['latency']
+        print(f"  吞吐量 {level['throughput_per_s']:.2f} 張/秒  p50 {latency['p50_ms']:.0f} ms  "
+              f"p99 {latency['p99_ms']:.0f} ms  RSS峰值 {level['peak_rss_mb']:.0f} MB  來源 {level['sources']}")
+        print("  " + "  ".join(f"{stage} {level['stages'][stage]['p50_ms']:.1f}" for stage in STAGES))
+    return results
+
+
+def compare(results: list, baseline: dict):
+    """與先前的 JSON 結果比較各並行數的吞吐量與 p50 延遲"""
+    before = {level['concurrency']: level for level in baseline.get('levels', [])}
+    print("\n與基準比較:")
+    for level in results:
+        old = before.get(level['concurrency'])
+        if old is None:
+            continue
+        throughput = (level['throughput_per_s'] - old['throughput_per_s']) / old['throughput_per_s'] * 100
+        latency = (level['latency']['p50_ms'] - old['latency']['p50_ms']) / old['latency']['p50_ms'] * 100
+        print(f"  並行 {level['concurrency']}: 吞吐量 {throughput:+.1f}%  p50 延遲 {latency:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端發票處理延遲基準")
+    parser.add_argument("--images", default=os.path.join(ROOT, "uploads", "*"), help="圖片 glob")
+    parser.add_argument("--repeat", type=int, default=3, help="每張圖片在每個並行數下的次數")
+    parser.add_argument("--concurrency", default="1,2,4", help="並行數（逗號分隔）")
+    parser.add_argument("--no-qr", action="store_true", help="關閉電子發票QR Code快速路徑，全部走OCR")
+    parser.add_argument("--db", help="使用既有資料庫所在目錄（預設為新的暫存目錄）")
+    parser.add_argument("--json", help="結果輸出成 JSON 檔")
+    parser.add_argument("--baseline", help="與先前 --json 的結果比較")
+    parser.add_argument("--verbose", action="store_true", help="顯示流程本身的輸出")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.abspath(p) for p in glob.glob(args.images)
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+    if not paths:
+        sys.exit(f"找不到圖片: {args.images}")
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    if args.no_qr:
+        os.environ["QR_FAST_PATH"] = "0"
+
+    # main 匯入時就會在目前目錄建立 receipts.db
+    workdir = args.db or tempfile.mkdtemp(prefix='bench_e2e_')
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import main as app_main
+
+    started = time.perf_counter()
+    app_main.ai._load_model()
+    load_s = time.perf_counter() - started
+    if not app_main.ai.ocr_available:
+        sys.exit("EasyOCR 無法載入")
+    print(f"模型載入 {load_s:.1f} 秒（{app_main.OCR_BACKEND} 後端，{app_main.ocr_executor.max_workers} 個推論槽），"
+          f"資料庫 {workdir}")
+
+    levels_result = asyncio.run(run_all(app_main, images, args.repeat, levels, args.verbose))
+    app_main.ocr_executor.shutdown()
+
+    result = {
+        "engine_version": app_main.ocr_worker.ENGINE_VERSION,
+        "backend": app_main.OCR_BACKEND,
+        "qr_fast_path": app_main.QR_FAST_PATH,
+        "images": [name for name, _ in images],
+        "repeat": args.repeat,
+        "model_load_s": round(load_s, 2),
+        "levels": levels_result,
+        "peak_rss_mb": max(level['peak_rss_mb'] for level in levels_result)
+    }
+
+    print(f"\n記憶體峰值（含工作程序）: {result['peak_rss_mb']:.0f} MB")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {json_path}")
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            compare(levels_result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
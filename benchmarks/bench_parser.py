@@ -0,0 +1,229 @@
+# bench_parser.py - 發票欄位擷取吞吐量比較
+"""比較舊版 _smart_parse（每次以字串樣式逐一 re.search）與 receipt_parser
+（預先編譯的樣式 + 關鍵字前置過濾，仍依序逐一比對，不是單次掃描）的吞吐量，
+並逐筆確認兩者結果相同
+
+用法：
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --receipts 20000 --seed 7
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import receipt_parser  # noqa: E402
+
+
+def legacy_parse(text: str) -> dict:
+    """舊版 FreeReceiptAI._smart_parse（原樣保留作為對照組）"""
+
+    result = {
+        'invoice_number': '',
+        'date': '',
+        'merchant': '',
+        'amount': 0,
+        'tax_amount': 0,
+        'items': []
+    }
+
+    # 發票號碼：兩個英文字母+8個數字
+    invoice_match = re.search(r'[A-Z]{2}[\-]?[0-9]{8}', text)
+    if invoice_match:
+        result['invoice_number'] = invoice_match.group().replace('-', '')
+
+    # 總金額：更全面的模式匹配
+    amount_patterns = [
+        r'總計[：:\s]*\$?[\s]*(\d{1,6})',
+        r'合計[：:\s]*\$?[\s]*(\d{1,6})',
+        r'含稅總計[：:\s]*(\d{1,6})',
+        r'總金額[：:\s]*(\d{1,6})',
+        r'小計[：:\s]*(\d{1,6})',
+        r'金額[：:\s]*(\d{1,6})',
+        r'NT\$[\s]*(\d{1,6})',
+        r'應收[：:\s]*(\d{1,6})',
+        r'收費[：:\s]*(\d{1,6})'
+    ]
+
+    for pattern in amount_patterns:
+        match = re.search(pattern, text)
+        if match:
+            result['amount'] = int(match.group(1))
+            break
+
+    # 如果沒找到總計，找最大的數字（但過濾掉明顯不是金額的）
+    if result['amount'] == 0:
+        numbers = re.findall(r'\d{1,6}', text)
+        if numbers:
+            amounts = []
+            for n in numbers:
+                num = int(n)
+                # 合理的金額範圍：10-99999
+                if 10 <= num <= 99999 and len(n) <= 5:
+                    # 排除常見的非金額數字
+                    if not (len(n) == 8 or len(n) == 10):  # 排除統編、電話
+                        amounts.append(num)
+
+            if amounts:
+                result['amount'] = max(amounts)
+
+    # 日期解析
+    date_patterns = [
+        r'(\d{2,3})[年/\-.](\d{1,2})[月/\-.](\d{1,2})',  # 民國年
+        r'(\d{4})[年/\-.](\d{1,2})[月/\-.](\d{1,2})',  # 西元年
+        r'(\d{4})/(\d{1,2})/(\d{1,2})',  # 2024/12/16
+        r'(\d{4})-(\d{1,2})-(\d{1,2})',  # 2024-12-16
+    ]
+
+    for pattern in date_patterns:
+        date_match = re.search(pattern, text)
+        if date_match:
+            year = int(date_match.group(1))
+            if year < 1000:  # 民國年轉西元年
+                year += 1911
+            month = int(date_match.group(2))
+            day = int(date_match.group(3))
+
+            # 驗證日期合理性
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                result['date'] = f"{year}-{month:02d}-{day:02d}"
+                break
+
+    if not result['date']:
+        result['date'] = datetime.now().strftime('%Y-%m-%d')
+
+    # 商家名稱辨識（針對台灣商家優化）
+    merchant_patterns = [
+        # 台灣常見店家格式
+        r'(來麵屋|星巴克|麥當勞|肯德基|全家|7-ELEVEN|誠品|屈臣氏|康是美|中油)',
+        r'([\u4e00-\u9fff]+(?:麵屋|餐廳|咖啡|書店|藥局|醫院|診所|便利商店|加油站))',
+        r'([\u4e00-\u9fff]+(?:公司|企業|行|店|館|廳|坊|屋|社|中心))',
+        r'([A-Za-z]+(?:Starbucks|McDonald|KFC|FamilyMart))',
+    ]
+
+    for pattern in merchant_patterns:
+        merchant_match = re.search(pattern, text, re.IGNORECASE)
+        if merchant_match:
+            result['merchant'] = merchant_match.group(1)
+            break
+
+    # 如果沒找到，找最長的中文字串
+    if not result['merchant']:
+        chinese_texts = re.findall(r'[\u4e00-\u9fff]+', text)
+        if chinese_texts:
+            # 過濾掉常見的無用詞
+            filtered = [t for t in chinese_texts
+                        if t not in ['統一發票', '電子發票', '營業稅', '總計', '合計', '小計',
+                                     '品項', '數量', '單價', '金額', '日期', '時間', '發票號碼']]
+            if filtered:
+                # 優先選擇長度適中的（2-8字）
+                suitable = [t for t in filtered if 2 <= len(t) <= 8]
+                if suitable:
+                    result['merchant'] = max(suitable, key=len)
+                else:
+                    result['merchant'] = max(filtered, key=len)
+
+    if not result['merchant']:
+        result['merchant'] = '未知商家'
+
+    # 稅額計算
+    if result['amount'] > 0:
+        # 先嘗試找明確的稅額
+        tax_patterns = [
+            r'營業稅[：:\s]*(\d{1,4})',
+            r'稅額[：:\s]*(\d{1,4})',
+            r'TAX[：:\s]*(\d{1,4})',
+        ]
+
+        for pattern in tax_patterns:
+            tax_match = re.search(pattern, text, re.IGNORECASE)
+            if tax_match:
+                result['tax_amount'] = int(tax_match.group(1))
+                break
+
+        # 如果沒找到，按5%計算
+        if result['tax_amount'] == 0:
+            result['tax_amount'] = round(result['amount'] * 0.05)
+
+    return result
+
+
+# 組合測試文字用的片段：正常欄位 + 容易混淆的寫法（重疊關鍵字、西元年、大小寫、OCR雜訊）
+FRAGMENTS = [
+    '統一發票', '電子發票', '電子發票證明聯', 'PA50921578', 'AB-87654321', 'cd11223344', 'ZZ1234567',
+    '114年06月16日', '113/12/31', '2024/12/16', '2024-01-05', '2024.13.40', '1130616', '14:35:20',
+    '來麵屋', '全家便利商店', '7-eleven', '星巴克咖啡', '家樂福', '全聯福利中心', '小蒙牛火鍋餐廳',
+    '台灣大車隊股份有限公司', 'FamilyMart', 'myStarbucks', '金石堂書店', '大樹藥局',
+    '統編: 12345678', '電話 02-27208889', '品項: 拉麵', '數量: 2', '單價: 120',
+    '總計: 126', '總計 $ 1,280', '合計 $350', '含稅總計: 58', '含稅總計 $58', '總金額：999',
+    '小計 310', '小計 0', '金額: 88', 'NT$ 1500', 'NT$45', '應收：720', '收費 60', 'TOTAL 300',
+    '營業稅: 6', '營業稅額 15', '稅額：12', 'tax 9', 'TX5', '找零 40', '現金 1000',
+    '美式咖啡: 130', '蛋糕: 85', '御飯糰 x2 58', '隨機碼 8341', '賣方 28555485',
+]
+
+
+def build_corpus(count: int, seed: int) -> list:
+    """固定亂數種子組出測試文字，另外加入OCR快取中的真實辨識結果"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        lines = rng.sample(FRAGMENTS, rng.randint(3, 14))
+        corpus.append(rng.choice(['\n', ' ', '']).join(lines) + '\n')
+
+    db_path = os.path.join(ROOT, 'receipts.db')
+    if os.path.exists(db_path):
+        try:
+            conn = sqlite3.connect(db_path)
+            corpus.extend(text for (text,) in conn.execute('SELECT text FROM ocr_cache') if text)
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    return corpus
+
+
+def throughput(parse, corpus: list, rounds: int) -> float:
+    """每秒可解析的張數（取最佳一輪）"""
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for text in corpus:
+            parse(text)
+        best = min(best, time.perf_counter() - started)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="發票欄位擷取吞吐量比較")
+    parser.add_argument("--receipts", type=int, default=5000, help="測試文字數")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--rounds", type=int, default=5, help="重複輪數（取最佳）")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.receipts, args.seed)
+
+    mismatches = [text for text in corpus if legacy_parse(text) != receipt_parser.parse(text)]
+    print(f"結果一致: {len(corpus) - len(mismatches)}/{len(corpus)}")
+    for text in mismatches[:5]:
+        print(f"  ✗ {text!r}\n    舊版: {legacy_parse(text)}\n    新版: {receipt_parser.parse(text)}")
+
+    legacy = throughput(legacy_parse, corpus, args.rounds)
+    gated = throughput(receipt_parser.parse, corpus, args.rounds)
+
+    print(f"舊版 _smart_parse : {legacy:>10,.0f} 張/秒 ({1e6 / legacy:.1f} µs/張)")
+    print(f"receipt_parser    : {gated:>10,.0f} 張/秒 ({1e6 / gated:.1f} µs/張)")
+    print(f"加速: {gated / legacy:.2f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
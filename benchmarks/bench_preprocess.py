@@ -0,0 +1,97 @@
+# bench_preprocess.py - 前處理前後的 OCR 延遲比較
+"""比較舊版（只做等比縮放）與 OpenCV 前處理流程的 OCR 延遲
+
+用法：
+    python benchmarks/bench_preprocess.py                 # uploads/ 下的所有圖片
+    python benchmarks/bench_preprocess.py --repeat 5 --images "uploads/*.jpg"
+    python benchmarks/bench_preprocess.py --steps exif,gray,resize --json result.json
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ocr_preprocess  # noqa: E402
+import ocr_worker  # noqa: E402
+
+
+def run_variant(image_data: bytes, steps, repeat: int) -> dict:
+    """同一張圖片跑 repeat 次，回傳中位數耗時與辨識結果摘要"""
+    preprocess_ms = []
+    ocr_ms = []
+    tokens = []
+    pixels = 0
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        array, _ = ocr_worker.prepare_image(image_data, steps)
+        preprocess_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        tokens = ocr_worker._reader.readtext(array)
+        ocr_ms.append((time.perf_counter() - started) * 1000)
+
+        pixels = array.shape[0] * array.shape[1]
+
+    confidences = [float(c) for _, _, c in tokens]
+
+    return {
+        "pixels": pixels,
+        "preprocess_ms": round(statistics.median(preprocess_ms), 1),
+        "ocr_ms": round(statistics.median(ocr_ms), 1),
+        "total_ms": round(statistics.median(p + o for p, o in zip(preprocess_ms, ocr_ms)), 1),
+        "tokens": len(tokens),
+        "avg_confidence": round(sum(confidences) / len(confidences), 3) if confidences else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 前處理前後延遲比較")
+    parser.add_argument("--images", default=os.path.join(ROOT, "uploads", "*"), help="圖片 glob")
+    parser.add_argument("--repeat", type=int, default=3, help="每張圖片重複次數（取中位數）")
+    parser.add_argument("--steps", default=",".join(ocr_preprocess.ALL_STEPS), help="前處理步驟")
+    parser.add_argument("--json", help="結果另存 JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(args.images)
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+    if not paths:
+        sys.exit(f"找不到圖片: {args.images}")
+
+    if not ocr_worker.init_reader(warm=True):
+        sys.exit("EasyOCR 無法載入")
+
+    steps = tuple(s for s in ocr_preprocess.ALL_STEPS if s in args.steps.split(','))
+    results = []
+
+    print(f"{'圖片':<44} {'版本':<10} {'像素':>9} {'前處理ms':>9} {'OCRms':>9} {'總計ms':>9} {'字串':>5} {'信心度':>6}")
+    for path in paths:
+        with open(path, 'rb') as f:
+            image_data = f.read()
+
+        row = {"image": os.path.basename(path)}
+        for name, variant_steps in (("baseline", ()), ("pipeline", steps)):
+            row[name] = run_variant(image_data, variant_steps, args.repeat)
+            r = row[name]
+            print(f"{row['image']:<44} {name:<10} {r['pixels']:>9} {r['preprocess_ms']:>9} "
+                  f"{r['ocr_ms']:>9} {r['total_ms']:>9} {r['tokens']:>5} {r['avg_confidence']:>6}")
+        results.append(row)
+
+    baseline = sum(r["baseline"]["total_ms"] for r in results)
+    pipeline = sum(r["pipeline"]["total_ms"] for r in results)
+    print(f"\n總延遲: baseline {baseline:.1f} ms → pipeline {pipeline:.1f} ms "
+          f"({(pipeline - baseline) / baseline * 100:+.1f}%)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"steps": steps, "repeat": args.repeat, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
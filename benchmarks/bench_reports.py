@@ -0,0 +1,241 @@
+# bench_reports.py - 報表查詢與索引基準
+"""在暫存目錄建立與正式環境相同 schema 的 receipts.db，灌入大量合成發票（預設一百萬筆），比較：
+
+* 舊查詢：date LIKE '2025-06%'、沒有索引的 ORDER BY created_at 與 invoice_number 查找
+  （以 NOT INDEXED 模擬加索引之前的資料表）
+* 新查詢：半開區間 date >= ? AND date < ?，走 migrations.RECEIPT_INDEXES；
+  月報表、年度摘要改讀觸發器維護的 receipt_monthly_agg（灌資料的時間包含觸發器的成本；
+  舊的年度總結是 13 個 LIKE 查詢，這裡只量其中的年度總計一個）
+
+每個查詢印出 EXPLAIN QUERY PLAN 與耗時中位數；新查詢的執行計畫沒有用到索引時結束碼為 1。
+
+用法：
+    python benchmarks/bench_reports.py
+    python benchmarks/bench_reports.py --rows 200000 --repeat 10 --json reports.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORIES = ('餐費', '交通費', '辦公用品', '設備採購', '購物', '醫療費用', '娛樂費用', '雜費')
+MERCHANTS = ('來麵屋', '星巴克咖啡', '麥當勞', '台灣中油加油站', '台灣高鐵', '誠品書店', '燦坤3C', '家樂福',
+             '全聯福利中心', '康是美', '威秀影城', '中華電信')
+
+FIRST_DAY = date(2021, 1, 1)
+DAYS = (date(2026, 1, 1) - FIRST_DAY).days
+
+INSERT_BATCH = 50000
+
+# (名稱, 舊查詢, 新查詢, 參數)；舊查詢的參數把區間換成 LIKE 樣式
+QUERIES = (
+    ('monthly_by_category',
+     '''SELECT category, SUM(amount), COUNT(*), AVG(ocr_confidence)
+        FROM receipts NOT INDEXED WHERE date LIKE ? GROUP BY category ORDER BY SUM(amount) DESC''',
+     '''SELECT category, SUM(amount), SUM(tax_amount), COUNT(*), SUM(ocr_confidence), COUNT(ocr_confidence)
+        FROM receipts WHERE date >= ? AND date < ? GROUP BY category ORDER BY SUM(amount) DESC''',
+     'month'),
+    ('monthly_report_agg',
+     '''SELECT category, SUM(amount), COUNT(*), AVG(ocr_confidence)
+        FROM receipts NOT INDEXED WHERE date LIKE ? GROUP BY category ORDER BY SUM(amount) DESC''',
+     '''SELECT category, amount_sum, tax_sum, receipt_count, confidence_sum, confidence_count
+        FROM receipt_monthly_agg WHERE period = ? ORDER BY amount_sum DESC''',
+     'period'),
+    ('yearly_summary',
+     '''SELECT SUM(amount), SUM(tax_amount), COUNT(*) FROM receipts NOT INDEXED WHERE date LIKE ?''',
+     '''SELECT substr(period, 1, 7), SUM(amount_sum), SUM(tax_sum), SUM(receipt_count)
+        FROM receipt_monthly_agg WHERE period >= ? AND period < ? GROUP BY 1''',
+     'year'),
+    ('monthly_totals',
+     '''SELECT SUM(amount), SUM(tax_amount), COUNT(*), AVG(ocr_confidence)
+        FROM receipts NOT INDEXED WHERE date LIKE ?''',
+     '''SELECT SUM(amount), SUM(tax_amount), COUNT(*), AVG(ocr_confidence)
+        FROM receipts WHERE date >= ? AND date < ?''',
+     'month'),
+    ('category_month',
+     '''SELECT COUNT(*), SUM(amount) FROM receipts NOT INDEXED WHERE category = ? AND date LIKE ?''',
+     '''SELECT COUNT(*), SUM(amount) FROM receipts WHERE category = ? AND date >= ? AND date < ?''',
+     'category_month'),
+    ('recent_receipts',
+     '''SELECT id, date, merchant, amount, category, created_at, ocr_confidence
+        FROM receipts NOT INDEXED ORDER BY created_at DESC LIMIT 50''',
+     '''SELECT id, date, merchant, amount, category, created_at, ocr_confidence
+        FROM receipts ORDER BY created_at DESC LIMIT 50''',
+     'none'),
+    ('invoice_lookup',
+     '''SELECT id FROM receipts NOT INDEXED WHERE invoice_number = ?''',
+     '''SELECT id FROM receipts WHERE invoice_number = ?''',
+     'invoice'),
+)
+
+
+def synthetic_rows(count: int, seed: int):
+    """產生 count 筆 receipts 欄位值，每批 INSERT_BATCH 筆"""
+    rng = random.Random(seed)
+    batch = []
+    for i in range(count):
+        day = FIRST_DAY + timedelta(days=rng.randrange(DAYS))
+        amount = rng.randint(30, 5000)
+        batch.append((
+            f"{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{i:08d}",
+            day.isoformat(),
+            rng.choice(MERCHANTS),
+            amount,
+            round(amount * 0.05),
+            rng.choice(CATEGORIES),
+            round(rng.uniform(0.5, 1.0), 2),
+            f"{day.isoformat()}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+        ))
+        if len(batch) == INSERT_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def populate(conn, main, rows: int, seed: int) -> dict:
+    """先拿掉索引灌資料再重建（比逐筆維護索引快），回傳各步驟耗時"""
+    cursor = conn.cursor()
+    for index_sql in main.migrations.RECEIPT_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_sql.split()[5]}")
+
+    started = time.perf_counter()
+    for batch in synthetic_rows(rows, seed):
+        cursor.executemany('''
+            INSERT INTO receipts (invoice_number, date, merchant, amount, tax_amount, category,
+                                  ocr_confidence, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+    conn.commit()
+    insert_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for index_sql in main.migrations.RECEIPT_INDEXES:
+        cursor.execute(index_sql)
+    cursor.execute('ANALYZE')
+    conn.commit()
+    index_s = time.perf_counter() - started
+
+    return {"insert_s": round(insert_s, 2), "index_s": round(index_s, 2)}
+
+
+def month_range(year: int, month: int) -> tuple:
+    """某月的半開日期區間 [當月1日, 次月1日)，查詢寫成 date >= ? AND date < ? 才用得到索引"""
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def parameters(kind: str, main, sample: dict, legacy: bool) -> tuple:
+    year, month = sample['year'], sample['month']
+    start, end = month_range(year, month)
+    pattern = f"{year}-{month:02d}%"
+    if kind == 'month':
+        return (pattern,) if legacy else (start, end)
+    if kind == 'year':
+        return (f"{year}%",) if legacy else (f"{year:04d}-01", f"{year + 1:04d}-01")
+    if kind == 'period':
+        return (pattern,) if legacy else (main.month_period(year, month),)
+    if kind == 'category_month':
+        return (sample['category'], pattern) if legacy else (sample['category'], start, end)
+    if kind == 'invoice':
+        return (sample['invoice_number'],)
+    return ()
+
+
+def query_plan(cursor, sql: str, params: tuple) -> list:
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+
+def uses_index(plan: list) -> bool:
+    """沒有對 receipts 整表掃描（SCAN receipts 且沒有 USING INDEX）"""
+    return not any(step.startswith('SCAN receipts') and 'USING' not in step for step in plan)
+
+
+def median_ms(cursor, sql: str, params: tuple, repeat: int) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="報表查詢與索引基準")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="合成發票筆數")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--repeat", type=int, default=5, help="每個查詢重複次數（取中位數）")
+    parser.add_argument("--json", help="結果輸出成 JSON 檔")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # main 匯入時就會在目前目錄建立 receipts.db（含 migrations.RECEIPT_INDEXES）
+    workdir = tempfile.mkdtemp(prefix='bench_reports_')
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import main as app_main
+
+    conn = app_main.db.connect()
+    cursor = conn.cursor()
+    print(f"▶ 灌入 {args.rows:,} 筆合成發票到 {workdir}")
+    build = populate(conn, app_main, args.rows, args.seed)
+    print(f"  寫入 {build['insert_s']:.1f} 秒，建索引+ANALYZE {build['index_s']:.1f} 秒")
+
+    cursor.execute("SELECT invoice_number FROM receipts WHERE id = ?", (args.rows // 2 or 1,))
+    sample = {"year": 2025, "month": 6, "category": CATEGORIES[0], "invoice_number": cursor.fetchone()[0]}
+
+    results = []
+    failed = []
+    for name, legacy_sql, sql, kind in QUERIES:
+        legacy_params = parameters(kind, app_main, sample, legacy=True)
+        params = parameters(kind, app_main, sample, legacy=False)
+
+        legacy_ms, legacy_rows = median_ms(cursor, legacy_sql, legacy_params, args.repeat)
+        indexed_ms, indexed_rows = median_ms(cursor, sql, params, args.repeat)
+        plan = query_plan(cursor, sql, params)
+        result = {
+            "query": name,
+            "before_ms": legacy_ms,
+            "after_ms": indexed_ms,
+            "speedup": round(legacy_ms / indexed_ms, 1) if indexed_ms else None,
+            "rows": len(indexed_rows),
+            "before_plan": query_plan(cursor, legacy_sql, legacy_params),
+            "after_plan": plan,
+            "uses_index": uses_index(plan)
+        }
+        results.append(result)
+        if not result["uses_index"]:
+            failed.append(name)
+
+        mark = "✅" if result["uses_index"] else "⚠️"
+        print(f"{mark} {name:<20} {legacy_ms:>9.2f} ms → {indexed_ms:>8.2f} ms  (×{result['speedup']})")
+        print(f"    之前: {' | '.join(result['before_plan'])}")
+        print(f"    之後: {' | '.join(plan)}")
+
+    conn.close()
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"rows": args.rows, "seed": args.seed, "build": build, "sample": sample,
+                       "queries": results}, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {json_path}")
+
+    if failed:
+        print(f"⚠️ 沒有用到索引: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# receipt_corpus.py - 合成台灣發票文字語料
+"""以 _simulate_ocr 的三種發票版型為基礎，用固定亂數種子產生大量發票文字與正確答案：
+
+* 民國年日期（114年06月16日 / 114/06/16 / 114.6.16）
+* 檢查碼正確的賣方統編、兩碼英文+8碼數字的發票號碼（偶爾有連字號）
+* 各分類的商家與品項，數量、單價、營業稅、總計
+* OCR 常見的誤認（0/O、1/l、5/S、8/B、全形冒號、形近中文字、多餘空白、漏行）
+
+同一組 (count, seed, noise) 每次產生的內容完全相同，可以直接比較不同版本的結果。
+
+用法（被 bench_corpus.py 匯入，也可以單獨印出樣本）：
+    python benchmarks/receipt_corpus.py --receipts 3 --noise 0.05
+"""
+import argparse
+import os
+import random
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from receipt_parser import valid_tax_id  # noqa: E402
+
+# (商家, 預期分類, 品項)；分類名稱同 main.load_categories 的預設分類
+MERCHANTS = [
+    ('來麵屋', '餐費', [('拉麵', 120, 260), ('沾麵', 150, 280), ('煎餃', 60, 90)]),
+    ('星巴克咖啡', '餐費', [('美式咖啡', 85, 150), ('那堤', 110, 170), ('蛋糕', 85, 140)]),
+    ('麥當勞', '餐費', [('大麥克餐', 140, 190), ('薯條', 45, 70), ('可樂', 30, 50)]),
+    ('鼎泰豐餐廳', '餐費', [('小籠包', 250, 300), ('炒飯', 220, 280), ('酸辣湯', 90, 140)]),
+    ('85度C', '餐費', [('海岩咖啡', 55, 75), ('麵包', 35, 65)]),
+    ('台灣中油加油站', '交通費', [('95無鉛汽油', 800, 1800), ('98無鉛汽油', 900, 2000)]),
+    ('台灣高鐵', '交通費', [('高鐵車票', 700, 1530)]),
+    ('嘉聯益停車場', '交通費', [('停車費', 40, 300)]),
+    ('誠品書店', '辦公用品', [('筆記本', 80, 250), ('原子筆', 25, 60), ('資料夾', 30, 90)]),
+    ('金石堂書店', '辦公用品', [('文具組', 150, 400), ('影印紙', 120, 250)]),
+    ('燦坤3C', '設備採購', [('螢幕', 3990, 8990), ('鍵盤', 590, 2490), ('滑鼠', 290, 1290)]),
+    ('全國電子', '設備採購', [('電腦', 15900, 32900), ('螢幕', 3990, 7990)]),
+    ('家樂福', '購物', [('衛生紙', 199, 399), ('洗衣精', 159, 299), ('礦泉水', 79, 129)]),
+    ('全聯福利中心', '購物', [('鮮奶', 85, 99), ('吐司', 39, 59), ('雞蛋', 69, 109)]),
+    ('好市多', '購物', [('堅果', 499, 899), ('牛排', 899, 1599)]),
+    ('康是美', '醫療費用', [('口罩', 99, 199), ('維他命', 299, 699)]),
+    ('大樹藥局', '醫療費用', [('感冒藥', 120, 380), ('OK繃', 35, 80)]),
+    ('屈臣氏', '醫療費用', [('隱形眼鏡藥水', 199, 399), ('面膜', 99, 299)]),
+    ('威秀影城', '娛樂費用', [('電影票', 300, 380), ('爆米花', 80, 150)]),
+    ('中華電信', '雜費', [('網路月租費', 599, 1399), ('電話費', 199, 699)]),
+]
+
+# OCR 誤認表：字元 → 可能被辨識成的字元
+CONFUSIONS = {
+    '0': 'OoD', 'O': '0', '1': 'lI|', 'l': '1', '5': 'S', '8': 'B', '2': 'Z', '6': 'b',
+    ':': '：;', '：': ':', '總': '縂', '計': '訃', '年': '羊', '月': '目', '日': '曰', '編': '緼', '統': '絖',
+}
+
+
+def _tax_id(rng: random.Random) -> str:
+    while True:
+        tax_id = f"{rng.randint(10000000, 99999999)}"
+        if valid_tax_id(tax_id):
+            return tax_id
+
+
+def _invoice_number(rng: random.Random) -> str:
+    letters = ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ') for _ in range(2))
+    return f"{letters}{rng.randint(0, 99999999):08d}"
+
+
+def _roc_date(rng: random.Random):
+    """(印在發票上的民國日期, 西元 YYYY-MM-DD)"""
+    year = rng.randint(112, 114)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    printed = rng.choice([
+        f"{year}年{month:02d}月{day:02d}日",
+        f"{year}/{month:02d}/{day:02d}",
+        f"{year}.{month}.{day}",
+    ])
+    return printed, f"{year + 1911}-{month:02d}-{day:02d}"
+
+
+def _receipt(rng: random.Random) -> Dict:
+    """一張乾淨的發票文字與正確答案"""
+    merchant, category, catalog = rng.choice(MERCHANTS)
+    invoice_number = _invoice_number(rng)
+    printed_date, date = _roc_date(rng)
+    tax_id = _tax_id(rng)
+    colon = rng.choice([': ', '：', ':'])
+
+    lines_by_item = rng.sample(catalog, rng.randint(1, len(catalog)))
+    items = [(name, rng.randint(1, 3), rng.randint(low, high)) for name, low, high in lines_by_item]
+    amount = sum(quantity * price for _, quantity, price in items)
+    tax_amount = round(amount * 0.05)
+
+    header = rng.choice(['統一發票', '電子發票', '電子發票證明聯'])
+    printed_invoice = f"{invoice_number[:2]}-{invoice_number[2:]}" if rng.random() < 0.2 else invoice_number
+    lines = [header, printed_invoice, printed_date, merchant, f"統編{colon}{tax_id}"]
+
+    template = rng.choice(['detail', 'goods', 'list'])
+    if template == 'detail':
+        # 版型一：品項/數量/單價分行，印出營業稅
+        for name, quantity, price in items:
+            lines += [f"品項{colon}{name}", f"數量{colon}{quantity}", f"單價{colon}{price}"]
+        lines += [f"營業稅{colon}{tax_amount}", f"總計{colon}{amount}"]
+    elif template == 'goods':
+        # 版型二：商品/數量/金額，含稅總計
+        for name, quantity, price in items:
+            lines += [f"商品{colon}{name}", f"數量{colon}{quantity}", f"金額{colon}{quantity * price}"]
+        lines += [f"含稅總計{colon}{amount}"]
+    else:
+        # 版型三：品名: 小計 一行一項
+        for name, quantity, price in items:
+            lines.append(f"{name}{colon}{quantity * price}" if quantity == 1 else
+                         f"{name} x{quantity}{colon}{quantity * price}")
+        lines.append(rng.choice([f"總計{colon}{amount}", f"合計 ${amount}", f"總計 NT$ {amount}"]))
+
+    return {
+        'template': template,
+        'text': '\n'.join(lines),
+        'truth': {
+            'invoice_number': invoice_number,
+            'date': date,
+            'merchant': merchant,
+            'amount': amount,
+            'tax_amount': tax_amount,
+            'supplier_tax_id': tax_id,
+            'category': category,
+        }
+    }
+
+
+def _add_noise(text: str, noise: float, rng: random.Random) -> str:
+    """逐字套用 OCR 誤認；每行另有 noise/4 的機率整行漏掉、noise 的機率多一個空白"""
+    if noise <= 0:
+        return text
+
+    lines = []
+    for line in text.split('\n'):
+        if lines and rng.random() < noise / 4:
+            continue
+        chars = []
+        for char in line:
+            if char in CONFUSIONS and rng.random() < noise:
+                char = rng.choice(CONFUSIONS[char])
+            chars.append(char)
+            if rng.random() < noise / 10:
+                chars.append(' ')
+        lines.append(''.join(chars))
+
+    return '\n'.join(lines)
+
+
+def generate(count: int, seed: int = 42, noise: float = 0.0) -> List[Dict]:
+    """產生 count 張發票：[{'template', 'text', 'truth': {...}}]，相同參數結果相同"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        receipt = _receipt(rng)
+        receipt['text'] = _add_noise(receipt['text'], noise, rng) + '\n'
+        corpus.append(receipt)
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成台灣發票文字語料")
+    parser.add_argument("--receipts", type=int, default=3, help="張數")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--noise", type=float, default=0.0, help="OCR誤認機率（每字）")
+    args = parser.parse_args()
+
+    for receipt in generate(args.receipts, args.seed, args.noise):
+        print(f"--- {receipt['template']} {receipt['truth']}")
+        print(receipt['text'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# category_matcher.py - 分類關鍵字比對（Aho-Corasick）
+"""把所有分類的關鍵字建成一個 Aho-Corasick 自動機，一次線性掃描
+「商家名稱 + 發票內容」就知道每個關鍵字（與關鍵字拆出的片段）出現在哪裡。
+
+計分與舊版 _smart_categorize 相同（每個關鍵字只取最高的一項）：
+    出現在商家名稱 10 分 / 出現在發票內容 3 分 / 關鍵字以空白拆開、長度>2 的片段出現 1 分
+分數相同時取先出現的分類，全部 0 分回傳預設分類。
+
+自動機只在分類改變時重建（CategoryMatcher 本身不可變）。
+"""
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+DEFAULT_CATEGORY = '雜費'
+
+MERCHANT_SCORE = 10
+TEXT_SCORE = 3
+PARTIAL_SCORE = 1
+
+
+class CategoryMatcher:
+    """由 {分類: [關鍵字, ...]} 建立的多關鍵字比對器"""
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = categories
+
+        self._patterns: List[str] = []
+        self._index: Dict[str, int] = {}
+
+        # 關鍵字/片段編號 → 受影響的 (分類序號, 關鍵字序號)，計分時只看命中的關鍵字
+        self._keyword_refs: Dict[int, List[Tuple[int, int]]] = {}
+        self._part_refs: Dict[int, List[Tuple[int, int]]] = {}
+
+        # 空字串關鍵字永遠算商家命中（舊版 '' in merchant 為真），直接當作分類的基本分
+        self._names = list(categories)
+        self._base_scores = [0] * len(self._names)
+
+        for category_index, keywords in enumerate(categories.values()):
+            for keyword_index, keyword in enumerate(keywords):
+                keyword_lower = keyword.lower()
+                slot = (category_index, keyword_index)
+                if not keyword_lower:
+                    self._base_scores[category_index] += MERCHANT_SCORE
+                    continue
+
+                self._keyword_refs.setdefault(self._add(keyword_lower), []).append(slot)
+                for part in keyword_lower.split():
+                    if len(part) > 2:
+                        self._part_refs.setdefault(self._add(part), []).append(slot)
+
+        self._build()
+
+    def _add(self, pattern: str) -> int:
+        if pattern not in self._index:
+            self._index[pattern] = len(self._patterns)
+            self._patterns.append(pattern)
+        return self._index[pattern]
+
+    def _build(self):
+        """建立 trie、失敗連結與輸出表（每個狀態結束的關鍵字編號）"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self._patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # 廣度優先計算失敗連結，並把失敗狀態的輸出併進來
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, text: str, merchant_length: int) -> Tuple[Set[int], Set[int]]:
+        """單次掃描，回傳 (出現在前 merchant_length 個字的關鍵字, 出現在全文的關鍵字)"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        in_merchant = set()
+        in_text = set()
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for pattern_id in output[state]:
+                in_text.add(pattern_id)
+                if position < merchant_length:
+                    in_merchant.add(pattern_id)
+
+        return in_merchant, in_text
+
+    def categorize(self, merchant: str, full_text: str) -> str:
+        """依關鍵字命中計分，回傳分數最高的分類"""
+        if not merchant:
+            return DEFAULT_CATEGORY
+
+        merchant_lower = merchant.lower()
+        in_merchant, in_text = self.scan(f"{merchant} {full_text}".lower(), len(merchant_lower))
+
+        # 每個關鍵字只取最高的一項：商家 10 > 內容 3 > 片段 1
+        keyword_scores = {}
+        for pattern_id in in_text:
+            for slot in self._part_refs.get(pattern_id, ()):
+                keyword_scores.setdefault(slot, PARTIAL_SCORE)
+            for slot in self._keyword_refs.get(pattern_id, ()):
+                keyword_scores[slot] = MERCHANT_SCORE if pattern_id in in_merchant else TEXT_SCORE
+
+        scores = list(self._base_scores)
+        for (category_index, _), score in keyword_scores.items():
+            scores[category_index] += score
+
+        # 分數相同取先出現的分類
+        best_index = max(range(len(scores)), key=scores.__getitem__, default=None)
+        if best_index is None or scores[best_index] <= 0:
+            return DEFAULT_CATEGORY
+
+        return self._names[best_index]
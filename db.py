@@ -0,0 +1,137 @@
+# db.py - SQLite 連線池
+"""所有端點共用的 receipts.db 連線：
+
+* 連線用完放回池子重複使用（不用每個請求都重新開檔、重讀 schema）；
+  sqlite3 的 statement cache 是跟著連線的，連線常駐後同一句 SQL 只編譯一次
+* WAL 模式：報表讀取不會被上傳寫入擋住，寫入之間也不互相擋讀取
+* synchronous=NORMAL（WAL 下不會損毀，只可能遺失最後一筆未 checkpoint 的交易）
+* 較大的 page cache 與 mmap，加上 busy_timeout，同時寫入時排隊等待而不是直接 "database is locked"
+
+用法與 sqlite3.connect 相同，close() 會把連線還回池子（還回前把沒 commit 的交易 rollback）：
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    ...
+    conn.commit()
+    conn.close()
+
+池子以借出/歸還管理而不是每個執行緒一條，因為 async 端點在同一個事件迴圈執行緒上交錯執行，
+共用一條連線會讓兩個請求的交易混在一起。
+"""
+import os
+import queue
+import sqlite3
+import threading
+from typing import Dict
+
+DB_PATH = os.environ.get("RECEIPTS_DB", "receipts.db")
+
+# 閒置連線上限（超過的連線歸還時直接關閉）
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 32768))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+
+# 每條連線快取的已編譯 SQL 數
+CACHED_STATEMENTS = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+_idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+_lock = threading.Lock()
+_stats = {"opened": 0, "reused": 0, "closed": 0}
+
+
+class PooledConnection:
+    """sqlite3.Connection 的代理：close() 歸還連線池，其餘屬性直接轉給原本的連線"""
+
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            _release(conn)
+
+
+def connect() -> PooledConnection:
+    """從池子借一條連線（沒有閒置的就開新的）"""
+    try:
+        conn = _idle.get_nowait()
+        with _lock:
+            _stats["reused"] += 1
+    except queue.Empty:
+        conn = _open()
+
+    return PooledConnection(conn)
+
+
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    with _lock:
+        _stats["opened"] += 1
+    return conn
+
+
+def _release(conn: sqlite3.Connection):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        _discard(conn)
+        return
+
+    if _idle.qsize() >= POOL_SIZE:
+        _discard(conn)
+    else:
+        _idle.put(conn)
+
+
+def _discard(conn: sqlite3.Connection):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+    with _lock:
+        _stats["closed"] += 1
+
+
+def close_all():
+    """關閉所有閒置連線（關機時呼叫）"""
+    while True:
+        try:
+            _discard(_idle.get_nowait())
+        except queue.Empty:
+            return
+
+
+def stats() -> Dict:
+    with _lock:
+        counts = dict(_stats)
+    return {"path": DB_PATH, "idle": _idle.qsize(), "pool_size": POOL_SIZE, **counts}
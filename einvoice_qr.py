@@ -0,0 +1,152 @@
+# einvoice_qr.py - 電子發票 QR Code 快速辨識
+"""電子發票證明聯左右兩個 QR Code 的解碼與欄位解析
+
+左邊 QR Code 前 77 碼是固定格式：
+    發票字軌(10) 開立日期(7, 民國yyyMMdd) 隨機碼(4) 銷售額(8, 16進位)
+    總計額(8, 16進位) 買方統編(8) 賣方統編(8) 加密驗證資訊(24)
+之後以冒號分隔：營業人自行使用區(10) : 品項筆數 : 總品項筆數 : 中文編碼 : 品名:數量:單價 ...
+右邊 QR Code 以 "**" 開頭，接續剩下的 品名:數量:單價。
+
+只要能完整取得字軌、日期、總計額與賣方統編，就不需要跑 EasyOCR。
+"""
+import base64
+import re
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+HEADER_LENGTH = 77
+
+# 偵測用的最大長邊：QR Code 在發票上很小，縮太多會解不出來
+MAX_DETECT_SIZE = 2000
+
+_INVOICE_NUMBER = re.compile(r'[A-Z]{2}\d{8}')
+_TAX_ID = re.compile(r'\d{8}')
+_HEX_AMOUNT = re.compile(r'[0-9A-Fa-f]{8}')
+
+
+def decode_qr_codes(image_data: bytes) -> List[str]:
+    """解出圖片中所有 QR Code 的字串（解不出來回傳空陣列）"""
+    gray = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return []
+
+    scale = MAX_DETECT_SIZE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    detector = cv2.QRCodeDetector()
+    try:
+        found, texts, _, _ = detector.detectAndDecodeMulti(gray)
+    except cv2.error:
+        return []
+
+    if not found:
+        return []
+
+    return [t for t in texts if t]
+
+
+def parse_einvoice(texts: List[str]) -> Optional[Dict]:
+    """解析左右 QR Code 內容，找不到左邊 QR Code 時回傳 None"""
+    left = next((t for t in texts if len(t) >= HEADER_LENGTH and _INVOICE_NUMBER.match(t)), None)
+    if left is None:
+        return None
+
+    header = left[:HEADER_LENGTH]
+    fields = {
+        'invoice_number': header[0:10],
+        'date': _roc_date(header[10:17]),
+        'random_code': header[17:21],
+        'sales_amount': _hex_amount(header[21:29]),
+        'amount': _hex_amount(header[29:37]),
+        'buyer_tax_id': header[37:45] if _TAX_ID.fullmatch(header[37:45]) else '',
+        'seller_tax_id': header[45:53] if _TAX_ID.fullmatch(header[45:53]) else '',
+        'items': []
+    }
+
+    if fields['amount'] is not None and fields['sales_amount'] is not None:
+        fields['tax_amount'] = max(0, fields['amount'] - fields['sales_amount'])
+    else:
+        fields['tax_amount'] = 0
+
+    # 明細：左邊 QR Code 冒號後的品項 + 右邊 QR Code（"**" 開頭）
+    parts = left[HEADER_LENGTH:].split(':')
+    encoding = parts[4] if len(parts) > 4 else '1'
+    detail = parts[5:]
+    for right in texts:
+        if right.startswith('**'):
+            detail += right[2:].split(':')
+
+    fields['items'] = _parse_items(detail, encoding)
+
+    return fields
+
+
+def is_complete(fields: Optional[Dict]) -> bool:
+    """記帳需要的欄位都有了才算完整（否則交給 OCR）"""
+    return bool(
+        fields
+        and fields['date']
+        and fields['amount']
+        and fields['sales_amount'] is not None
+        and fields['seller_tax_id']
+    )
+
+
+def scan(image_data: bytes) -> Dict:
+    """解碼 + 解析，回傳 {'status': 'complete'|'partial'|'none', 'fields': ..., 'decode_ms': ...}"""
+    started = time.perf_counter()
+    try:
+        texts = decode_qr_codes(image_data)
+    except Exception as e:
+        print(f"⚠️ QR Code 解碼失敗: {e}")
+        texts = []
+    decode_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    fields = parse_einvoice(texts) if texts else None
+
+    if is_complete(fields):
+        status = 'complete'
+    elif texts:
+        status = 'partial'
+    else:
+        status = 'none'
+
+    return {'status': status, 'fields': fields, 'decode_ms': decode_ms}
+
+
+def _roc_date(value: str) -> str:
+    """民國 yyyMMdd → YYYY-MM-DD，格式不對回傳空字串"""
+    if not re.fullmatch(r'\d{7}', value):
+        return ''
+    try:
+        return date(int(value[:3]) + 1911, int(value[3:5]), int(value[5:7])).isoformat()
+    except ValueError:
+        return ''
+
+
+def _hex_amount(value: str) -> Optional[int]:
+    if not _HEX_AMOUNT.fullmatch(value):
+        return None
+    return int(value, 16)
+
+
+def _parse_items(detail: List[str], encoding: str) -> List[Dict]:
+    """品名:數量:單價 三個一組；編碼 2 為 Base64"""
+    items = []
+    for i in range(0, len(detail) - 2, 3):
+        name, quantity, price = detail[i:i + 3]
+        if encoding == '2':
+            try:
+                name = base64.b64decode(name).decode('utf-8')
+            except Exception:
+                pass
+        try:
+            items.append({'name': name.strip(), 'quantity': float(quantity), 'price': float(price)})
+        except ValueError:
+            break
+    return items
@@ -1,584 +1,719 @@
 # main.py - 免費AI整合版本
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from pydantic import BaseModel
 import sqlite3
 import uuid
 import os
-import re
-from datetime import datetime
-from typing import Dict, List
-import tempfile
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import base64
 import json
+import hashlib
+import zlib
 
 # 免費OCR相關導入
-import easyocr
 from PIL import Image
 import numpy as np
+from category_matcher import CategoryMatcher
+import db
+import einvoice_qr
+import metrics
+import migrations
+import ocr_worker
+import receipt_layout
+import receipt_parser
 
 # 建立必要的資料夾
 os.makedirs("uploads", exist_ok=True)
+os.makedirs("uploads/jobs", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
 app = FastAPI(title="暴力記帳系統", description="拍照→辨識→記帳，就這麼簡單！")
 
 
+def month_period(year: int, month: int) -> str:
+    """YYYY-MM（receipt_monthly_agg 的 period）"""
+    if not 1 <= month <= 12:
+        raise ValueError(f"月份必須是 1~12: {month}")
+    return f"{year:04d}-{month:02d}"
+
+
 # 資料庫初始化函式
 def init_database():
-    """初始化完整的小型公司記帳資料庫"""
+    """套用尚未執行的 schema 遷移（已是最新版時只讀一次 PRAGMA user_version）"""
     try:
-        conn = sqlite3.connect('receipts.db')
-        cursor = conn.cursor()
+        conn = db.connect()
+        try:
+            applied = migrations.migrate(conn)
+        finally:
+            conn.close()
 
-        print("🏗️ 建立小型公司記帳資料庫...")
+        if applied:
+            print(f"🎉 資料庫已遷移到版本 {applied[-1][0]}（套用 {len(applied)} 個遷移）")
+        return True
 
-        # 1. 公司基本資料表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS company (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                tax_id TEXT UNIQUE,
-                address TEXT,
-                phone TEXT,
-                email TEXT,
-                website TEXT,
-                industry TEXT,
-                founded_date TEXT,
-                capital REAL DEFAULT 0,
-                fiscal_year_start INTEGER DEFAULT 1,
-                accounting_method TEXT DEFAULT 'accrual',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 2. 員工管理表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id TEXT UNIQUE,
-                name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                department TEXT,
-                position TEXT,
-                salary REAL DEFAULT 0,
-                start_date TEXT,
-                end_date TEXT,
-                status TEXT DEFAULT 'active',
-                expense_limit REAL DEFAULT 5000,
-                can_approve BOOLEAN DEFAULT 0,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 3. 部門/費用中心表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS departments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                manager_id INTEGER REFERENCES employees(id),
-                budget_monthly REAL DEFAULT 0,
-                budget_annual REAL DEFAULT 0,
-                description TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 4. 專案管理表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                client_name TEXT,
-                start_date TEXT,
-                end_date TEXT,
-                budget REAL DEFAULT 0,
-                actual_cost REAL DEFAULT 0,
-                status TEXT DEFAULT 'active',
-                manager_id INTEGER REFERENCES employees(id),
-                description TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 5. 供應商管理表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suppliers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE,
-                name TEXT NOT NULL,
-                tax_id TEXT,
-                contact_person TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                payment_terms TEXT DEFAULT 'NET30',
-                credit_limit REAL DEFAULT 0,
-                bank_account TEXT,
-                bank_name TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 6. 客戶管理表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE,
-                name TEXT NOT NULL,
-                tax_id TEXT,
-                contact_person TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                payment_terms TEXT DEFAULT 'NET30',
-                credit_limit REAL DEFAULT 0,
-                status TEXT DEFAULT 'active',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 7. 會計科目表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chart_of_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_code TEXT UNIQUE NOT NULL,
-                account_name TEXT NOT NULL,
-                account_type TEXT NOT NULL,
-                parent_code TEXT,
-                level INTEGER DEFAULT 1,
-                is_active BOOLEAN DEFAULT 1,
-                description TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 8. 分類表（支出分類）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                keywords TEXT,
-                account_code TEXT REFERENCES chart_of_accounts(account_code),
-                tax_deductible BOOLEAN DEFAULT 1,
-                requires_receipt BOOLEAN DEFAULT 1,
-                requires_approval BOOLEAN DEFAULT 0,
-                approval_limit REAL DEFAULT 0,
-                description TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 9. 發票記錄表（主要交易表）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS receipts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                receipt_type TEXT DEFAULT 'expense',
-                photo_path TEXT,
-                invoice_number TEXT,
-                date TEXT NOT NULL,
-                due_date TEXT,
-
-                -- 商家/供應商資訊
-                merchant TEXT,
-                supplier_id INTEGER REFERENCES suppliers(id),
-                supplier_tax_id TEXT,
-
-                -- 金額資訊
-                amount REAL DEFAULT 0,
-                tax_amount REAL DEFAULT 0,
-                tax_rate REAL DEFAULT 0.05,
-                net_amount REAL DEFAULT 0,
-
-                -- 分類和會計
-                category TEXT DEFAULT '雜費',
-                account_code TEXT REFERENCES chart_of_accounts(account_code),
-                department_id INTEGER REFERENCES departments(id),
-                project_id INTEGER REFERENCES projects(id),
-
-                -- 審核狀態
-                status TEXT DEFAULT 'pending',
-                submitted_by INTEGER REFERENCES employees(id),
-                approved_by INTEGER REFERENCES employees(id),
-                approved_at TEXT,
-
-                -- AI 和處理資訊
-                description TEXT,
-                notes TEXT,
-                is_business BOOLEAN DEFAULT 1,
-                is_recurring BOOLEAN DEFAULT 0,
-                recurring_frequency TEXT,
-                ocr_confidence REAL DEFAULT 0,
-
-                -- 付款資訊
-                payment_method TEXT,
-                payment_status TEXT DEFAULT 'unpaid',
-                paid_date TEXT,
-                paid_amount REAL DEFAULT 0,
-
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 10. 銀行帳戶表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bank_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_name TEXT NOT NULL,
-                bank_name TEXT NOT NULL,
-                account_number TEXT,
-                account_type TEXT DEFAULT 'checking',
-                currency TEXT DEFAULT 'TWD',
-                opening_balance REAL DEFAULT 0,
-                current_balance REAL DEFAULT 0,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 11. 銀行交易記錄表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bank_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bank_account_id INTEGER REFERENCES bank_accounts(id),
-                transaction_date TEXT NOT NULL,
-                description TEXT,
-                reference_number TEXT,
-                debit_amount REAL DEFAULT 0,
-                credit_amount REAL DEFAULT 0,
-                balance REAL DEFAULT 0,
-                category TEXT,
-                receipt_id INTEGER REFERENCES receipts(id),
-                reconciled BOOLEAN DEFAULT 0,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 12. 預算管理表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS budgets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                budget_year INTEGER NOT NULL,
-                budget_month INTEGER,
-                department_id INTEGER REFERENCES departments(id),
-                project_id INTEGER REFERENCES projects(id),
-                category_id INTEGER REFERENCES categories(id),
-                budgeted_amount REAL DEFAULT 0,
-                actual_amount REAL DEFAULT 0,
-                variance_amount REAL DEFAULT 0,
-                variance_percentage REAL DEFAULT 0,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 13. 報銷申請表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expense_claims (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                claim_number TEXT UNIQUE,
-                employee_id INTEGER REFERENCES employees(id),
-                claim_date TEXT NOT NULL,
-                total_amount REAL DEFAULT 0,
-                status TEXT DEFAULT 'draft',
-                submitted_date TEXT,
-                approved_date TEXT,
-                approved_by INTEGER REFERENCES employees(id),
-                paid_date TEXT,
-                purpose TEXT,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 14. 報銷明細表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expense_claim_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                claim_id INTEGER REFERENCES expense_claims(id),
-                receipt_id INTEGER REFERENCES receipts(id),
-                expense_date TEXT NOT NULL,
-                description TEXT,
-                amount REAL DEFAULT 0,
-                category TEXT,
-                billable_to_client BOOLEAN DEFAULT 0,
-                client_id INTEGER REFERENCES customers(id),
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 15. 發票開立表（銷項）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices_issued (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_number TEXT UNIQUE NOT NULL,
-                customer_id INTEGER REFERENCES customers(id),
-                invoice_date TEXT NOT NULL,
-                due_date TEXT,
-                subtotal REAL DEFAULT 0,
-                tax_amount REAL DEFAULT 0,
-                total_amount REAL DEFAULT 0,
-                status TEXT DEFAULT 'draft',
-                paid_amount REAL DEFAULT 0,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 16. 稅務記錄表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tax_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tax_year INTEGER NOT NULL,
-                tax_quarter INTEGER,
-                tax_type TEXT NOT NULL,
-                taxable_amount REAL DEFAULT 0,
-                tax_amount REAL DEFAULT 0,
-                tax_rate REAL DEFAULT 0,
-                status TEXT DEFAULT 'calculated',
-                filed_date TEXT,
-                paid_date TEXT,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        print("📋 建立資料表完成，開始插入預設資料...")
-
-        # 檢查並添加缺失的欄位（向後相容）
-        cursor.execute("PRAGMA table_info(receipts)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        missing_columns = [
-            ('ocr_confidence', 'REAL DEFAULT 0'),
-            ('department_id', 'INTEGER'),
-            ('project_id', 'INTEGER'),
-            ('supplier_id', 'INTEGER'),
-            ('status', 'TEXT DEFAULT "pending"'),
-            ('payment_status', 'TEXT DEFAULT "unpaid"')
-        ]
+    except Exception as e:
+        print(f"❌ 資料庫初始化失敗: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
 
-        for column_name, column_def in missing_columns:
-            if column_name not in columns:
-                cursor.execute(f'ALTER TABLE receipts ADD COLUMN {column_name} {column_def}')
-                print(f"✅ 添加 {column_name} 欄位")
-
-        # 插入預設會計科目
-        cursor.execute('SELECT COUNT(*) FROM chart_of_accounts')
-        if cursor.fetchone()[0] == 0:
-            accounts = [
-                # 資產類
-                ('1000', '流動資產', 'Assets', None, 1),
-                ('1100', '現金及約當現金', 'Assets', '1000', 2),
-                ('1110', '庫存現金', 'Assets', '1100', 3),
-                ('1120', '銀行存款', 'Assets', '1100', 3),
-                ('1200', '應收帳款', 'Assets', '1000', 2),
-                ('1300', '存貨', 'Assets', '1000', 2),
-                ('1500', '固定資產', 'Assets', None, 1),
-                ('1510', '設備', 'Assets', '1500', 2),
-                ('1520', '累計折舊', 'Assets', '1500', 2),
-
-                # 負債類
-                ('2000', '流動負債', 'Liabilities', None, 1),
-                ('2100', '應付帳款', 'Liabilities', '2000', 2),
-                ('2200', '應付薪資', 'Liabilities', '2000', 2),
-                ('2300', '應付稅款', 'Liabilities', '2000', 2),
-
-                # 權益類
-                ('3000', '業主權益', 'Equity', None, 1),
-                ('3100', '股本', 'Equity', '3000', 2),
-                ('3200', '保留盈餘', 'Equity', '3000', 2),
-
-                # 收入類
-                ('4000', '營業收入', 'Revenue', None, 1),
-                ('4100', '銷貨收入', 'Revenue', '4000', 2),
-                ('4200', '服務收入', 'Revenue', '4000', 2),
-
-                # 費用類
-                ('5000', '營業費用', 'Expenses', None, 1),
-                ('5100', '銷貨成本', 'Expenses', '5000', 2),
-                ('5200', '薪資費用', 'Expenses', '5000', 2),
-                ('5300', '租金費用', 'Expenses', '5000', 2),
-                ('5400', '辦公費用', 'Expenses', '5000', 2),
-                ('5500', '差旅費', 'Expenses', '5000', 2),
-                ('5600', '餐費', 'Expenses', '5000', 2),
-                ('5700', '交通費', 'Expenses', '5000', 2),
-                ('5800', '軟體費用', 'Expenses', '5000', 2),
-                ('5900', '雜項費用', 'Expenses', '5000', 2),
-            ]
 
-            for code, name, acc_type, parent, level in accounts:
-                cursor.execute('''
-                    INSERT INTO chart_of_accounts (account_code, account_name, account_type, parent_code, level)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (code, name, acc_type, parent, level))
-
-            print("✅ 會計科目建立完成")
-
-        # 插入預設分類（連結會計科目）
-        cursor.execute('SELECT COUNT(*) FROM categories')
-        if cursor.fetchone()[0] == 0:
-            categories = [
-                ('餐費', '餐廳,小吃,咖啡,便當,火鍋,燒烤,飲料,麥當勞,肯德基,星巴克,85度C', '5600', True, True, False,
-                 1000),
-                ('交通費', '加油,停車,高鐵,計程車,捷運,公車,機票,台鐵,客運,Uber', '5700', True, True, False, 1000),
-                ('辦公用品', '文具,紙張,印表機,電腦,筆,資料夾,誠品,金石堂', '5400', True, True, False, 2000),
-                ('軟體服務', '訂閱,SaaS,Office,Adobe,Google,AWS,Microsoft,Apple', '5800', True, True, True, 5000),
-                ('設備採購', '電腦,螢幕,鍵盤,滑鼠,椅子,桌子,3C,燦坤,全國電子', '1510', True, True, True, 10000),
-                ('購物', '百貨,量販,家樂福,全聯,好市多,大潤發,購物', '5900', True, True, False, 3000),
-                ('醫療費用', '藥局,醫院,診所,健保,醫療,康是美,屈臣氏', '5900', True, True, False, 2000),
-                ('娛樂費用', '電影,KTV,遊戲,娛樂,威秀,國賓', '5900', False, True, False, 1000),
-                ('租金水電', '水電,電話,網路,房租,租金', '5300', True, True, False, 0),
-                ('薪資費用', '薪水,薪資,獎金,勞保,健保', '5200', True, False, True, 0),
-                ('差旅費用', '出差,住宿,飯店,旅館', '5500', True, True, True, 5000),
-                ('銀行手續費', '銀行,手續費,匯款,轉帳', '5900', True, False, False, 0),
-                ('雜項費用', '清潔,維修,郵資,快遞', '5900', True, True, False, 1000)
-            ]
+# 啟動時初始化資料庫
+init_database()
+
+
+# 移除這些重度導入
+# import easyocr
+# import numpy as np
+
+class OCRQueueFullError(Exception):
+    """OCR 推論佇列已滿"""
+
+
+class ModelLoadingError(Exception):
+    """EasyOCR 模型仍在背景載入中"""
+
+
+class OCRExecutor:
+    """專用OCR推論執行器：固定數量的推論槽 + 有界等待佇列，避免阻塞事件迴圈"""
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 8, pool=None):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = pool or ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ocr')
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+        # 統計資料（只在事件迴圈執行緒中更新，不需要鎖）
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    async def run(self, func, *args):
+        """把同步的推論工作丟到執行緒池，佇列滿時直接拒絕"""
+        if self.waiting >= self.max_queue and self.running >= self.max_workers:
+            self.rejected += 1
+            raise OCRQueueFullError(f"OCR佇列已滿（等待中 {self.waiting} 件），請稍後再試")
+
+        enqueued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - enqueued_at
+        self.last_wait = wait
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def warm_up_workers(self, timeout: float = 600) -> List[Dict]:
+        """（載入執行緒中呼叫）等每個工作程序都載入並暖機完成，回傳各程序的載入耗時"""
+        reports = {}
+        deadline = time.time() + timeout
+
+        while len(reports) < self.max_workers and time.time() < deadline:
+            futures = [self._pool.submit(ocr_worker.load_report, 0.2) for _ in range(self.max_workers)]
+            for future in futures:
+                report = future.result(timeout=max(1, deadline - time.time()))
+                reports[report['pid']] = report
+
+        return list(reports.values())
+
+    def shutdown(self):
+        """關閉執行緒池/程序池"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        """佇列深度與等待時間"""
+        return {
+            "backend": OCR_BACKEND,
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "last_wait_ms": round(self.last_wait * 1000, 1),
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 1) if self.completed else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+
+# OCR推論後端：thread（單一Reader）或 process（每個工作程序一個Reader）
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "thread")
+
+
+def create_ocr_executor() -> OCRExecutor:
+    """依設定建立OCR推論執行器（可用環境變數調整大小）"""
+    max_queue = int(os.environ.get("OCR_QUEUE_SIZE", 8))
+
+    if OCR_BACKEND == "process":
+        processes, torch_threads = ocr_worker.default_pool_size()
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=ocr_worker.init_reader,
+            initargs=(torch_threads, True)
+        )
+        print(f"🔧 OCR程序池: {processes} 個工作程序 × {torch_threads} 個torch執行緒")
+        return OCRExecutor(max_workers=processes, max_queue=max_queue, pool=pool)
+
+    return OCRExecutor(max_workers=int(os.environ.get("OCR_WORKERS", 1)), max_queue=max_queue)
+
+
+ocr_executor = create_ocr_executor()
+
+# 批次上傳時每次送進 readtext_batched 的圖片數
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", 8))
+
+# 先嘗試電子發票QR Code（QR_FAST_PATH=0 關閉）
+QR_FAST_PATH = os.environ.get("QR_FAST_PATH", "1") != "0"
+
+# LOG_LEVEL=debug 時才逐字串印出辨識結果與完整解析結果
+DEBUG = os.environ.get("LOG_LEVEL", "info").lower() == "debug"
+
+# 監控指標（GET /metrics）：熱路徑上只做計數與耗時，其餘在抓取時讀各元件的 stats
+UPLOADS = metrics.Counter('receipt_uploads_total', '收到的發票圖片張數', ('endpoint',))
+OCR_FAILURES = metrics.Counter('ocr_failures_total', 'EasyOCR 推論失敗次數', ('mode',))
+SIMULATION_FALLBACKS = metrics.Counter('ocr_simulation_fallbacks_total', '改用模擬OCR的張數')
+STAGE_SECONDS = metrics.Histogram('receipt_stage_seconds', '發票處理各階段耗時（秒）', ('stage',))
+DB_SECONDS = metrics.Histogram('db_operation_seconds', '資料庫操作耗時（秒）', ('operation',))
+HTTP_SECONDS = metrics.Histogram('http_request_seconds', 'HTTP 請求耗時（秒）', ('method', 'route', 'status'))
+
+
+def observe_stages(timings: Dict):
+    """把 ocr_timings 的 *_ms 記進各階段耗時"""
+    for key, value in timings.items():
+        if key.endswith('_ms'):
+            STAGE_SECONDS.observe(value / 1000, stage=key[:-3])
+
+
+class OCRCache:
+    """以圖片內容雜湊為鍵的持久化OCR結果快取（SQLite，超過容量淘汰最久未用）"""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content_hash: str) -> Optional[Dict]:
+        """查詢快取，命中時回傳與 _ocr_result 相同格式的結果"""
+        with DB_SECONDS.time(operation='ocr_cache_get'):
+            return self._get(content_hash)
+
+    def _get(self, content_hash: str) -> Optional[Dict]:
+        try:
+            conn = db.connect()
+            try:
+                cursor = conn.cursor()
 
-            for name, keywords, acc_code, deductible, receipt_req, approval_req, approval_limit in categories:
                 cursor.execute('''
-                    INSERT INTO categories 
-                    (name, keywords, account_code, tax_deductible, requires_receipt, requires_approval, approval_limit)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (name, keywords, acc_code, deductible, receipt_req, approval_req, approval_limit))
-
-            print("✅ 支出分類建立完成")
-
-        # 插入預設部門
-        cursor.execute('SELECT COUNT(*) FROM departments')
-        if cursor.fetchone()[0] == 0:
-            departments = [
-                ('ADMIN', '行政管理部', 50000, 600000),
-                ('SALES', '業務部', 80000, 960000),
-                ('TECH', '技術部', 100000, 1200000),
-                ('MKT', '行銷部', 60000, 720000),
-                ('FIN', '財務部', 30000, 360000),
-                ('HR', '人力資源部', 40000, 480000)
-            ]
+                    SELECT text, confidences, boxes FROM ocr_cache
+                    WHERE content_hash = ? AND engine_version = ?
+                ''', (content_hash, ocr_worker.ENGINE_VERSION))
+                row = cursor.fetchone()
+
+                if row:
+                    cursor.execute('''
+                        UPDATE ocr_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+                        WHERE content_hash = ?
+                    ''', (content_hash,))
+                    conn.commit()
+
+            finally:
+                conn.close()
+
+        except Exception as e:
+            print(f"⚠️ OCR快取讀取失敗: {e}")
+            return None
+
+        if not row:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        text, confidences, boxes = row
+        confidences = json.loads(confidences)
+        tokens = list(zip(json.loads(boxes), text.split('\n'), confidences))
+
+        print(f"⚡ OCR快取命中: {content_hash[:12]}")
+
+        return {
+            'text': ''.join(t + '\n' for _, t, _ in tokens),
+            'confidence': sum(confidences) / len(confidences) if confidences else 0,
+            'tokens': tokens,
+            'source': 'ocr_cache'
+        }
+
+    def put(self, content_hash: str, ocr_result: Dict):
+        """寫入快取並淘汰超出容量的舊項目"""
+        with DB_SECONDS.time(operation='ocr_cache_put'):
+            self._put(content_hash, ocr_result)
+
+    def _put(self, content_hash: str, ocr_result: Dict):
+        tokens = ocr_result.get('tokens') or []
+
+        try:
+            conn = db.connect()
+            try:
+                cursor = conn.cursor()
 
-            for code, name, monthly_budget, annual_budget in departments:
                 cursor.execute('''
-                    INSERT INTO departments (code, name, budget_monthly, budget_annual)
-                    VALUES (?, ?, ?, ?)
-                ''', (code, name, monthly_budget, annual_budget))
+                    INSERT OR REPLACE INTO ocr_cache (content_hash, text, confidences, boxes, engine_version)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (
+                    content_hash,
+                    '\n'.join(text for _, text, _ in tokens),
+                    json.dumps([round(conf, 4) for _, _, conf in tokens]),
+                    json.dumps([bbox for bbox, _, _ in tokens]),
+                    ocr_worker.ENGINE_VERSION
+                ))
+
+                cursor.execute('SELECT COUNT(*) FROM ocr_cache')
+                overflow = cursor.fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    cursor.execute('''
+                        DELETE FROM ocr_cache WHERE content_hash IN (
+                            SELECT content_hash FROM ocr_cache ORDER BY last_used_at ASC LIMIT ?
+                        )
+                    ''', (overflow,))
+
+                conn.commit()
+            finally:
+                conn.close()
 
-            print("✅ 部門建立完成")
+        except Exception as e:
+            print(f"⚠️ OCR快取寫入失敗: {e}")
 
-        # 插入預設員工（系統管理員）
-        cursor.execute('SELECT COUNT(*) FROM employees')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-                INSERT INTO employees 
-                (employee_id, name, email, department, position, salary, expense_limit, can_approve, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', ('ADMIN001', '系統管理員', 'admin@company.com', 'ADMIN', '系統管理員', 0, 999999, True, 'active'))
+    def stats(self) -> Dict:
+        """命中率統計"""
+        total = self.hits + self.misses
+        return {
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0
+        }
 
-            print("✅ 系統管理員建立完成")
 
-        # 插入公司基本資料
-        cursor.execute('SELECT COUNT(*) FROM company')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-                INSERT INTO company 
-                (name, tax_id, address, phone, email, industry, capital, fiscal_year_start)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', ('我的公司', '12345678', '台北市信義區', '02-12345678',
-                  'info@mycompany.com', '軟體開發', 1000000, 1))
+ocr_cache = OCRCache(max_entries=int(os.environ.get("OCR_CACHE_MAX_ENTRIES", 5000)))
 
-            print("✅ 公司基本資料建立完成")
 
-        # 插入預設銀行帳戶
-        cursor.execute('SELECT COUNT(*) FROM bank_accounts')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-                INSERT INTO bank_accounts 
-                (account_name, bank_name, account_number, account_type, opening_balance, current_balance)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', ('公司往來帳戶', '第一銀行', '123-456-789012', 'checking', 1000000, 1000000))
+class CategoryCache:
+    """分類關鍵字快取：以 app_meta.categories_version（由觸發器維護）判斷是否需要重建自動機
 
-            print("✅ 銀行帳戶建立完成")
+    分類、版本與自動機放在同一個 tuple 裡，重建完成後一次換掉參照，
+    進行中的分類計算繼續用舊的自動機，不需要加鎖也不會看到一半的狀態。
+    請求路徑上不查資料庫：每 ttl 秒最多在背景執行緒讀一次版本；本程序的分類端點寫入後直接 refresh()。
+    """
 
-        conn.commit()
-        conn.close()
+    def __init__(self, loader, ttl: float = 2.0):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._rebuilding = False
+        self.reloads = 0
+        self.last_reload_ms = 0.0
+
+        self._state = self._build(self._read_version())
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._state[0]
+
+    @property
+    def categories(self) -> Dict[str, List[str]]:
+        return self._state[1]
+
+    @property
+    def matcher(self) -> CategoryMatcher:
+        """目前的自動機；每 ttl 秒在背景檢查一次版本，有變就重建"""
+        self._check_version()
+        return self._state[2]
+
+    def refresh(self, force: bool = False) -> bool:
+        """版本不同（或 force）時立即重建，回傳是否有重建"""
+        with self._lock:
+            version = self._read_version()
+            if not force and version == self._state[0]:
+                return False
+
+            self._state = self._build(version)
+            self.reloads += 1
+            print(f"🔄 分類快取已更新（版本 {version}，{len(self._state[1])} 個分類）")
+            return True
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "categories": len(self.categories),
+            "reloads": self.reloads,
+            "last_reload_ms": self.last_reload_ms,
+            "ttl_s": self.ttl
+        }
 
-        print("🎉 小型公司記帳資料庫初始化完成！")
-        print("📊 包含功能：")
-        print("   • 基本會計科目 (30+ 科目)")
-        print("   • 員工管理 (1位系統管理員)")
-        print("   • 部門管理 (6個部門)")
-        print("   • 供應商/客戶管理")
-        print("   • 專案管理")
-        print("   • 預算管理")
-        print("   • 報銷流程")
-        print("   • 銀行對帳")
-        print("   • 稅務管理")
-        print("   • 發票管理")
+    def _check_version(self):
+        now = time.monotonic()
+        if self._rebuilding or now - self._checked_at < self.ttl:
+            return
+        self._checked_at = now
 
-        return True
+        # 版本查詢也放到背景執行緒，分類計算（事件迴圈上）不碰 SQLite
+        self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name='category-reload', daemon=True).start()
 
-    except Exception as e:
-        print(f"❌ 資料庫初始化失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+    def _rebuild_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️ 分類快取更新失敗: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _build(self, version: Optional[int]) -> Tuple[Optional[int], Dict[str, List[str]], CategoryMatcher]:
+        # 先讀版本再讀分類：中間若有人修改，下次檢查時版本不同會再重建一次
+        started = time.perf_counter()
+        categories = self._loader()
+        matcher = CategoryMatcher(categories)
+        self.last_reload_ms = round((time.perf_counter() - started) * 1000, 2)
+        return version, categories, matcher
+
+    @staticmethod
+    def _read_version() -> Optional[int]:
+        try:
+            conn = db.connect()
+            try:
+                row = conn.execute("SELECT value FROM app_meta WHERE key = 'categories_version'").fetchone()
+            finally:
+                conn.close()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"⚠️ 分類版本讀取失敗: {e}")
+            return None
+
+
+class SupplierIndex:
+    """供應商統編索引（記憶體 dict）：新增的供應商以 id > last_id 增量載入，查不到時最多每 refresh_interval 秒補載一次"""
+
+    def __init__(self, refresh_interval: float = 5.0):
+        self.refresh_interval = refresh_interval
+        self._by_tax_id: Dict[str, Dict] = {}
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self) -> int:
+        """載入 id 大於上次最大 id 的供應商，回傳新增筆數"""
+        with self._lock:
+            self._refreshed_at = time.monotonic()
+            try:
+                conn = db.connect()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        SELECT id, tax_id, name, default_category, status FROM suppliers
+                        WHERE id > ? ORDER BY id
+                    ''', (self._last_id,))
+                    rows = cursor.fetchall()
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"⚠️ 供應商索引載入失敗: {e}")
+                return 0
+
+            for row in rows:
+                self._last_id = max(self._last_id, row[0])
+                self._put(row)
+
+            return len(rows)
+
+    def put(self, supplier: Dict):
+        """供應商新增/修改後直接更新索引"""
+        with self._lock:
+            self._last_id = max(self._last_id, supplier['id'])
+            self._by_tax_id = {t: s for t, s in self._by_tax_id.items() if s['id'] != supplier['id']}
+            self._put((supplier['id'], supplier.get('tax_id'), supplier['name'],
+                       supplier.get('default_category'), supplier.get('status', 'active')))
+
+    def lookup(self, tax_id: str) -> Optional[Dict]:
+        """O(1) 查詢；沒有命中且距離上次載入夠久時先增量載入"""
+        supplier = self._by_tax_id.get(tax_id)
+        if supplier is None and time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+            supplier = self._by_tax_id.get(tax_id)
+
+        if supplier is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return supplier
 
+    def stats(self) -> Dict:
+        return {"suppliers": len(self._by_tax_id), "last_id": self._last_id, "hits": self.hits, "misses": self.misses}
 
-# 啟動時初始化資料庫
-init_database()
+    def _put(self, row):
+        supplier_id, tax_id, name, default_category, status = row
+        tax_id = (tax_id or '').strip()
+        if tax_id and status != 'inactive':
+            self._by_tax_id[tax_id] = {'id': supplier_id, 'tax_id': tax_id, 'name': name,
+                                       'default_category': default_category}
 
 
-# 移除這些重度導入
-# import easyocr
-# import numpy as np
+supplier_index = SupplierIndex()
 
-class FreeReceiptAI:
-    def __init__(self):
-        # PIL版本兼容性修復
+
+class MerchantCategoryMemo:
+    """商家→分類頻率表（merchant_categories）的記憶體鏡像：已知商家分類只要一次 dict 查詢
+
+    record() 與發票寫入在同一個交易（不commit）；記憶體等呼叫端 commit 之後才用 apply() 套用，
+    交易失敗時記憶體維持資料庫的狀態，不會從沒存下來的發票學到分類。
+    出現次數達 min_count 的商家才採用最常見的分類，避免一次誤判就一直沿用。
+    """
+
+    def __init__(self, min_count: int = 2):
+        self.min_count = min_count
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._best: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """從資料庫載入整張頻率表"""
         try:
-            from PIL import Image
-            if not hasattr(Image, 'ANTIALIAS'):
-                Image.ANTIALIAS = Image.LANCZOS
-                print("🔧 PIL兼容性修復：ANTIALIAS -> LANCZOS")
-            if not hasattr(Image, 'BICUBIC'):
-                Image.BICUBIC = Image.LANCZOS
-                print("🔧 PIL兼容性修復：BICUBIC -> LANCZOS")
+            conn = db.connect()
+            try:
+                rows = conn.execute('SELECT merchant, category, count FROM merchant_categories').fetchall()
+            finally:
+                conn.close()
         except Exception as e:
-            print(f"⚠️ PIL兼容性修復失敗: {e}")
+            print(f"⚠️ 商家分類表載入失敗: {e}")
+            return
+
+        self._counts = {}
+        for merchant, category, count in rows:
+            self._counts.setdefault(merchant, {})[category] = count
+        self._best = {}
+        for merchant in self._counts:
+            self._update_best(merchant)
+
+        print(f"📚 商家分類表: {len(self._best)} 個已知商家")
+
+    def lookup(self, merchant: str) -> Optional[str]:
+        category = self._best.get(merchant)
+        if category is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return category
+
+    def record(self, cursor, merchant: str, category: str, delta: int = 1, pending: Optional[Dict] = None):
+        """累加（或扣減）一筆商家分類次數；pending 收集要在 commit 後 apply() 的增減"""
+        self.record_many(cursor, {(merchant, category): delta})
+        if pending is not None:
+            pending[(merchant, category)] = pending.get((merchant, category), 0) + delta
+
+    def record_many(self, cursor, deltas: Dict[Tuple[str, str], int]):
+        """一次寫入多筆 (商家, 分類) → 增減次數（executemany，只寫資料庫）"""
+        deltas = self._valid(deltas)
+        if not deltas:
+            return
+
+        cursor.executemany('''
+            INSERT INTO merchant_categories (merchant, category, count) VALUES (?, ?, MAX(?, 0))
+            ON CONFLICT (merchant, category)
+            DO UPDATE SET count = MAX(count + ?, 0), updated_at = CURRENT_TIMESTAMP
+        ''', [(merchant, category, delta, delta) for (merchant, category), delta in deltas.items()])
+
+    def apply(self, deltas: Dict[Tuple[str, str], int]):
+        """交易 commit 之後，把同一批增減套用到記憶體"""
+        for (merchant, category), delta in self._valid(deltas).items():
+            counts = self._counts.setdefault(merchant, {})
+            counts[category] = max(counts.get(category, 0) + delta, 0)
+            self._update_best(merchant)
+
+    @staticmethod
+    def _valid(deltas: Dict[Tuple[str, str], int]) -> Dict[Tuple[str, str], int]:
+        return {(merchant, category): delta for (merchant, category), delta in deltas.items()
+                if merchant and merchant != '未知商家' and category and delta}
+
+    def stats(self) -> Dict:
+        return {"merchants": len(self._best), "min_count": self.min_count, "hits": self.hits, "misses": self.misses}
+
+    def _update_best(self, merchant: str):
+        category, count = max(self._counts[merchant].items(), key=lambda item: item[1])
+        if count >= self.min_count:
+            self._best[merchant] = category
+        else:
+            self._best.pop(merchant, None)
+
+
+merchant_memo = MerchantCategoryMemo(min_count=int(os.environ.get("MERCHANT_MEMO_MIN_COUNT", 2)))
+
+
+class SummaryCache:
+    """已結束期間（結束日在今天以前）的摘要結果快取
+
+    以 app_meta.receipts_history_version 判斷是否失效：觸發器只在日期早於今天的發票新增、修改、刪除時遞增，
+    今天上傳的發票不會讓過去期間的快取失效；版本改變時整個清空。快取的結果是共用的，呼叫端不可修改。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple, version: Optional[int]) -> Optional[Dict]:
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, version: Optional[int], result: Dict):
+        with self._lock:
+            # 計算期間版本又變了：結果可能已經過期，不存
+            if version != self._version:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 3) if total else 0
+        }
+
+    @staticmethod
+    def read_version(cursor) -> Optional[int]:
+        row = cursor.execute("SELECT value FROM app_meta WHERE key = 'receipts_history_version'").fetchone()
+        return row[0] if row else None
+
+
+summary_cache = SummaryCache(max_entries=int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 256)))
+
+
+class FreeReceiptAI:
+    def __init__(self):
+        # EasyOCR 在背景執行緒載入（見 start_loading），這裡不阻塞啟動
+        self.ocr_available = False
+        self.status = 'loading'
+        self.load_timings = {}
+        self._loader = None
+
+        # 各辨識來源的處理張數（einvoice_qr / ocr_cache / easyocr_real / simulation_fallback）
+        self.source_counts = {}
+        # QR Code 快速路徑結果：complete（跳過OCR）/ partial（退回OCR）/ none（沒有QR Code）
+        self.qr_counts = {'complete': 0, 'partial': 0, 'none': 0}
+        self.qr_decode_ms = 0.0
+
+        # 分類關鍵字快取（分類異動時重建自動機，不需要重啟）
+        self.category_cache = CategoryCache(self.load_categories,
+                                            ttl=float(os.environ.get("CATEGORY_CACHE_TTL", 2)))
+
+    def start_loading(self):
+        """在背景執行緒載入並暖機 EasyOCR（支援繁體中文），讓伺服器先開始監聽"""
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._load_model, name='ocr-loader', daemon=True)
+            self._loader.start()
+
+    def _load_model(self):
+        """載入 Reader → 假圖片推論暖機 → 標記 ready"""
+        started = time.perf_counter()
+        print("⏳ 背景載入 EasyOCR 模型...")
 
-        # 初始化 EasyOCR（支援繁體中文）
         try:
-            import easyocr
-            self.reader = easyocr.Reader(['ch_tra', 'en'], gpu=False)
-            print("🔧 EasyOCR 初始化完成（支援繁體中文）")
-            self.ocr_available = True
+            if OCR_BACKEND == "process":
+                # 每個工作程序在啟動時自行載入並暖機 Reader
+                workers = ocr_executor.warm_up_workers()
+                self.ocr_available = any(w['ready'] for w in workers)
+                self.load_timings['workers'] = workers
+            else:
+                self.ocr_available = ocr_worker.init_reader()
+                if self.ocr_available:
+                    ocr_worker.warmup()
+                self.load_timings.update(ocr_worker.LOAD_TIMINGS)
+
         except Exception as e:
-            print(f"⚠️ EasyOCR 初始化失敗: {e}")
+            print(f"⚠️ EasyOCR 載入失敗: {e}")
             self.ocr_available = False
+            self.load_timings['error'] = str(e)
+
+        self.load_timings['total_s'] = round(time.perf_counter() - started, 3)
+        self.status = 'ready' if self.ocr_available else 'degraded'
+
+        if self.ocr_available:
+            print(f"✅ EasyOCR 模型就緒（{self.load_timings['total_s']} 秒）")
+        else:
+            print("⚠️ EasyOCR 無法使用，改用模擬模式")
 
-        # 載入分類關鍵字
-        self.categories = self.load_categories()
+    def _check_ready(self):
+        """模型還在載入時拒絕需要OCR的請求"""
+        if self.status == 'loading':
+            raise ModelLoadingError("AI模型載入中，請稍後再試")
 
     def load_categories(self) -> Dict[str, List[str]]:
         """從資料庫載入分類關鍵字"""
         try:
-            conn = sqlite3.connect('receipts.db')
-            cursor = conn.cursor()
-            cursor.execute("SELECT name, keywords FROM categories")
-            categories = {}
-
-            for name, keywords in cursor.fetchall():
-                if keywords:
-                    categories[name] = keywords.split(',')
-                else:
-                    categories[name] = []
+            conn = db.connect()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name, keywords FROM categories")
+                categories = {}
 
-            conn.close()
+                for name, keywords in cursor.fetchall():
+                    if keywords:
+                        categories[name] = keywords.split(',')
+                    else:
+                        categories[name] = []
+            finally:
+                conn.close()
             return categories
         except Exception as e:
             print(f"載入分類失敗: {e}")
@@ -594,86 +729,283 @@ class FreeReceiptAI:
                 '雜費': ['水電', '電話', '網路', '清潔', '維修', '銀行', '郵局']
             }
 
-    async def process_receipt(self, image_path: str) -> Dict:
-        """處理發票：真實EasyOCR → 智能解析 → 自動分類"""
+    async def process_receipt(self, image_data: bytes, content_hash: str = None) -> Dict:
+        """處理發票：OCR快取 / 電子發票QR Code / 真實EasyOCR → 智能解析 → 自動分類"""
+
+        print(f"🔍 開始處理發票 ({len(image_data)} bytes)")
+
+        # 1. 同一張圖片辨識過就直接用快取
+        ocr_result = ocr_cache.get(content_hash) if content_hash else None
+
+        # 2. 電子發票QR Code完整解出時不需要OCR
+        if ocr_result is None:
+            data = await self._scan_qr(image_data)
+            if data:
+                return data
+
+        # 3. 真實EasyOCR辨識
+        if ocr_result is None:
+            self._check_ready()
+            if self.ocr_available:
+                ocr_result = await self._real_ocr(image_data)
+                if content_hash and ocr_result['source'] == 'easyocr_real':
+                    ocr_cache.put(content_hash, ocr_result)
+            else:
+                ocr_result = self._simulate_ocr()
+
+        return await self._analyze(ocr_result)
+
+    async def process_receipts_batch(self, images: List[bytes], hashes: List[str]) -> List[Dict]:
+        """批次處理多張發票：OCR快取 / EasyOCR 批次推論 → 逐張解析分類
+
+        無法解碼的圖片為 None；OCR佇列已滿而沒辨識到的圖片為 OCRQueueFullError（其他張照常回傳）
+        """
+
+        print(f"🔍 開始批次處理 {len(images)} 張發票")
+
+        ocr_results = [ocr_cache.get(h) for h in hashes]
+        missing = [i for i, r in enumerate(ocr_results) if r is None]
+
+        # 電子發票QR Code完整解出的直接完成，其餘才送OCR
+        qr_data = {}
+        if missing:
+            scanned = await asyncio.gather(*(self._scan_qr(images[i]) for i in missing))
+            qr_data = {i: data for i, data in zip(missing, scanned) if data}
+            missing = [i for i in missing if i not in qr_data]
+
+        if missing:
+            self._check_ready()
+            if self.ocr_available:
+                fresh = await self._real_ocr_batch([images[i] for i in missing])
+                for i, ocr_result in zip(missing, fresh):
+                    ocr_results[i] = ocr_result
+                    if isinstance(ocr_result, dict) and ocr_result['source'] == 'easyocr_real':
+                        ocr_cache.put(hashes[i], ocr_result)
+            else:
+                for i in missing:
+                    ocr_results[i] = self._simulate_ocr()
+
+        receipts = []
+        for i, ocr_result in enumerate(ocr_results):
+            if i in qr_data:
+                receipts.append(qr_data[i])
+            elif isinstance(ocr_result, dict):
+                receipts.append(await self._analyze(ocr_result))
+            else:
+                receipts.append(ocr_result)
+        return receipts
+
+    async def _analyze(self, ocr_result: Dict) -> Dict:
+        """OCR結果 → 智能解析 → 自動分類（原始OCR結果附在 ocr_raw，由 insert_receipt 存檔）"""
+        data = self._extract(ocr_result)
+        self._count_source(ocr_result['source'])
+        observe_stages(data['ocr_timings'])
+
+        if ocr_result.get('tokens'):
+            data['ocr_raw'] = {'tokens': ocr_result['tokens'], 'source': ocr_result['source']}
 
-        print(f"🔍 開始處理發票: {image_path}")
+        return data
 
-        # 1. 真實EasyOCR辨識
-        if self.ocr_available:
-            ocr_result = await self._real_ocr(image_path)
-        else:
-            ocr_result = self._simulate_ocr()
+    def _extract(self, ocr_result: Dict, log: bool = True) -> Dict:
+        """解析欄位、品項與分類（新上傳與重新解析共用，純 CPU 不碰事件迴圈）；log=False 不印逐張訊息"""
 
         text = ocr_result['text']
         confidence = ocr_result['confidence']
 
-        print(f"📝 OCR結果 (信心度: {confidence:.2f}): {text[:100]}...")
+        if log:
+            print(f"📝 OCR結果 (信心度: {confidence:.2f}): {text[:100]}...")
 
-        # 2. 智能解析發票資料
-        data = await self._smart_parse(text)
+        # 2. 賣方統編 → 已知供應商（商家名稱與預設分類直接採用）
+        started = time.perf_counter()
+        supplier, supplier_tax_id = self._resolve_supplier(text, log)
+
+        # 3. 智能解析發票資料（已知供應商就不猜商家名稱）
+        data = self._smart_parse(text, supplier['name'] if supplier else None)
+        data['supplier_id'] = supplier['id'] if supplier else None
+        data['supplier_tax_id'] = supplier_tax_id
         data['ocr_confidence'] = confidence
+        data['ocr_source'] = ocr_result['source']
+        data['ocr_timings'] = dict(ocr_result.get('timings', {}))
+        data['ocr_timings']['parse_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        # 品項：依文字框位置分行、對齊價格欄（沒有文字框的模擬結果就沒有品項）
+        tokens = ocr_result.get('tokens')
+        if tokens:
+            started = time.perf_counter()
+            data['items'] = receipt_layout.extract_items(tokens)
+            data['ocr_timings']['layout_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        if DEBUG and log:
+            print(f"🔧 解析結果: {data}")
+
+        # 4. 智能分類
+        started = time.perf_counter()
+        if supplier and supplier['default_category']:
+            data['category'] = supplier['default_category']
+        else:
+            data['category'] = self._smart_categorize(data['merchant'], text)
+        data['ocr_timings']['categorize_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if log:
+            print(f"🏷️ 分類結果: {data['category']}")
 
-        print(f"🔧 解析結果: {data}")
+        return data
+
+    def _resolve_supplier(self, text: str, log: bool = True) -> Tuple[Optional[Dict], str]:
+        """找出檢查碼正確的賣方統編並查供應商索引，回傳 (供應商, 統編)
+
+        有「統編」標籤的統編即使查不到也保留；沒標籤的 8 位數字（可能是電話）只在查得到時採用
+        """
+        labeled, unlabeled = receipt_parser.tax_id_candidates(text)
+        for tax_id in labeled + unlabeled:
+            supplier = supplier_index.lookup(tax_id)
+            if supplier:
+                if log:
+                    print(f"🏢 統編 {tax_id} → {supplier['name']}")
+                return supplier, tax_id
+
+        return None, labeled[0] if labeled else ''
+
+    async def _scan_qr(self, image_data: bytes) -> Optional[Dict]:
+        """電子發票QR Code快速路徑：欄位完整時直接回傳解析結果，否則回傳 None 交給OCR"""
+        if not QR_FAST_PATH:
+            return None
+
+        loop = asyncio.get_running_loop()
+        scan = await loop.run_in_executor(None, einvoice_qr.scan, image_data)
+
+        self.qr_counts[scan['status']] += 1
+        self.qr_decode_ms += scan['decode_ms']
+
+        if scan['status'] != 'complete':
+            if scan['status'] == 'partial':
+                print("⚠️ QR Code 資料不完整，改用OCR")
+            return None
+
+        fields = scan['fields']
+        print(f"⚡ 電子發票QR Code: {fields['invoice_number']} ({scan['decode_ms']} ms)")
+
+        supplier = supplier_index.lookup(fields['seller_tax_id'])
+
+        data = {
+            'invoice_number': fields['invoice_number'],
+            'date': fields['date'],
+            'merchant': supplier['name'] if supplier else '未知商家',
+            'supplier_id': supplier['id'] if supplier else None,
+            'supplier_tax_id': fields['seller_tax_id'],
+            'amount': fields['amount'],
+            'tax_amount': fields['tax_amount'],
+            'items': fields['items'],
+            'ocr_confidence': 1.0,
+            'ocr_source': 'einvoice_qr',
+            'ocr_timings': {'qr_decode_ms': scan['decode_ms']}
+        }
 
-        # 3. 智能分類
-        data['category'] = self._smart_categorize(data['merchant'], text)
-        print(f"🏷️ 分類結果: {data['category']}")
+        if supplier and supplier['default_category']:
+            data['category'] = supplier['default_category']
+        else:
+            item_text = '\n'.join(item['name'] for item in fields['items'])
+            data['category'] = self._smart_categorize(data['merchant'], item_text)
+        self._count_source('einvoice_qr')
+        observe_stages(data['ocr_timings'])
 
         return data
 
-    async def _real_ocr(self, image_path: str) -> Dict:
-        """使用 EasyOCR 進行真實文字辨識"""
+    def _count_source(self, source: str):
+        self.source_counts[source] = self.source_counts.get(source, 0) + 1
+
+    def fast_path_stats(self) -> Dict:
+        """QR Code 快速路徑的命中情況與占比"""
+        total = sum(self.source_counts.values())
+        scanned = sum(self.qr_counts.values())
+
+        return {
+            "enabled": QR_FAST_PATH,
+            "processed": total,
+            "sources": dict(self.source_counts),
+            "qr": dict(self.qr_counts),
+            "qr_share": round(self.source_counts.get('einvoice_qr', 0) / total, 3) if total else 0,
+            "avg_qr_decode_ms": round(self.qr_decode_ms / scanned, 1) if scanned else 0
+        }
+
+    async def _real_ocr(self, image_data: bytes) -> Dict:
+        """使用 EasyOCR 進行真實文字辨識（在OCR執行器中推論，不阻塞事件迴圈）"""
 
         try:
-            from PIL import Image
-            import numpy as np
+            print("🔍 EasyOCR 正在辨識...")
+            recognized = await ocr_executor.run(ocr_worker.recognize, image_data)
 
-            # 前處理圖片
-            image = Image.open(image_path)
+            return self._ocr_result(recognized['tokens'], recognized['timings'])
 
-            # 如果圖片太大，縮小以提高處理速度
-            max_size = 1600
-            if max(image.size) > max_size:
-                ratio = max_size / max(image.size)
-                new_size = (int(image.width * ratio), int(image.height * ratio))
-                image = image.resize(new_size, Image.LANCZOS)
-                print(f"🔧 圖片已縮放至: {new_size}")
+        except OCRQueueFullError:
+            raise
 
-            # 轉換為 numpy array
-            img_array = np.array(image)
+        except Exception as e:
+            OCR_FAILURES.inc(mode='single')
+            print(f"⚠️ EasyOCR 處理失敗: {e}")
+            print("🔄 切換到模擬模式...")
+            return self._simulate_ocr()
 
-            # 使用 EasyOCR 辨識
-            print("🔍 EasyOCR 正在辨識...")
-            results = self.reader.readtext(img_array)
+    async def _real_ocr_batch(self, images: List[bytes]) -> List:
+        """分批送進 EasyOCR 批次推論，同時執行的批數不超過推論槽數量
 
-            # 合併所有辨識的文字
-            full_text = ""
-            total_confidence = 0
+        某一批遇到OCR佇列已滿時，只有該批的位置是 OCRQueueFullError，其他批的結果照常回傳
+        """
+        chunks = [images[i:i + OCR_BATCH_SIZE] for i in range(0, len(images), OCR_BATCH_SIZE)]
 
-            for (bbox, text, confidence) in results:
-                full_text += text + "\n"
-                total_confidence += confidence
-                print(f"   辨識到: {text} (信心度: {confidence:.2f})")
+        ocr_results = []
+        for i in range(0, len(chunks), ocr_executor.max_workers):
+            wave = chunks[i:i + ocr_executor.max_workers]
+            for chunk_results in await asyncio.gather(*(self._real_ocr_chunk(c) for c in wave)):
+                ocr_results.extend(chunk_results)
 
-            # 計算平均信心度
-            avg_confidence = total_confidence / len(results) if results else 0
+        return ocr_results
 
-            print(f"✅ EasyOCR 辨識完成，平均信心度: {avg_confidence:.2f}")
+    async def _real_ocr_chunk(self, chunk: List[bytes]) -> List:
+        """辨識一批圖片"""
+        try:
+            print(f"🔍 EasyOCR 正在批次辨識 {len(chunk)} 張...")
+            batch = await ocr_executor.run(ocr_worker.recognize_batch, chunk)
 
-            return {
-                'text': full_text,
-                'confidence': avg_confidence,
-                'source': 'easyocr_real'
-            }
+            return [self._ocr_result(r['tokens'], r['timings']) if r is not None else None for r in batch]
+
+        except OCRQueueFullError as e:
+            # 只讓這一批失敗，前面幾批已完成的辨識結果仍然存檔
+            print(f"⚠️ OCR佇列已滿，這批 {len(chunk)} 張標記失敗")
+            return [e] * len(chunk)
 
         except Exception as e:
-            print(f"⚠️ EasyOCR 處理失敗: {e}")
+            OCR_FAILURES.inc(mode='batch')
+            print(f"⚠️ EasyOCR 批次處理失敗: {e}")
             print("🔄 切換到模擬模式...")
-            return self._simulate_ocr()
+            return [self._simulate_ocr() for _ in chunk]
+
+    def _ocr_result(self, results: List, timings: Dict = None) -> Dict:
+        """合併 EasyOCR 的 (bbox, text, confidence) 結果"""
+        full_text = ""
+        total_confidence = 0
+
+        for (bbox, text, confidence) in results:
+            full_text += text + "\n"
+            total_confidence += confidence
+            if DEBUG:
+                print(f"   辨識到: {text} (信心度: {confidence:.2f})")
+
+        # 計算平均信心度
+        avg_confidence = total_confidence / len(results) if results else 0
+
+        print(f"✅ EasyOCR 辨識完成，平均信心度: {avg_confidence:.2f}")
+
+        return {
+            'text': full_text,
+            'confidence': avg_confidence,
+            'tokens': results,
+            'timings': timings or {},
+            'source': 'easyocr_real'
+        }
 
     def _simulate_ocr(self) -> Dict:
         """備用模擬OCR"""
+        SIMULATION_FALLBACKS.inc()
         fake_receipts = [
             """統一發票
 PA50921578
@@ -711,180 +1043,527 @@ CD11223344
             'source': 'simulation_fallback'
         }
 
-    async def _smart_parse(self, text: str) -> Dict:
-        """智能解析發票內容"""
+    def _smart_parse(self, text: str, merchant: str = None) -> Dict:
+        """智能解析發票內容（預先編譯的欄位擷取器，見 receipt_parser）"""
+        return receipt_parser.parse(text, merchant)
+
+    @property
+    def categories(self) -> Dict[str, List[str]]:
+        return self.category_cache.categories
+
+    def _smart_categorize(self, merchant: str, full_text: str) -> str:
+        """智能分類：已知商家直接用歷史分類，否則結合商家名稱和發票內容（關鍵字自動機單次掃描計分）"""
+        category = merchant_memo.lookup(merchant)
+        if category:
+            return category
+
+        return self.category_cache.matcher.categorize(merchant, full_text)
+
+
+# 建立AI實例
+ai = FreeReceiptAI()
+
+metrics.Callback('receipts_processed_total', '依辨識來源的處理張數',
+                 lambda: {(source,): count for source, count in ai.source_counts.items()}, 'counter', ('source',))
+metrics.Callback('einvoice_qr_scans_total', '電子發票QR Code掃描結果',
+                 lambda: {(status,): count for status, count in ai.qr_counts.items()}, 'counter', ('status',))
+metrics.Callback('ocr_cache_hits_total', 'OCR快取命中次數', lambda: ocr_cache.hits, 'counter')
+metrics.Callback('ocr_cache_misses_total', 'OCR快取未命中次數', lambda: ocr_cache.misses, 'counter')
+metrics.Callback('ocr_queue_depth', '等待OCR推論槽的請求數', lambda: ocr_executor.waiting)
+metrics.Callback('ocr_running', '推論中的請求數', lambda: ocr_executor.running)
+metrics.Callback('ocr_rejected_total', 'OCR佇列已滿被拒絕的請求數', lambda: ocr_executor.rejected, 'counter')
+metrics.Callback('receipt_jobs_queued', '非同步發票工作佇列長度', lambda: job_queue.stats()['queued'])
+metrics.Callback('ocr_model_ready', 'EasyOCR 模型是否就緒（1/0）', lambda: ai.status == 'ready')
+metrics.Callback('category_cache_reloads_total', '分類自動機重建次數', lambda: ai.category_cache.reloads, 'counter')
+metrics.Callback('merchant_memo_hits_total', '商家分類表命中次數', lambda: merchant_memo.hits, 'counter')
+metrics.Callback('summary_cache_hits_total', '摘要快取命中次數', lambda: summary_cache.hits, 'counter')
+metrics.Callback('summary_cache_misses_total', '摘要快取未命中次數', lambda: summary_cache.misses, 'counter')
+metrics.Callback('db_connections_opened_total', '開啟的資料庫連線數', lambda: db.stats()['opened'], 'counter')
+metrics.Callback('db_pool_idle', '連線池中閒置的連線數', lambda: db.stats()['idle'])
+
+
+@app.on_event("startup")
+def start_model_loading():
+    """伺服器啟動後立即開始監聽，模型在背景載入"""
+    ai.start_loading()
+    supplier_index.refresh()
+    merchant_memo.load()
+
+
+@app.on_event("shutdown")
+def shutdown_ocr():
+    """關閉OCR推論執行器與閒置的資料庫連線"""
+    ocr_executor.shutdown()
+    db.close_all()
+
+
+def insert_receipt(cursor, photo_path, receipt_data: Dict, memo_deltas: Dict) -> int:
+    """寫入一筆AI辨識的發票記錄與原始OCR結果（不commit，由呼叫端控制交易）
+
+    商家分類次數的增減累加到 memo_deltas，呼叫端 commit 之後再 merchant_memo.apply(memo_deltas)。
+    """
+    with DB_SECONDS.time(operation='insert_receipt'):
+        return _insert_receipt(cursor, photo_path, receipt_data, memo_deltas)
+
+
+def _insert_receipt(cursor, photo_path, receipt_data: Dict, memo_deltas: Dict) -> int:
+    ocr_raw = receipt_data.pop('ocr_raw', None)
+
+    cursor.execute('''
+        INSERT INTO receipts 
+        (photo_path, invoice_number, date, merchant, supplier_id, supplier_tax_id, amount, tax_amount, category,
+         description, ocr_confidence)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        photo_path,
+        receipt_data['invoice_number'],
+        receipt_data['date'],
+        receipt_data['merchant'],
+        receipt_data.get('supplier_id'),
+        receipt_data.get('supplier_tax_id'),
+        receipt_data['amount'],
+        receipt_data['tax_amount'],
+        receipt_data['category'],
+        f"AI辨識: {receipt_data['merchant']} (信心度: {receipt_data.get('ocr_confidence', 0):.2f})",
+        receipt_data.get('ocr_confidence', 0)
+    ))
+
+    receipt_id = cursor.lastrowid
+    merchant_memo.record(cursor, receipt_data['merchant'], receipt_data['category'], pending=memo_deltas)
+
+    if ocr_raw:
+        cursor.execute('''
+            INSERT OR REPLACE INTO receipt_ocr (receipt_id, engine_version, source, token_count, payload)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (receipt_id, ocr_worker.ENGINE_VERSION, ocr_raw['source'], len(ocr_raw['tokens']),
+              pack_ocr_tokens(ocr_raw['tokens'])))
+
+    return receipt_id
+
+
+def pack_ocr_tokens(tokens: List) -> bytes:
+    """(bbox, text, confidence) → zlib壓縮的JSON（座標取到 0.1px、信心度取到 4 位）"""
+    payload = {
+        'text': [text for _, text, _ in tokens],
+        'boxes': [[[round(x, 1), round(y, 1)] for x, y in bbox] for bbox, _, _ in tokens],
+        'confidences': [round(confidence, 4) for _, _, confidence in tokens]
+    }
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def unpack_ocr_tokens(blob: bytes) -> List:
+    payload = json.loads(zlib.decompress(blob).decode('utf-8'))
+    return list(zip(payload['boxes'], payload['text'], payload['confidences']))
+
+
+# 上傳限制
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+# 批次上傳整個請求的上限：手機一疊 50~200 張、每張 3~8 MB 的照片（multipart 暫存在磁碟，不佔記憶體）
+UPLOAD_BATCH_MAX_BYTES = int(os.environ.get("UPLOAD_BATCH_MAX_BYTES", 200 * 8 * 1024 * 1024))
+# 批次上傳每次讀進記憶體、送OCR的張數（一波OCR的量），辨識完就釋放圖片再讀下一段
+UPLOAD_BATCH_CHUNK = max(1, int(os.environ.get("UPLOAD_BATCH_CHUNK", OCR_BATCH_SIZE * ocr_executor.max_workers)))
+# multipart 邊界與標頭的額外空間
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+
+# 上傳端點 → 整個請求本文的上限（multipart 解析之前就檢查）
+UPLOAD_REQUEST_LIMITS = {
+    '/upload-receipt': UPLOAD_MAX_BYTES + UPLOAD_MULTIPART_OVERHEAD,
+    '/receipt-jobs': UPLOAD_MAX_BYTES + UPLOAD_MULTIPART_OVERHEAD,
+    '/upload-receipts': UPLOAD_BATCH_MAX_BYTES + UPLOAD_MULTIPART_OVERHEAD,
+}
+
+
+class UploadTooLargeError(Exception):
+    """上傳檔案超過大小上限"""
+
+
+class UploadSizeLimit:
+    """上傳端點的請求本文上限（ASGI 中介層）
+
+    File(...) 參數在端點執行前就由 multipart 解析器整個收進暫存檔，端點內才檢查大小已經太晚：
+    Content-Length 超過上限直接回 413，不讀本文；沒有 Content-Length（chunked）或長度不實的請求
+    邊收邊計數，超過時中止解析回 413。
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        message = f"上傳內容太大，上限 {limit / (1024 * 1024):.1f} MB"
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": message})
+            await response(scope, receive, send)
+            return
 
-        result = {
-            'invoice_number': '',
-            'date': '',
-            'merchant': '',
-            'amount': 0,
-            'tax_amount': 0,
-            'items': []
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            request_message = await receive()
+            if request_message['type'] == 'http.request':
+                received += len(request_message.get('body', b''))
+                if received > limit:
+                    # 在 multipart 解析途中拋出，FastAPI 原樣轉成 413 回應
+                    raise HTTPException(status_code=413, detail=message)
+            return request_message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimit, limits=UPLOAD_REQUEST_LIMITS)
+
+
+async def read_upload(file: UploadFile) -> Tuple[bytearray, str, Dict]:
+    """讀取上傳檔案：從 multipart 暫存檔直接讀進預先配置好的 bytearray（只複製一次），再算內容雜湊
+
+    請求本文的上限已由 UploadSizeLimit 在解析前檢查；這裡再檢查單一檔案的大小（批次上傳時逐檔限制）。
+    """
+    size = file.size
+    if size is None:
+        size = await run_in_threadpool(_spooled_size, file.file)
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadTooLargeError(f"檔案太大，上限 {UPLOAD_MAX_BYTES / (1024 * 1024):.1f} MB")
+
+    content = bytearray(size)
+    await file.seek(0)
+    received = await run_in_threadpool(file.file.readinto, content)
+    if received < size:
+        del content[received:]
+
+    return content, hashlib.sha256(content).hexdigest(), {
+        "bytes_received": received,
+        # 暫存檔 → 記憶體的一次複製（multipart 解析寫入暫存檔的那次不在此列）
+        "bytes_copied": received
+    }
+
+
+def _spooled_size(spooled) -> int:
+    position = spooled.tell()
+    spooled.seek(0, os.SEEK_END)
+    size = spooled.tell()
+    spooled.seek(position)
+    return size
+
+
+class ReceiptJobQueue:
+    """非同步發票處理工作佇列：工作記錄在 SQLite，重新啟動時自動接續未完成的工作
+
+    執行中的工作記下執行者（owner，每個程序啟動時產生）與租約到期時間，執行期間每 lease/3 秒延長一次。
+    重疊部署或多個 uvicorn 工作程序時，只接手租約已過期（執行者已經不在）的工作；
+    存檔時再確認工作還是自己的，被接手的工作 rollback，不會重複寫入發票。
+    """
+
+    def __init__(self, workers: int = 2, lease_seconds: float = 60.0):
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        """建立工作者與租約維護工作，把 pending 與租約過期的 running 工作排入佇列"""
+        self._queue = asyncio.Queue()
+
+        resumed = self._reclaim(include_pending=True)
+        if resumed:
+            print(f"🔁 接續 {len(resumed)} 個未完成的發票工作")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    def stop(self):
+        """關機時停止工作者，並把自己執行中的工作交還（其他程序不必等租約過期）"""
+        for task in self._tasks:
+            task.cancel()
+
+        conn = db.connect()
+        try:
+            conn.execute('''
+                UPDATE receipt_jobs SET status = 'pending', owner = NULL, lease_until = NULL,
+                                        updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND owner = ?
+            ''', (self.owner,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _reclaim(self, include_pending: bool = False) -> List[str]:
+        """租約過期（或沒有租約的舊資料）的 running 工作改回 pending 並排入佇列，回傳排入的工作ID"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id FROM receipt_jobs
+                WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)
+            ''', (time.time(),))
+            expired = [row[0] for row in cursor.fetchall()]
+            reclaimed = []
+            for job_id in expired:
+                cursor.execute('''
+                    UPDATE receipt_jobs SET status = 'pending', owner = NULL, lease_until = NULL,
+                                            updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running' AND (lease_until IS NULL OR lease_until < ?)
+                ''', (job_id, time.time()))
+                if cursor.rowcount:
+                    reclaimed.append(job_id)
+
+            pending = []
+            if include_pending:
+                cursor.execute("SELECT id FROM receipt_jobs WHERE status = 'pending' ORDER BY created_at")
+                pending = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+
+        if reclaimed:
+            print(f"⏱️ 接手 {len(reclaimed)} 個租約過期的發票工作")
+
+        resumed = pending if include_pending else reclaimed
+        for job_id in resumed:
+            self._queue.put_nowait(job_id)
+        return resumed
+
+    async def _heartbeat(self):
+        """延長自己執行中工作的租約，順便接手其他程序留下、租約已過期的工作"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                conn = db.connect()
+                try:
+                    conn.execute('''
+                        UPDATE receipt_jobs SET lease_until = ?
+                        WHERE status = 'running' AND owner = ?
+                    ''', (time.time() + self.lease_seconds, self.owner))
+                    conn.commit()
+                finally:
+                    conn.close()
+                self._reclaim()
+            except Exception as e:
+                print(f"⚠️ 發票工作租約更新失敗: {e}")
+
+    def submit(self, content: bytes, content_hash: str, filename: str) -> Dict:
+        """儲存圖片並建立工作；同一張圖片已有進行中或完成的工作就直接回傳該工作"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT id, status FROM receipt_jobs
+                WHERE content_hash = ? AND status != 'failed'
+                ORDER BY created_at DESC LIMIT 1
+            ''', (content_hash,))
+            existing = cursor.fetchone()
+
+            if existing:
+                print(f"♻️ 重複上傳，沿用工作: {existing[0]}")
+                return {"job_id": existing[0], "status": existing[1], "duplicate": True}
+
+            job_id = uuid.uuid4().hex
+            extension = os.path.splitext(filename or '')[1].lower() or '.jpg'
+            image_path = os.path.join("uploads", "jobs", f"{job_id}{extension}")
+
+            with open(image_path, 'wb') as f:
+                f.write(content)
+
+            cursor.execute('''
+                INSERT INTO receipt_jobs (id, status, filename, image_path, content_hash)
+                VALUES (?, 'pending', ?, ?, ?)
+            ''', (job_id, filename, image_path, content_hash))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._queue.put_nowait(job_id)
+        print(f"📥 建立發票工作: {job_id}")
+
+        return {"job_id": job_id, "status": "pending", "duplicate": False}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查詢工作狀態與結果"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, status, filename, receipt_id, result, error, attempts, created_at, updated_at
+                FROM receipt_jobs WHERE id = ?
+            ''', (job_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if not row:
+            return None
+
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "filename": row[2],
+            "receipt_id": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "attempts": row[6],
+            "created_at": row[7],
+            "updated_at": row[8]
         }
 
-        # 發票號碼：兩個英文字母+8個數字
-        invoice_match = re.search(r'[A-Z]{2}[\-]?[0-9]{8}', text)
-        if invoice_match:
-            result['invoice_number'] = invoice_match.group().replace('-', '')
-
-        # 總金額：更全面的模式匹配
-        amount_patterns = [
-            r'總計[：:\s]*\$?[\s]*(\d{1,6})',
-            r'合計[：:\s]*\$?[\s]*(\d{1,6})',
-            r'含稅總計[：:\s]*(\d{1,6})',
-            r'總金額[：:\s]*(\d{1,6})',
-            r'小計[：:\s]*(\d{1,6})',
-            r'金額[：:\s]*(\d{1,6})',
-            r'NT\$[\s]*(\d{1,6})',
-            r'應收[：:\s]*(\d{1,6})',
-            r'收費[：:\s]*(\d{1,6})'
-        ]
+    def stats(self) -> Dict:
+        """佇列深度"""
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "lease_s": self.lease_seconds,
+            "queued": self._queue.qsize() if self._queue else 0
+        }
 
-        for pattern in amount_patterns:
-            match = re.search(pattern, text)
-            if match:
-                result['amount'] = int(match.group(1))
-                break
+    async def _worker(self):
+        """逐一處理佇列中的工作"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"❌ 發票工作 {job_id} 失敗: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        """執行一個工作：OCR → 解析 → 分類 → 存檔，存檔與標記完成在同一個交易"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
 
-        # 如果沒找到總計，找最大的數字（但過濾掉明顯不是金額的）
-        if result['amount'] == 0:
-            numbers = re.findall(r'\d{1,6}', text)
-            if numbers:
-                amounts = []
-                for n in numbers:
-                    num = int(n)
-                    # 合理的金額範圍：10-99999
-                    if 10 <= num <= 99999 and len(n) <= 5:
-                        # 排除常見的非金額數字
-                        if not (len(n) == 8 or len(n) == 10):  # 排除統編、電話
-                            amounts.append(num)
-
-                if amounts:
-                    result['amount'] = max(amounts)
-
-        # 日期解析
-        date_patterns = [
-            r'(\d{2,3})[年/\-.](\d{1,2})[月/\-.](\d{1,2})',  # 民國年
-            r'(\d{4})[年/\-.](\d{1,2})[月/\-.](\d{1,2})',  # 西元年
-            r'(\d{4})/(\d{1,2})/(\d{1,2})',  # 2024/12/16
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',  # 2024-12-16
-        ]
+            cursor.execute('''
+                UPDATE receipt_jobs
+                SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+            ''', (self.owner, time.time() + self.lease_seconds, job_id))
+            conn.commit()
 
-        for pattern in date_patterns:
-            date_match = re.search(pattern, text)
-            if date_match:
-                year = int(date_match.group(1))
-                if year < 1000:  # 民國年轉西元年
-                    year += 1911
-                month = int(date_match.group(2))
-                day = int(date_match.group(3))
-
-                # 驗證日期合理性
-                if 1 <= month <= 12 and 1 <= day <= 31:
-                    result['date'] = f"{year}-{month:02d}-{day:02d}"
-                    break
-
-        if not result['date']:
-            result['date'] = datetime.now().strftime('%Y-%m-%d')
-
-        # 商家名稱辨識（針對台灣商家優化）
-        merchant_patterns = [
-            # 台灣常見店家格式
-            r'(來麵屋|星巴克|麥當勞|肯德基|全家|7-ELEVEN|誠品|屈臣氏|康是美|中油)',
-            r'([\u4e00-\u9fff]+(?:麵屋|餐廳|咖啡|書店|藥局|醫院|診所|便利商店|加油站))',
-            r'([\u4e00-\u9fff]+(?:公司|企業|行|店|館|廳|坊|屋|社|中心))',
-            r'([A-Za-z]+(?:Starbucks|McDonald|KFC|FamilyMart))',
-        ]
+            if cursor.rowcount == 0:
+                return
 
-        for pattern in merchant_patterns:
-            merchant_match = re.search(pattern, text, re.IGNORECASE)
-            if merchant_match:
-                result['merchant'] = merchant_match.group(1)
-                break
+            cursor.execute('SELECT image_path, content_hash FROM receipt_jobs WHERE id = ?', (job_id,))
+            image_path, content_hash = cursor.fetchone()
 
-        # 如果沒找到，找最長的中文字串
-        if not result['merchant']:
-            chinese_texts = re.findall(r'[\u4e00-\u9fff]+', text)
-            if chinese_texts:
-                # 過濾掉常見的無用詞
-                filtered = [t for t in chinese_texts
-                            if t not in ['統一發票', '電子發票', '營業稅', '總計', '合計', '小計',
-                                         '品項', '數量', '單價', '金額', '日期', '時間', '發票號碼']]
-                if filtered:
-                    # 優先選擇長度適中的（2-8字）
-                    suitable = [t for t in filtered if 2 <= len(t) <= 8]
-                    if suitable:
-                        result['merchant'] = max(suitable, key=len)
-                    else:
-                        result['merchant'] = max(filtered, key=len)
-
-        if not result['merchant']:
-            result['merchant'] = '未知商家'
-
-        # 稅額計算
-        if result['amount'] > 0:
-            # 先嘗試找明確的稅額
-            tax_patterns = [
-                r'營業稅[：:\s]*(\d{1,4})',
-                r'稅額[：:\s]*(\d{1,4})',
-                r'TAX[：:\s]*(\d{1,4})',
-            ]
+            try:
+                # 模型還在載入時先等一下，工作不會因為重新部署而失敗
+                while ai.status == 'loading':
+                    await asyncio.sleep(1)
 
-            for pattern in tax_patterns:
-                tax_match = re.search(pattern, text, re.IGNORECASE)
-                if tax_match:
-                    result['tax_amount'] = int(tax_match.group(1))
-                    break
+                with open(image_path, 'rb') as f:
+                    image_data = f.read()
 
-            # 如果沒找到，按5%計算
-            if result['tax_amount'] == 0:
-                result['tax_amount'] = round(result['amount'] * 0.05)
+                receipt_data = await ai.process_receipt(image_data, content_hash)
 
-        return result
+                memo_deltas = {}
+                receipt_data['id'] = insert_receipt(cursor, None, receipt_data, memo_deltas)
+                cursor.execute('''
+                    UPDATE receipt_jobs
+                    SET status = 'done', receipt_id = ?, result = ?, error = NULL, lease_until = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND owner = ? AND status = 'running'
+                ''', (receipt_data['id'], json.dumps(receipt_data, ensure_ascii=False), job_id, self.owner))
+                if cursor.rowcount == 0:
+                    # 租約過期已被其他程序接手：這次的發票不寫入
+                    conn.rollback()
+                    print(f"⚠️ 發票工作 {job_id} 已由其他程序接手，放棄這次結果")
+                    return
+                conn.commit()
+                merchant_memo.apply(memo_deltas)
+
+                print(f"💾 發票工作 {job_id} 完成，ID: {receipt_data['id']}")
+
+                try:
+                    os.unlink(image_path)
+                except OSError:
+                    pass
+
+            except OCRQueueFullError:
+                # OCR忙碌：放回佇列稍後重試
+                cursor.execute('''
+                    UPDATE receipt_jobs SET status = 'pending', owner = NULL, lease_until = NULL,
+                                            updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND owner = ?
+                ''', (job_id, self.owner))
+                conn.commit()
+                if cursor.rowcount:
+                    await asyncio.sleep(1)
+                    self._queue.put_nowait(job_id)
+
+            except Exception as e:
+                conn.rollback()
+                cursor.execute('''
+                    UPDATE receipt_jobs SET status = 'failed', error = ?, lease_until = NULL,
+                                            updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND owner = ?
+                ''', (str(e), job_id, self.owner))
+                conn.commit()
+                print(f"❌ 發票工作 {job_id} 失敗: {e}")
+
+        finally:
+            conn.close()
 
-    def _smart_categorize(self, merchant: str, full_text: str) -> str:
-        """智能分類：結合商家名稱和發票內容"""
 
-        if not merchant:
-            return '雜費'
+job_queue = ReceiptJobQueue(workers=int(os.environ.get("JOB_WORKERS", 2)),
+                            lease_seconds=float(os.environ.get("JOB_LEASE_SECONDS", 60)))
 
-        # 合併商家名稱和發票內容進行分析
-        analysis_text = f"{merchant} {full_text}".lower()
 
-        # 計算每個分類的匹配分數
-        category_scores = {}
+@app.on_event("startup")
+async def start_job_queue():
+    """啟動發票工作佇列（接續重新啟動前未完成的工作）"""
+    await job_queue.start()
 
-        for category, keywords in self.categories.items():
-            score = 0
-            for keyword in keywords:
-                keyword_lower = keyword.lower()
 
-                # 商家名稱完全匹配：高分
-                if keyword_lower in merchant.lower():
-                    score += 10
+@app.on_event("shutdown")
+def stop_job_queue():
+    """交還執行中的發票工作，重疊部署時新程序可以馬上接手"""
+    job_queue.stop()
 
-                # 發票內容包含：中等分
-                elif keyword_lower in analysis_text:
-                    score += 3
 
-                # 部分匹配：低分
-                elif any(part in analysis_text for part in keyword_lower.split() if len(part) > 2):
-                    score += 1
+@app.post("/receipt-jobs")
+async def create_receipt_job(file: UploadFile = File(...)):
+    """非同步上傳發票：存好圖片立即回傳工作ID，之後用 GET /receipt-jobs/{job_id} 查詢結果"""
 
-            category_scores[category] = score
+    try:
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="請上傳圖片檔案")
 
-        # 選擇分數最高的分類
-        if category_scores:
-            best_category = max(category_scores.items(), key=lambda x: x[1])
-            if best_category[1] > 0:  # 有匹配分數
-                return best_category[0]
+        content, content_hash, upload_stats = await read_upload(file)
+        UPLOADS.inc(endpoint='receipt-jobs')
+        job = job_queue.submit(content, content_hash, file.filename)
 
-        return '雜費'  # 預設分類
+        return {
+            "success": True,
+            "message": "發票已收到，AI辨識處理中",
+            **job,
+            "status_url": f"/receipt-jobs/{job['job_id']}",
+            "upload": upload_stats
+        }
 
+    except Exception as e:
+        print(f"❌ 錯誤: {str(e)}")
+        return {
+            "success": False,
+            "error": f"處理失敗: {str(e)}"
+        }
 
-# 建立AI實例
-ai = FreeReceiptAI()
+
+@app.get("/receipt-jobs/{job_id}")
+def get_receipt_job(job_id: str):
+    """查詢發票工作狀態：pending / running / done / failed"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到這個工作")
+
+    return job
 
 
 @app.post("/upload-receipt")
@@ -896,57 +1575,42 @@ async def upload_receipt(file: UploadFile = File(...)):
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="請上傳圖片檔案")
 
-        # 使用臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            file_path = tmp_file.name
+        # 讀進記憶體，直接從記憶體解碼（不另外寫檔）
+        content, content_hash, upload_stats = await read_upload(file)
+        UPLOADS.inc(endpoint='upload-receipt')
+
+        print(f"📁 檔案已接收: {upload_stats['bytes_received']} bytes")
 
-        print(f"📁 檔案已儲存: {file_path}")
+        # AI智能辨識（相同圖片重複上傳時直接命中OCR快取）
+        receipt_data = await ai.process_receipt(content, content_hash)
 
-        # AI智能辨識
-        receipt_data = await ai.process_receipt(file_path)
+        # 多程序後端要再把圖片傳給工作程序一次
+        if OCR_BACKEND == "process" and receipt_data['ocr_source'] == 'easyocr_real':
+            upload_stats['bytes_copied'] += len(content)
 
         # 存入資料庫
         try:
-            conn = sqlite3.connect('receipts.db')
-            cursor = conn.cursor()
+            conn = db.connect()
+            try:
+                cursor = conn.cursor()
 
-            cursor.execute('''
-                INSERT INTO receipts 
-                (photo_path, invoice_number, date, merchant, amount, tax_amount, category, description, ocr_confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file_path,
-                receipt_data['invoice_number'],
-                receipt_data['date'],
-                receipt_data['merchant'],
-                receipt_data['amount'],
-                receipt_data['tax_amount'],
-                receipt_data['category'],
-                f"AI辨識: {receipt_data['merchant']} (信心度: {receipt_data.get('ocr_confidence', 0):.2f})",
-                receipt_data.get('ocr_confidence', 0)
-            ))
-
-            receipt_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+                memo_deltas = {}
+                receipt_id = insert_receipt(cursor, None, receipt_data, memo_deltas)
+                conn.commit()
+                merchant_memo.apply(memo_deltas)
+            finally:
+                conn.close()
 
             print(f"💾 資料已存入資料庫，ID: {receipt_id}")
 
-            # 清理臨時檔案
-            try:
-                os.unlink(file_path)
-            except:
-                pass
-
             return {
                 "success": True,
                 "message": "AI發票辨識完成！",
                 "data": {
                     **receipt_data,
                     "id": receipt_id
-                }
+                },
+                "upload": upload_stats
             }
 
         except Exception as db_error:
@@ -964,22 +1628,112 @@ async def upload_receipt(file: UploadFile = File(...)):
         }
 
 
+@app.post("/upload-receipts")
+async def upload_receipts(files: List[UploadFile] = File(...)):
+    """批次上傳發票：每 UPLOAD_BATCH_CHUNK 張讀進記憶體批次AI辨識後釋放，所有記錄一次交易存檔"""
+
+    results = [{"filename": f.filename, "success": False} for f in files]
+
+    try:
+        print(f"📁 批次收到 {len(files)} 個檔案")
+
+        for start in range(0, len(files), UPLOAD_BATCH_CHUNK):
+            # 讀取這一段的圖片，非圖片檔或太大的檔案直接標記失敗
+            images = []
+            hashes = []
+            positions = []
+            for i in range(start, min(start + UPLOAD_BATCH_CHUNK, len(files))):
+                file = files[i]
+                if not (file.content_type or '').startswith('image/'):
+                    results[i]["error"] = "請上傳圖片檔案"
+                    continue
+                try:
+                    content, content_hash, _ = await read_upload(file)
+                except UploadTooLargeError as e:
+                    results[i]["error"] = str(e)
+                    continue
+                finally:
+                    # 讀完就刪掉 multipart 暫存檔
+                    await file.close()
+                UPLOADS.inc(endpoint='upload-receipts')
+                images.append(content)
+                hashes.append(content_hash)
+                positions.append(i)
+
+            # AI批次辨識；這一段的圖片在下一輪之前釋放
+            receipts = await ai.process_receipts_batch(images, hashes)
+            del images
+
+            for i, receipt_data in zip(positions, receipts):
+                if receipt_data is None:
+                    results[i]["error"] = "無法解碼圖片"
+                elif isinstance(receipt_data, OCRQueueFullError):
+                    results[i]["error"] = str(receipt_data)
+                else:
+                    results[i]["data"] = receipt_data
+
+        # 存入資料庫（單一交易）
+        try:
+            conn = db.connect()
+            try:
+                cursor = conn.cursor()
+
+                memo_deltas = {}
+                for result in results:
+                    if "data" in result:
+                        result["data"]["id"] = insert_receipt(cursor, None, result["data"], memo_deltas)
+                        result["success"] = True
+
+                conn.commit()
+                merchant_memo.apply(memo_deltas)
+            finally:
+                conn.close()
+
+        except Exception as db_error:
+            print(f"資料庫錯誤: {db_error}")
+            return {
+                "success": False,
+                "error": f"資料庫錯誤: {str(db_error)}"
+            }
+
+        succeeded = sum(1 for r in results if r["success"])
+        print(f"💾 批次存入資料庫 {succeeded} 筆")
+
+        return {
+            "success": True,
+            "message": f"批次辨識完成：成功 {succeeded} / {len(files)} 張",
+            "total": len(files),
+            "succeeded": succeeded,
+            "failed": len(files) - succeeded,
+            "results": results
+        }
+
+    except Exception as e:
+        print(f"❌ 錯誤: {str(e)}")
+        return {
+            "success": False,
+            "error": f"處理失敗: {str(e)}"
+        }
+
+
 @app.get("/receipts")
 def get_receipts(limit: int = 50):
     """取得最近的發票記錄"""
     try:
-        conn = sqlite3.connect('receipts.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT id, date, merchant, amount, category, created_at, ocr_confidence
-            FROM receipts 
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (limit,))
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
 
-        receipts = cursor.fetchall()
-        conn.close()
+            cursor.execute('''
+                SELECT id, date, merchant, amount, category, created_at, ocr_confidence
+                FROM receipts 
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (limit,))
+
+            receipts = cursor.fetchall()
+        finally:
+            conn.close()
 
         result = []
         for receipt in receipts:
@@ -999,44 +1753,160 @@ def get_receipts(limit: int = 50):
         return {"receipts": [], "error": str(e)}
 
 
-@app.get("/monthly-report/{year}/{month}")
-def monthly_report(year: int, month: int):
-    """月報表：智能統計"""
+class CategoryCorrection(BaseModel):
+    category: str
+
+
+@app.put("/receipts/{receipt_id}/category")
+def correct_receipt_category(receipt_id: int, correction: CategoryCorrection):
+    """手動更正發票分類，並讓商家分類表記住（更正的權重等於採用門檻，之後同商家直接用這個分類）；
+    更正過的分類重新解析時不會被覆蓋"""
+    category = correction.category.strip()
+    if category not in ai.category_cache.categories:
+        raise HTTPException(status_code=400, detail=f"沒有「{category}」這個分類")
+
+    conn = db.connect()
     try:
-        conn = sqlite3.connect('receipts.db')
         cursor = conn.cursor()
+        cursor.execute('SELECT merchant, category FROM receipts WHERE id = ?', (receipt_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="找不到這張發票")
+
+        merchant, previous = row
+        if previous != category:
+            memo_deltas = {(merchant, previous): -1, (merchant, category): merchant_memo.min_count}
+            cursor.execute('UPDATE receipts SET category = ?, category_corrected = 1 WHERE id = ?',
+                           (category, receipt_id))
+            merchant_memo.record_many(cursor, memo_deltas)
+            conn.commit()
+            # 失敗時由 close() rollback，記憶體還沒動過
+            merchant_memo.apply(memo_deltas)
+    finally:
+        conn.close()
 
-        cursor.execute('''
-            SELECT category, SUM(amount), COUNT(*), AVG(ocr_confidence)
-            FROM receipts 
-            WHERE date LIKE ? 
-            GROUP BY category
-            ORDER BY SUM(amount) DESC
-        ''', (f"{year}-{month:02d}%",))
+    return {"id": receipt_id, "merchant": merchant, "category": category, "previous_category": previous}
 
-        categories = cursor.fetchall()
 
-        cursor.execute('''
-            SELECT SUM(amount), SUM(tax_amount), COUNT(*), AVG(ocr_confidence)
-            FROM receipts 
-            WHERE date LIKE ?
-        ''', (f"{year}-{month:02d}%",))
+REPARSE_FIELDS = ('invoice_number', 'date', 'merchant', 'supplier_id', 'supplier_tax_id', 'amount', 'tax_amount')
+
+
+@app.post("/receipts/reparse")
+def reparse_receipts(chunk_size: int = 500, dry_run: bool = False):
+    """用存檔的原始OCR結果重新解析、分類所有發票（不重跑OCR）
 
-        total = cursor.fetchone()
+    依 receipt_id 分段讀取，每段有變動的發票以 executemany 一次更新；手動更正過的分類保留不動。
+    整批都是同步的資料庫與 CPU 工作，用一般 def 交給執行緒池，不卡住上傳、/health、/metrics
+    """
+    chunk_size = max(1, min(chunk_size, 5000))
+    started = time.perf_counter()
+    summary = {"scanned": 0, "updated": 0, "fields": {}, "engine_versions": {}}
+
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        last_id = 0
+        while True:
+            cursor.execute(f'''
+                SELECT r.id, r.category, r.category_corrected, {', '.join('r.' + f for f in REPARSE_FIELDS)},
+                       o.engine_version, o.source, o.payload
+                FROM receipt_ocr o JOIN receipts r ON r.id = o.receipt_id
+                WHERE o.receipt_id > ?
+                ORDER BY o.receipt_id
+                LIMIT ?
+            ''', (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            memo_deltas = {}
+            for row in rows:
+                receipt_id, category, corrected = row[:3]
+                current = dict(zip(REPARSE_FIELDS, row[3:3 + len(REPARSE_FIELDS)]))
+                engine_version, source, payload = row[3 + len(REPARSE_FIELDS):]
+                summary["scanned"] += 1
+                summary["engine_versions"][engine_version] = summary["engine_versions"].get(engine_version, 0) + 1
+
+                tokens = unpack_ocr_tokens(payload)
+                confidences = [confidence for _, _, confidence in tokens]
+                data = ai._extract({
+                    'text': ''.join(text + '\n' for _, text, _ in tokens),
+                    'confidence': sum(confidences) / len(confidences) if confidences else 0,
+                    'tokens': tokens,
+                    'source': source
+                }, log=False)
+                if corrected:
+                    data['category'] = category
+
+                changed = [f for f in REPARSE_FIELDS if data[f] != current[f]]
+                if data['category'] != category:
+                    changed.append('category')
+                if not changed:
+                    continue
+
+                for field in changed:
+                    summary["fields"][field] = summary["fields"].get(field, 0) + 1
+
+                updates.append((*(data[f] for f in REPARSE_FIELDS), data['category'], receipt_id))
+                for key, delta in (((current['merchant'], category), -1), ((data['merchant'], data['category']), 1)):
+                    memo_deltas[key] = memo_deltas.get(key, 0) + delta
+
+            summary["updated"] += len(updates)
+            if updates and not dry_run:
+                assignments = ', '.join(f"{field} = ?" for field in REPARSE_FIELDS)
+                with DB_SECONDS.time(operation='reparse_update'):
+                    cursor.executemany(f'UPDATE receipts SET {assignments}, category = ? WHERE id = ?', updates)
+                    merchant_memo.record_many(cursor, memo_deltas)
+                    conn.commit()
+                merchant_memo.apply(memo_deltas)
+    finally:
         conn.close()
 
+    summary["dry_run"] = dry_run
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(f"🔁 重新解析 {summary['scanned']} 張發票，更新 {summary['updated']} 張")
+
+    return summary
+
+
+@app.get("/monthly-report/{year}/{month}")
+def monthly_report(year: int, month: int):
+    """月報表：智能統計"""
+    try:
+        period = month_period(year, month)
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+
+            # 讀觸發器維護的月份×分類彙總表（report_agg），只有當月的幾列
+            cursor.execute('''
+                SELECT category, amount_sum, tax_sum, receipt_count, confidence_sum, confidence_count
+                FROM receipt_monthly_agg
+                WHERE period = ?
+                ORDER BY amount_sum DESC
+            ''', (period,))
+
+            categories = cursor.fetchall()
+        finally:
+            conn.close()
+
+        confidence_sum = sum(c[4] for c in categories)
+        confidence_count = sum(c[5] for c in categories)
+
         return {
             "period": f"{year}-{month:02d}",
-            "total_amount": total[0] or 0,
-            "total_tax": total[1] or 0,
-            "total_receipts": total[2] or 0,
-            "avg_confidence": round(total[3] or 0, 2),
+            "total_amount": sum(c[1] for c in categories),
+            "total_tax": sum(c[2] for c in categories),
+            "total_receipts": sum(c[3] for c in categories),
+            "avg_confidence": round(confidence_sum / confidence_count, 2) if confidence_count else 0,
             "by_category": [
                 {
-                    "category": c[0],
+                    "category": c[0] or None,
                     "amount": c[1],
-                    "count": c[2],
-                    "avg_confidence": round(c[3] or 0, 2)
+                    "count": c[3],
+                    "avg_confidence": round(c[4] / c[5], 2) if c[5] else 0
                 }
                 for c in categories
             ]
@@ -1054,6 +1924,426 @@ def monthly_report(year: int, month: int):
         }
 
 
+SUMMARY_GRANULARITIES = ('day', 'week', 'month', 'quarter')
+
+# 一次摘要最多的分桶數（例如 day 約 2.7 年）
+MAX_SUMMARY_BUCKETS = int(os.environ.get("MAX_SUMMARY_BUCKETS", 1000))
+
+# 各粒度的分桶運算式；{x} 為 receipts.date（YYYY-MM-DD）或 receipt_monthly_agg.period（YYYY-MM）
+# week 以星期一的日期為標籤（strftime 的 %w：星期日為 0）
+SUMMARY_BUCKET_SQL = {
+    'day': "substr({x}, 1, 10)",
+    'week': "date({x}, '-' || ((CAST(strftime('%w', {x}) AS INTEGER) + 6) % 7) || ' days')",
+    'month': "substr({x}, 1, 7)",
+    'quarter': "substr({x}, 1, 4) || '-Q' || ((CAST(substr({x}, 6, 2) AS INTEGER) + 2) / 3)",
+}
+
+
+def summary_buckets(start: date, end: date, granularity: str) -> List[str]:
+    """[start, end) 內各分桶的標籤（與 SUMMARY_BUCKET_SQL 相同格式），依時間排序"""
+    if granularity in ('day', 'week'):
+        step = 1 if granularity == 'day' else 7
+        day = start if granularity == 'day' else start - timedelta(days=start.weekday())
+        labels = []
+        while day < end:
+            labels.append(day.isoformat())
+            day += timedelta(days=step)
+        return labels
+
+    labels = []
+    year, month = start.year, start.month
+    while date(year, month, 1) < end:
+        label = f"{year:04d}-{month:02d}" if granularity == 'month' else f"{year:04d}-Q{(month + 2) // 3}"
+        if not labels or labels[-1] != label:
+            labels.append(label)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+def compute_summary(cursor, start: date, end: date, granularity: str) -> Dict:
+    """[start, end) 的總計與各分桶金額，一個 GROUP BY 查詢
+
+    月/季粒度且起訖都是月初時讀 receipt_monthly_agg（每月只有幾列），其他走 receipts 的 date 索引範圍。
+    """
+    labels = summary_buckets(start, end, granularity)
+    if len(labels) > MAX_SUMMARY_BUCKETS:
+        raise ValueError(f"分桶數 {len(labels)} 超過上限 {MAX_SUMMARY_BUCKETS}，請縮小範圍或改用較粗的粒度")
+
+    if granularity in ('month', 'quarter') and start.day == 1 and end.day == 1:
+        cursor.execute(f'''
+            SELECT {SUMMARY_BUCKET_SQL[granularity].format(x='period')}, SUM(amount_sum), SUM(tax_sum),
+                   SUM(receipt_count)
+            FROM receipt_monthly_agg
+            WHERE period >= ? AND period < ?
+            GROUP BY 1
+        ''', (start.isoformat()[:7], end.isoformat()[:7]))
+    else:
+        cursor.execute(f'''
+            SELECT {SUMMARY_BUCKET_SQL[granularity].format(x='date')}, SUM(amount), SUM(tax_amount), COUNT(*)
+            FROM receipts
+            WHERE date >= ? AND date < ?
+            GROUP BY 1
+        ''', (start.isoformat(), end.isoformat()))
+
+    rows = {row[0]: row[1:] for row in cursor.fetchall() if row[0] is not None}
+    buckets = []
+    for label in labels:
+        amount, tax, count = rows.get(label, (0, 0, 0))
+        buckets.append({"period": label, "amount": amount or 0, "tax": tax or 0, "count": count or 0})
+
+    total_expense = sum(bucket["amount"] for bucket in buckets)
+    return {
+        "from": start.isoformat(),
+        "to": (end - timedelta(days=1)).isoformat(),
+        "granularity": granularity,
+        "total_expense": total_expense,
+        "total_tax": sum(bucket["tax"] for bucket in buckets),
+        "total_receipts": sum(bucket["count"] for bucket in buckets),
+        "average_per_period": total_expense / len(buckets) if buckets else 0,
+        "buckets": buckets
+    }
+
+
+def cached_summary(start: date, end: date, granularity: str) -> Dict:
+    """compute_summary 加上已結束期間（end 不晚於今天）的快取"""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        if end > date.today():
+            return compute_summary(cursor, start, end, granularity)
+
+        # 先讀版本再查詢：查詢期間有異動時，下次讀到新版本就會重算
+        key = (start, end, granularity)
+        version = SummaryCache.read_version(cursor)
+        result = summary_cache.get(key, version)
+        if result is None:
+            result = compute_summary(cursor, start, end, granularity)
+            summary_cache.put(key, version, result)
+        return result
+    finally:
+        conn.close()
+
+
+@app.get("/yearly-summary/{year}")
+def yearly_summary(year: int):
+    """年度總結：各月金額與張數（讀月份彙總表，一個查詢）"""
+    try:
+        summary = cached_summary(date(year, 1, 1), date(year + 1, 1, 1), 'month')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"年度報表錯誤: {str(e)}")
+
+    return {
+        "year": year,
+        "total_expense": summary["total_expense"],
+        "total_tax": summary["total_tax"],
+        "total_receipts": summary["total_receipts"],
+        "monthly_breakdown": [
+            {"month": bucket["period"], "amount": bucket["amount"], "count": bucket["count"]}
+            for bucket in summary["buckets"]
+        ],
+        "average_monthly": summary["total_expense"] / 12
+    }
+
+
+@app.get("/summary")
+def period_summary(start: str = Query(..., alias="from", description="起始日 YYYY-MM-DD（含）"),
+                   end: str = Query(..., alias="to", description="結束日 YYYY-MM-DD（含）"),
+                   granularity: str = "month"):
+    """任意日期範圍的摘要，依 day/week/month/quarter 分桶；可以跨年度"""
+    if granularity not in SUMMARY_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity 必須是 {'/'.join(SUMMARY_GRANULARITIES)}")
+    try:
+        first = datetime.strptime(start, '%Y-%m-%d').date()
+        last = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式必須是 YYYY-MM-DD")
+    if last < first:
+        raise HTTPException(status_code=400, detail="結束日不能早於起始日")
+
+    try:
+        # 對外的 to 含當天，內部用半開區間 [first, last + 1天)
+        return cached_summary(first, last + timedelta(days=1), granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"摘要報表錯誤: {str(e)}")
+
+
+class CategoryIn(BaseModel):
+    name: str
+    keywords: List[str] = []
+    account_code: Optional[str] = None
+    tax_deductible: bool = True
+    requires_receipt: bool = True
+    requires_approval: bool = False
+    approval_limit: float = 0
+    description: Optional[str] = None
+
+
+class CategoryUpdate(BaseModel):
+    name: Optional[str] = None
+    keywords: Optional[List[str]] = None
+    account_code: Optional[str] = None
+    tax_deductible: Optional[bool] = None
+    requires_receipt: Optional[bool] = None
+    requires_approval: Optional[bool] = None
+    approval_limit: Optional[float] = None
+    description: Optional[str] = None
+
+
+CATEGORY_COLUMNS = ('id', 'name', 'keywords', 'account_code', 'tax_deductible', 'requires_receipt',
+                    'requires_approval', 'approval_limit', 'description', 'created_at')
+
+
+def category_row(row) -> Dict:
+    category = dict(zip(CATEGORY_COLUMNS, row))
+    category['keywords'] = category['keywords'].split(',') if category['keywords'] else []
+    for flag in ('tax_deductible', 'requires_receipt', 'requires_approval'):
+        category[flag] = bool(category[flag])
+    return category
+
+
+def join_keywords(keywords: List[str]) -> str:
+    """關鍵字以逗號存放：去掉空白與空字串，關鍵字本身不能含逗號"""
+    cleaned = [k.strip() for k in keywords if k.strip()]
+    if any(',' in k for k in cleaned):
+        raise HTTPException(status_code=400, detail="關鍵字不能包含逗號")
+    return ','.join(cleaned)
+
+
+def get_category(cursor, category_id: int) -> Dict:
+    cursor.execute(f"SELECT {', '.join(CATEGORY_COLUMNS)} FROM categories WHERE id = ?", (category_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="找不到這個分類")
+    return category_row(row)
+
+
+@app.get("/categories")
+def list_categories():
+    """分類列表（含關鍵字）"""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(CATEGORY_COLUMNS)} FROM categories ORDER BY id")
+        categories = [category_row(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    return {"categories": categories, "version": ai.category_cache.version}
+
+
+@app.post("/categories", status_code=201)
+def create_category(category: CategoryIn):
+    """新增分類，立即生效（不需要重啟）"""
+    name = category.name.strip()
+    if not name:
+        raise HTTPException(status_code=400, detail="分類名稱不能空白")
+
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM categories WHERE name = ?', (name,))
+        if cursor.fetchone():
+            raise HTTPException(status_code=409, detail=f"分類「{name}」已存在")
+
+        cursor.execute('''
+            INSERT INTO categories
+            (name, keywords, account_code, tax_deductible, requires_receipt, requires_approval, approval_limit,
+             description)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name, join_keywords(category.keywords), category.account_code, category.tax_deductible,
+              category.requires_receipt, category.requires_approval, category.approval_limit, category.description))
+        conn.commit()
+
+        created = get_category(cursor, cursor.lastrowid)
+    finally:
+        conn.close()
+
+    ai.category_cache.refresh()
+    return {"category": created, "version": ai.category_cache.version}
+
+
+@app.put("/categories/{category_id}")
+def update_category(category_id: int, changes: CategoryUpdate):
+    """修改分類（只更新有給的欄位），立即生效"""
+    fields = changes.model_dump(exclude_unset=True)
+    if 'name' in fields:
+        fields['name'] = (fields['name'] or '').strip()
+        if not fields['name']:
+            raise HTTPException(status_code=400, detail="分類名稱不能空白")
+    if 'keywords' in fields:
+        fields['keywords'] = join_keywords(fields['keywords'] or [])
+
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        get_category(cursor, category_id)
+
+        if 'name' in fields:
+            cursor.execute('SELECT 1 FROM categories WHERE name = ? AND id != ?', (fields['name'], category_id))
+            if cursor.fetchone():
+                raise HTTPException(status_code=409, detail=f"分類「{fields['name']}」已存在")
+
+        if fields:
+            assignments = ', '.join(f"{column} = ?" for column in fields)
+            cursor.execute(f'UPDATE categories SET {assignments} WHERE id = ?', (*fields.values(), category_id))
+            conn.commit()
+
+        updated = get_category(cursor, category_id)
+    finally:
+        conn.close()
+
+    ai.category_cache.refresh()
+    return {"category": updated, "version": ai.category_cache.version}
+
+
+@app.delete("/categories/{category_id}")
+def delete_category(category_id: int):
+    """刪除分類（既有發票的分類名稱不會變動），立即生效"""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        deleted = get_category(cursor, category_id)
+        cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    ai.category_cache.refresh()
+    return {"deleted": deleted, "version": ai.category_cache.version}
+
+
+class SupplierIn(BaseModel):
+    name: str
+    tax_id: Optional[str] = None
+    code: Optional[str] = None
+    contact_person: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    address: Optional[str] = None
+    default_category: Optional[str] = None
+    status: str = 'active'
+
+
+class SupplierUpdate(BaseModel):
+    name: Optional[str] = None
+    tax_id: Optional[str] = None
+    code: Optional[str] = None
+    contact_person: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    address: Optional[str] = None
+    default_category: Optional[str] = None
+    status: Optional[str] = None
+
+
+SUPPLIER_COLUMNS = ('id', 'code', 'name', 'tax_id', 'contact_person', 'phone', 'email', 'address',
+                    'default_category', 'status', 'created_at')
+
+
+def get_supplier(cursor, supplier_id: int) -> Dict:
+    cursor.execute(f"SELECT {', '.join(SUPPLIER_COLUMNS)} FROM suppliers WHERE id = ?", (supplier_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="找不到這個供應商")
+    return dict(zip(SUPPLIER_COLUMNS, row))
+
+
+def check_supplier_fields(cursor, fields: Dict, supplier_id: int = 0):
+    """名稱不能空白，編號不可重複，統編要通過檢查碼且不可重複，預設分類必須存在"""
+    if 'name' in fields:
+        fields['name'] = (fields['name'] or '').strip()
+        if not fields['name']:
+            raise HTTPException(status_code=400, detail="供應商名稱不能空白")
+
+    if fields.get('code'):
+        cursor.execute('SELECT 1 FROM suppliers WHERE code = ? AND id != ?', (fields['code'], supplier_id))
+        if cursor.fetchone():
+            raise HTTPException(status_code=409, detail=f"供應商編號 {fields['code']} 已存在")
+
+    if fields.get('tax_id'):
+        fields['tax_id'] = fields['tax_id'].strip()
+        if not receipt_parser.valid_tax_id(fields['tax_id']):
+            raise HTTPException(status_code=400, detail=f"統一編號 {fields['tax_id']} 檢查碼錯誤")
+        cursor.execute('SELECT id FROM suppliers WHERE tax_id = ? AND id != ?', (fields['tax_id'], supplier_id))
+        if cursor.fetchone():
+            raise HTTPException(status_code=409, detail=f"統一編號 {fields['tax_id']} 已有供應商")
+
+    if fields.get('default_category') and fields['default_category'] not in ai.categories:
+        raise HTTPException(status_code=400, detail=f"分類「{fields['default_category']}」不存在")
+
+
+@app.get("/suppliers")
+def list_suppliers():
+    """供應商列表"""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(SUPPLIER_COLUMNS)} FROM suppliers ORDER BY id")
+        suppliers = [dict(zip(SUPPLIER_COLUMNS, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    return {"suppliers": suppliers}
+
+
+@app.post("/suppliers", status_code=201)
+def create_supplier(supplier: SupplierIn):
+    """新增供應商，立即加入統編索引"""
+    fields = supplier.model_dump()
+
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        check_supplier_fields(cursor, fields)
+
+        columns = ', '.join(fields)
+        try:
+            cursor.execute(f'INSERT INTO suppliers ({columns}) VALUES ({", ".join("?" * len(fields))})',
+                           tuple(fields.values()))
+        except sqlite3.IntegrityError as e:
+            # 檢查之後被同時寫入的請求搶先
+            raise HTTPException(status_code=409, detail=f"供應商資料衝突: {e}")
+        conn.commit()
+
+        created = get_supplier(cursor, cursor.lastrowid)
+    finally:
+        conn.close()
+
+    supplier_index.put(created)
+    return {"supplier": created}
+
+
+@app.put("/suppliers/{supplier_id}")
+def update_supplier(supplier_id: int, changes: SupplierUpdate):
+    """修改供應商（只更新有給的欄位），立即更新統編索引"""
+    fields = changes.model_dump(exclude_unset=True)
+
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        get_supplier(cursor, supplier_id)
+        check_supplier_fields(cursor, fields, supplier_id)
+
+        if fields:
+            assignments = ', '.join(f"{column} = ?" for column in fields)
+            try:
+                cursor.execute(f'UPDATE suppliers SET {assignments} WHERE id = ?', (*fields.values(), supplier_id))
+            except sqlite3.IntegrityError as e:
+                raise HTTPException(status_code=409, detail=f"供應商資料衝突: {e}")
+            conn.commit()
+
+        updated = get_supplier(cursor, supplier_id)
+    finally:
+        conn.close()
+
+    supplier_index.put(updated)
+    return {"supplier": updated}
+
+
 @app.get("/", response_class=HTMLResponse)
 def main_page():
     """主頁面：AI智能記帳界面"""
@@ -1350,19 +2640,57 @@ def main_page():
     """
 
 
+# HTTP 請求耗時
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """每個請求的耗時，依路由樣板（/receipts/{receipt_id}/category）分組"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                             route=route.path if route else 'unmatched', status=status)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus 文字格式的監控指標"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # 健康檢查端點
 @app.get("/health")
 def health_check():
-    """健康檢查"""
-    return {
-        "status": "ok",
-        "message": "AI智能記帳系統運行正常！",
+    """健康檢查：模型載入中回傳 503，讓負載平衡器等模型暖機完成才導流"""
+    body = {
+        "status": ai.status,
+        "message": "AI模型載入中..." if ai.status == 'loading' else "AI智能記帳系統運行正常！",
         "features": {
             "easyocr": "✅ 已設定" if ai.ocr_available else "⚠️ 未設定",
+            "einvoice_qr": "✅ 已啟用" if QR_FAST_PATH else "⚠️ 已關閉",
             "mode": "免費版本 (EasyOCR)"
-        }
+        },
+        "model_load": ai.load_timings,
+        "ocr_queue": ocr_executor.stats(),
+        "ocr_cache": ocr_cache.stats(),
+        "categories": ai.category_cache.stats(),
+        "suppliers": supplier_index.stats(),
+        "merchant_memo": merchant_memo.stats(),
+        "summary_cache": summary_cache.stats(),
+        "db": db.stats(),
+        "fast_path": ai.fast_path_stats(),
+        "jobs": job_queue.stats()
     }
 
+    if ai.status == 'loading':
+        return JSONResponse(status_code=503, content=body)
+
+    return body
+
 
 # 啟動應用
 if __name__ == "__main__":
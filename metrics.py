@@ -0,0 +1,159 @@
+# metrics.py - Prometheus 文字格式的監控指標
+"""不依賴 prometheus_client 的最小實作：Counter、Histogram，以及抓取時才讀值的 Callback
+（直接沿用各元件既有的 stats()，不必在熱路徑上重複計數）。
+
+    UPLOADS = Counter('receipt_uploads_total', '上傳張數', ('endpoint',))
+    UPLOADS.inc(endpoint='upload-receipt')
+
+    with STAGE_SECONDS.time(stage='db_insert'):
+        ...
+
+render() 輸出 Prometheus 文字格式（text/plain; version=0.0.4），給 GET /metrics 使用。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# 秒為單位的預設區間：1ms ~ 2分鐘（OCR 在CPU上可能要數十秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry: List = []
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} 需要標籤 {self.labels}，收到 {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labels:
+            values = {(): 0}
+        return self._header() + [f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+                                 for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 標籤 → [各區間計數..., 總和, 次數]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """量測 with 區塊的耗時（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+
+        lines = self._header()
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (_number(bound),))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+
+class Callback(_Metric):
+    """抓取時才呼叫 callback 取值；回傳數字，或 {標籤值tuple: 數字}"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable, type: str = 'gauge',
+                 labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.type = type
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+
+        values = value if isinstance(value, dict) else {(): value}
+        return self._header() + [f"{self.name}{_labels(self.labels, tuple(map(str, key)))} {_number(v)}"
+                                 for key, v in sorted(values.items())]
+
+
+def render() -> str:
+    """所有指標的 Prometheus 文字格式"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
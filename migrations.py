@@ -0,0 +1,774 @@
+# migrations.py - 資料庫 schema 版本遷移
+"""以 PRAGMA user_version 記錄 receipts.db 的 schema 版本，啟動時只套用還沒執行過的遷移：
+
+* schema 已是最新版時只讀一次 user_version，不再逐一 CREATE TABLE IF NOT EXISTS、比對欄位、檢查預設資料
+* 需要遷移時先 BEGIN EXCLUSIVE，拿到鎖後重讀版本（其他工作程序可能已經做完），
+  所有待執行的遷移、預設資料與新的 user_version 在同一個交易內寫入，失敗就整個 rollback
+* 多個工作程序同時啟動時，後到的會等鎖（MIGRATION_LOCK_TIMEOUT_MS），拿到鎖時版本已是最新就直接結束
+
+遷移依版本號排序，已發佈的遷移不能修改，schema 變更一律新增一個版本：
+
+    @migration(11, '說明')
+    def _add_something(cursor):
+        ...
+
+版本 1 是加入遷移機制之前的基準 schema；在 user_version 為 0 的舊資料庫上也能安全執行，
+所以每個遷移都寫成可重複執行（IF NOT EXISTS、先查欄位再 ALTER、資料表為空才寫預設資料）。
+"""
+import os
+from typing import Callable, List, Tuple
+
+import db
+import report_agg
+
+# 等待其他程序遷移的時間上限（建索引可能要數秒，比一般寫入的 busy_timeout 長）
+MIGRATION_LOCK_TIMEOUT_MS = int(os.environ.get("DB_MIGRATION_TIMEOUT_MS", 120000))
+
+# (版本, 說明, 函式)，依版本排序
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+# receipts 的索引（遷移 8 與 benchmarks/bench_reports.py 共用）
+RECEIPT_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(date)',
+    'CREATE INDEX IF NOT EXISTS idx_receipts_category_date ON receipts(category, date)',
+    'CREATE INDEX IF NOT EXISTS idx_receipts_created_at ON receipts(created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_receipts_invoice_number ON receipts(invoice_number)',
+)
+
+
+def migration(version: int, description: str):
+    """註冊一個遷移"""
+    def register(function: Callable) -> Callable:
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"遷移版本重複: {version}")
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return function
+    return register
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> List[Tuple[int, str]]:
+    """把資料庫遷移到最新版本，回傳這次套用的 [(版本, 說明)]（已是最新版時為空）"""
+    if current_version(conn) >= latest_version():
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute(f'PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}')
+    try:
+        conn.execute('BEGIN EXCLUSIVE')
+        try:
+            # 等鎖的期間其他程序可能已經遷移完
+            version = current_version(conn)
+            pending = [(v, description, function) for v, description, function in MIGRATIONS if v > version]
+            cursor = conn.cursor()
+            for v, description, function in pending:
+                print(f"🔧 資料庫遷移 {v}: {description}")
+                function(cursor)
+            if pending:
+                # PRAGMA 不接受參數綁定；版本號是程式內的整數
+                cursor.execute(f'PRAGMA user_version = {pending[-1][0]}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute(f'PRAGMA busy_timeout = {db.BUSY_TIMEOUT_MS}')
+
+    return [(v, description) for v, description, _ in pending]
+
+
+def _add_columns(cursor, table: str, columns: List[Tuple[str, str]]):
+    """補上舊資料庫缺少的欄位"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {column[1] for column in cursor.fetchall()}
+
+    for column_name, column_def in columns:
+        if column_name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column_name} {column_def}')
+            print(f"✅ {table} 添加 {column_name} 欄位")
+
+
+@migration(1, '基準 schema：公司、員工、部門、專案、供應商、客戶、會計科目、分類、發票等 16 張表與預設資料')
+def _baseline(cursor):
+    # 1. 公司基本資料表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS company (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            tax_id TEXT UNIQUE,
+            address TEXT,
+            phone TEXT,
+            email TEXT,
+            website TEXT,
+            industry TEXT,
+            founded_date TEXT,
+            capital REAL DEFAULT 0,
+            fiscal_year_start INTEGER DEFAULT 1,
+            accounting_method TEXT DEFAULT 'accrual',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 2. 員工管理表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id TEXT UNIQUE,
+            name TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            department TEXT,
+            position TEXT,
+            salary REAL DEFAULT 0,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT DEFAULT 'active',
+            expense_limit REAL DEFAULT 5000,
+            can_approve BOOLEAN DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 3. 部門/費用中心表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS departments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            manager_id INTEGER REFERENCES employees(id),
+            budget_monthly REAL DEFAULT 0,
+            budget_annual REAL DEFAULT 0,
+            description TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 4. 專案管理表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            client_name TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            budget REAL DEFAULT 0,
+            actual_cost REAL DEFAULT 0,
+            status TEXT DEFAULT 'active',
+            manager_id INTEGER REFERENCES employees(id),
+            description TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 5. 供應商管理表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,
+            name TEXT NOT NULL,
+            tax_id TEXT,
+            contact_person TEXT,
+            phone TEXT,
+            email TEXT,
+            address TEXT,
+            payment_terms TEXT DEFAULT 'NET30',
+            credit_limit REAL DEFAULT 0,
+            bank_account TEXT,
+            bank_name TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 6. 客戶管理表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,
+            name TEXT NOT NULL,
+            tax_id TEXT,
+            contact_person TEXT,
+            phone TEXT,
+            email TEXT,
+            address TEXT,
+            payment_terms TEXT DEFAULT 'NET30',
+            credit_limit REAL DEFAULT 0,
+            status TEXT DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 7. 會計科目表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chart_of_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_code TEXT UNIQUE NOT NULL,
+            account_name TEXT NOT NULL,
+            account_type TEXT NOT NULL,
+            parent_code TEXT,
+            level INTEGER DEFAULT 1,
+            is_active BOOLEAN DEFAULT 1,
+            description TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 8. 分類表（支出分類）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            keywords TEXT,
+            account_code TEXT REFERENCES chart_of_accounts(account_code),
+            tax_deductible BOOLEAN DEFAULT 1,
+            requires_receipt BOOLEAN DEFAULT 1,
+            requires_approval BOOLEAN DEFAULT 0,
+            approval_limit REAL DEFAULT 0,
+            description TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 9. 發票記錄表（主要交易表）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receipt_type TEXT DEFAULT 'expense',
+            photo_path TEXT,
+            invoice_number TEXT,
+            date TEXT NOT NULL,
+            due_date TEXT,
+
+            -- 商家/供應商資訊
+            merchant TEXT,
+            supplier_id INTEGER REFERENCES suppliers(id),
+            supplier_tax_id TEXT,
+
+            -- 金額資訊
+            amount REAL DEFAULT 0,
+            tax_amount REAL DEFAULT 0,
+            tax_rate REAL DEFAULT 0.05,
+            net_amount REAL DEFAULT 0,
+
+            -- 分類和會計
+            category TEXT DEFAULT '雜費',
+            account_code TEXT REFERENCES chart_of_accounts(account_code),
+            department_id INTEGER REFERENCES departments(id),
+            project_id INTEGER REFERENCES projects(id),
+
+            -- 審核狀態
+            status TEXT DEFAULT 'pending',
+            submitted_by INTEGER REFERENCES employees(id),
+            approved_by INTEGER REFERENCES employees(id),
+            approved_at TEXT,
+
+            -- AI 和處理資訊
+            description TEXT,
+            notes TEXT,
+            is_business BOOLEAN DEFAULT 1,
+            is_recurring BOOLEAN DEFAULT 0,
+            recurring_frequency TEXT,
+            ocr_confidence REAL DEFAULT 0,
+
+            -- 付款資訊
+            payment_method TEXT,
+            payment_status TEXT DEFAULT 'unpaid',
+            paid_date TEXT,
+            paid_amount REAL DEFAULT 0,
+
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 10. 銀行帳戶表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bank_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_name TEXT NOT NULL,
+            bank_name TEXT NOT NULL,
+            account_number TEXT,
+            account_type TEXT DEFAULT 'checking',
+            currency TEXT DEFAULT 'TWD',
+            opening_balance REAL DEFAULT 0,
+            current_balance REAL DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 11. 銀行交易記錄表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bank_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bank_account_id INTEGER REFERENCES bank_accounts(id),
+            transaction_date TEXT NOT NULL,
+            description TEXT,
+            reference_number TEXT,
+            debit_amount REAL DEFAULT 0,
+            credit_amount REAL DEFAULT 0,
+            balance REAL DEFAULT 0,
+            category TEXT,
+            receipt_id INTEGER REFERENCES receipts(id),
+            reconciled BOOLEAN DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 12. 預算管理表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            budget_year INTEGER NOT NULL,
+            budget_month INTEGER,
+            department_id INTEGER REFERENCES departments(id),
+            project_id INTEGER REFERENCES projects(id),
+            category_id INTEGER REFERENCES categories(id),
+            budgeted_amount REAL DEFAULT 0,
+            actual_amount REAL DEFAULT 0,
+            variance_amount REAL DEFAULT 0,
+            variance_percentage REAL DEFAULT 0,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 13. 報銷申請表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expense_claims (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            claim_number TEXT UNIQUE,
+            employee_id INTEGER REFERENCES employees(id),
+            claim_date TEXT NOT NULL,
+            total_amount REAL DEFAULT 0,
+            status TEXT DEFAULT 'draft',
+            submitted_date TEXT,
+            approved_date TEXT,
+            approved_by INTEGER REFERENCES employees(id),
+            paid_date TEXT,
+            purpose TEXT,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 14. 報銷明細表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expense_claim_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            claim_id INTEGER REFERENCES expense_claims(id),
+            receipt_id INTEGER REFERENCES receipts(id),
+            expense_date TEXT NOT NULL,
+            description TEXT,
+            amount REAL DEFAULT 0,
+            category TEXT,
+            billable_to_client BOOLEAN DEFAULT 0,
+            client_id INTEGER REFERENCES customers(id),
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 15. 發票開立表（銷項）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoices_issued (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number TEXT UNIQUE NOT NULL,
+            customer_id INTEGER REFERENCES customers(id),
+            invoice_date TEXT NOT NULL,
+            due_date TEXT,
+            subtotal REAL DEFAULT 0,
+            tax_amount REAL DEFAULT 0,
+            total_amount REAL DEFAULT 0,
+            status TEXT DEFAULT 'draft',
+            paid_amount REAL DEFAULT 0,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 16. 稅務記錄表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tax_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tax_year INTEGER NOT NULL,
+            tax_quarter INTEGER,
+            tax_type TEXT NOT NULL,
+            taxable_amount REAL DEFAULT 0,
+            tax_amount REAL DEFAULT 0,
+            tax_rate REAL DEFAULT 0,
+            status TEXT DEFAULT 'calculated',
+            filed_date TEXT,
+            paid_date TEXT,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 加入遷移機制之前的舊資料庫可能缺少的欄位
+    _add_columns(cursor, 'receipts', [
+        ('ocr_confidence', 'REAL DEFAULT 0'),
+        ('department_id', 'INTEGER'),
+        ('project_id', 'INTEGER'),
+        ('supplier_id', 'INTEGER'),
+        ('status', 'TEXT DEFAULT "pending"'),
+        ('payment_status', 'TEXT DEFAULT "unpaid"')
+    ])
+
+    # 更早的分類表只有 name/keywords/tax_deductible
+    _add_columns(cursor, 'categories', [
+        ('account_code', 'TEXT'),
+        ('requires_receipt', 'BOOLEAN DEFAULT 1'),
+        ('requires_approval', 'BOOLEAN DEFAULT 0'),
+        ('approval_limit', 'REAL DEFAULT 0'),
+        ('description', 'TEXT')
+    ])
+
+    _seed_defaults(cursor)
+
+
+def _seed_defaults(cursor):
+    """預設會計科目、分類、部門、管理員、公司與銀行帳戶（只寫入空的資料表）"""
+    # 插入預設會計科目
+    cursor.execute('SELECT COUNT(*) FROM chart_of_accounts')
+    if cursor.fetchone()[0] == 0:
+        accounts = [
+            # 資產類
+            ('1000', '流動資產', 'Assets', None, 1),
+            ('1100', '現金及約當現金', 'Assets', '1000', 2),
+            ('1110', '庫存現金', 'Assets', '1100', 3),
+            ('1120', '銀行存款', 'Assets', '1100', 3),
+            ('1200', '應收帳款', 'Assets', '1000', 2),
+            ('1300', '存貨', 'Assets', '1000', 2),
+            ('1500', '固定資產', 'Assets', None, 1),
+            ('1510', '設備', 'Assets', '1500', 2),
+            ('1520', '累計折舊', 'Assets', '1500', 2),
+
+            # 負債類
+            ('2000', '流動負債', 'Liabilities', None, 1),
+            ('2100', '應付帳款', 'Liabilities', '2000', 2),
+            ('2200', '應付薪資', 'Liabilities', '2000', 2),
+            ('2300', '應付稅款', 'Liabilities', '2000', 2),
+
+            # 權益類
+            ('3000', '業主權益', 'Equity', None, 1),
+            ('3100', '股本', 'Equity', '3000', 2),
+            ('3200', '保留盈餘', 'Equity', '3000', 2),
+
+            # 收入類
+            ('4000', '營業收入', 'Revenue', None, 1),
+            ('4100', '銷貨收入', 'Revenue', '4000', 2),
+            ('4200', '服務收入', 'Revenue', '4000', 2),
+
+            # 費用類
+            ('5000', '營業費用', 'Expenses', None, 1),
+            ('5100', '銷貨成本', 'Expenses', '5000', 2),
+            ('5200', '薪資費用', 'Expenses', '5000', 2),
+            ('5300', '租金費用', 'Expenses', '5000', 2),
+            ('5400', '辦公費用', 'Expenses', '5000', 2),
+            ('5500', '差旅費', 'Expenses', '5000', 2),
+            ('5600', '餐費', 'Expenses', '5000', 2),
+            ('5700', '交通費', 'Expenses', '5000', 2),
+            ('5800', '軟體費用', 'Expenses', '5000', 2),
+            ('5900', '雜項費用', 'Expenses', '5000', 2),
+        ]
+
+        for code, name, acc_type, parent, level in accounts:
+            cursor.execute('''
+                INSERT INTO chart_of_accounts (account_code, account_name, account_type, parent_code, level)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (code, name, acc_type, parent, level))
+
+        print("✅ 會計科目建立完成")
+
+    # 插入預設分類（連結會計科目）
+    cursor.execute('SELECT COUNT(*) FROM categories')
+    if cursor.fetchone()[0] == 0:
+        categories = [
+            ('餐費', '餐廳,小吃,咖啡,便當,火鍋,燒烤,飲料,麥當勞,肯德基,星巴克,85度C', '5600', True, True, False,
+             1000),
+            ('交通費', '加油,停車,高鐵,計程車,捷運,公車,機票,台鐵,客運,Uber', '5700', True, True, False, 1000),
+            ('辦公用品', '文具,紙張,印表機,電腦,筆,資料夾,誠品,金石堂', '5400', True, True, False, 2000),
+            ('軟體服務', '訂閱,SaaS,Office,Adobe,Google,AWS,Microsoft,Apple', '5800', True, True, True, 5000),
+            ('設備採購', '電腦,螢幕,鍵盤,滑鼠,椅子,桌子,3C,燦坤,全國電子', '1510', True, True, True, 10000),
+            ('購物', '百貨,量販,家樂福,全聯,好市多,大潤發,購物', '5900', True, True, False, 3000),
+            ('醫療費用', '藥局,醫院,診所,健保,醫療,康是美,屈臣氏', '5900', True, True, False, 2000),
+            ('娛樂費用', '電影,KTV,遊戲,娛樂,威秀,國賓', '5900', False, True, False, 1000),
+            ('租金水電', '水電,電話,網路,房租,租金', '5300', True, True, False, 0),
+            ('薪資費用', '薪水,薪資,獎金,勞保,健保', '5200', True, False, True, 0),
+            ('差旅費用', '出差,住宿,飯店,旅館', '5500', True, True, True, 5000),
+            ('銀行手續費', '銀行,手續費,匯款,轉帳', '5900', True, False, False, 0),
+            ('雜項費用', '清潔,維修,郵資,快遞', '5900', True, True, False, 1000)
+        ]
+
+        for name, keywords, acc_code, deductible, receipt_req, approval_req, approval_limit in categories:
+            cursor.execute('''
+                INSERT INTO categories 
+                (name, keywords, account_code, tax_deductible, requires_receipt, requires_approval, approval_limit)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (name, keywords, acc_code, deductible, receipt_req, approval_req, approval_limit))
+
+        print("✅ 支出分類建立完成")
+
+    # 插入預設部門
+    cursor.execute('SELECT COUNT(*) FROM departments')
+    if cursor.fetchone()[0] == 0:
+        departments = [
+            ('ADMIN', '行政管理部', 50000, 600000),
+            ('SALES', '業務部', 80000, 960000),
+            ('TECH', '技術部', 100000, 1200000),
+            ('MKT', '行銷部', 60000, 720000),
+            ('FIN', '財務部', 30000, 360000),
+            ('HR', '人力資源部', 40000, 480000)
+        ]
+
+        for code, name, monthly_budget, annual_budget in departments:
+            cursor.execute('''
+                INSERT INTO departments (code, name, budget_monthly, budget_annual)
+                VALUES (?, ?, ?, ?)
+            ''', (code, name, monthly_budget, annual_budget))
+
+        print("✅ 部門建立完成")
+
+    # 插入預設員工（系統管理員）
+    cursor.execute('SELECT COUNT(*) FROM employees')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO employees 
+            (employee_id, name, email, department, position, salary, expense_limit, can_approve, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ('ADMIN001', '系統管理員', 'admin@company.com', 'ADMIN', '系統管理員', 0, 999999, True, 'active'))
+
+        print("✅ 系統管理員建立完成")
+
+    # 插入公司基本資料
+    cursor.execute('SELECT COUNT(*) FROM company')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO company 
+            (name, tax_id, address, phone, email, industry, capital, fiscal_year_start)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ('我的公司', '12345678', '台北市信義區', '02-12345678',
+              'info@mycompany.com', '軟體開發', 1000000, 1))
+
+        print("✅ 公司基本資料建立完成")
+
+    # 插入預設銀行帳戶
+    cursor.execute('SELECT COUNT(*) FROM bank_accounts')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO bank_accounts 
+            (account_name, bank_name, account_number, account_type, opening_balance, current_balance)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', ('公司往來帳戶', '第一銀行', '123-456-789012', 'checking', 1000000, 1000000))
+
+        print("✅ 銀行帳戶建立完成")
+
+
+@migration(2, 'OCR結果快取表（以圖片內容雜湊為鍵）')
+def _ocr_cache(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            content_hash TEXT PRIMARY KEY,
+            text TEXT,
+            confidences TEXT,
+            boxes TEXT,
+            engine_version TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used_at)')
+
+
+@migration(3, '發票處理工作表（非同步上傳）')
+def _receipt_jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipt_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending',
+            filename TEXT,
+            image_path TEXT,
+            content_hash TEXT,
+            receipt_id INTEGER REFERENCES receipts(id),
+            result TEXT,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipt_jobs_status ON receipt_jobs(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipt_jobs_hash ON receipt_jobs(content_hash)')
+
+
+@migration(4, '系統資訊表與分類版本觸發器')
+def _app_meta(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('categories_version', 0)")
+
+    # 分類有任何異動（包括直接改資料庫）就遞增版本，讓各程序的分類快取重建
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_version_{event.lower()}
+            AFTER {event} ON categories
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'categories_version';
+            END
+        ''')
+
+
+@migration(5, '供應商統編索引與預設分類')
+def _supplier_tax_id(cursor):
+    _add_columns(cursor, 'receipts', [('supplier_tax_id', 'TEXT')])
+    _add_columns(cursor, 'suppliers', [('default_category', 'TEXT')])
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_suppliers_tax_id ON suppliers(tax_id)')
+
+
+@migration(6, '商家→分類頻率表（新增發票與手動更正時累加）')
+def _merchant_categories(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS merchant_categories (
+            merchant TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (merchant, category)
+        )
+    ''')
+
+    # 第一次建立時從歷史發票統計
+    cursor.execute('SELECT COUNT(*) FROM merchant_categories')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO merchant_categories (merchant, category, count)
+            SELECT merchant, category, COUNT(*) FROM receipts
+            WHERE merchant IS NOT NULL AND merchant NOT IN ('', '未知商家') AND category IS NOT NULL
+            GROUP BY merchant, category
+        ''')
+
+
+@migration(7, '發票的原始OCR結果與手動更正分類旗標')
+def _receipt_ocr(cursor):
+    # zlib壓縮的辨識結果，解析或分類改版時可以重新解析而不用重跑OCR
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipt_ocr (
+            receipt_id INTEGER PRIMARY KEY,
+            engine_version TEXT NOT NULL,
+            source TEXT,
+            token_count INTEGER DEFAULT 0,
+            payload BLOB NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (receipt_id) REFERENCES receipts (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_receipts_delete_ocr
+        AFTER DELETE ON receipts
+        BEGIN
+            DELETE FROM receipt_ocr WHERE receipt_id = OLD.id;
+        END
+    ''')
+
+    _add_columns(cursor, 'receipts', [('category_corrected', 'INTEGER DEFAULT 0')])
+
+
+@migration(8, 'receipts 的日期、分類+日期、建立時間、發票號碼索引')
+def _receipt_indexes(cursor):
+    # 報表以 date 範圍查詢、列表以 created_at 排序、重複發票以 invoice_number 查找
+    for index_sql in RECEIPT_INDEXES:
+        cursor.execute(index_sql)
+
+
+@migration(9, '月份×分類發票彙總表（由觸發器逐筆維護）')
+def _receipt_monthly_agg(cursor):
+    # 報表直接讀彙總表；分類為 NULL 的發票存成空字串（主鍵欄位不能用 NULL 比對）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipt_monthly_agg (
+            period TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_sum REAL NOT NULL DEFAULT 0,
+            tax_sum REAL NOT NULL DEFAULT 0,
+            receipt_count INTEGER NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0,
+            confidence_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, category)
+        ) WITHOUT ROWID
+    ''')
+
+    add = '''
+        INSERT INTO receipt_monthly_agg
+            (period, category, amount_sum, tax_sum, receipt_count, confidence_sum, confidence_count)
+        VALUES (substr(NEW.date, 1, 7), IFNULL(NEW.category, ''), IFNULL(NEW.amount, 0), IFNULL(NEW.tax_amount, 0),
+                1, IFNULL(NEW.ocr_confidence, 0), NEW.ocr_confidence IS NOT NULL)
+        ON CONFLICT (period, category) DO UPDATE SET
+            amount_sum = amount_sum + excluded.amount_sum,
+            tax_sum = tax_sum + excluded.tax_sum,
+            receipt_count = receipt_count + 1,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            confidence_count = confidence_count + excluded.confidence_count;
+    '''
+    subtract = '''
+        UPDATE receipt_monthly_agg SET
+            amount_sum = amount_sum - IFNULL(OLD.amount, 0),
+            tax_sum = tax_sum - IFNULL(OLD.tax_amount, 0),
+            receipt_count = receipt_count - 1,
+            confidence_sum = confidence_sum - IFNULL(OLD.ocr_confidence, 0),
+            confidence_count = confidence_count - (OLD.ocr_confidence IS NOT NULL)
+        WHERE period = substr(OLD.date, 1, 7) AND category = IFNULL(OLD.category, '');
+        DELETE FROM receipt_monthly_agg
+        WHERE period = substr(OLD.date, 1, 7) AND category = IFNULL(OLD.category, '') AND receipt_count <= 0;
+    '''
+    triggers = (
+        ('insert', 'AFTER INSERT ON receipts', add),
+        ('update', 'AFTER UPDATE OF date, category, amount, tax_amount, ocr_confidence ON receipts', subtract + add),
+        ('delete', 'AFTER DELETE ON receipts', subtract),
+    )
+    for name, event, body in triggers:
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_receipts_agg_{name} {event} BEGIN {body} END')
+
+    report_agg.rebuild(cursor)
+
+
+@migration(10, '過去日期的發票異動計數（已結束期間的摘要快取失效用）')
+def _receipts_history_version(cursor):
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('receipts_history_version', 0)")
+
+    # 只有日期在今天以前的發票異動才遞增；今天新增的發票不影響已結束期間的快取
+    past = "date('now', 'localtime')"
+    triggers = (
+        ('insert', 'AFTER INSERT ON receipts', f'NEW.date < {past}'),
+        ('update', 'AFTER UPDATE OF date, amount, tax_amount ON receipts', f'OLD.date < {past} OR NEW.date < {past}'),
+        ('delete', 'AFTER DELETE ON receipts', f'OLD.date < {past}'),
+    )
+    for name, event, condition in triggers:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_receipts_history_{name}
+            {event} WHEN {condition}
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'receipts_history_version';
+            END
+        ''')
+
+
+@migration(11, '發票工作的執行者與租約（多個程序同時執行時只接手租約過期的工作）')
+def _receipt_job_lease(cursor):
+    # lease_until 為 Unix 時間（秒），執行中的程序定期延長
+    _add_columns(cursor, 'receipt_jobs', [('owner', 'TEXT'), ('lease_until', 'REAL')])
@@ -0,0 +1,215 @@
+# ocr_preprocess.py - 發票圖片前處理（OpenCV）
+"""OCR 前處理流程：EXIF轉正 → 灰階 → 裁出發票 → 校正歪斜 → 依字高縮放
+
+每一步都可以用 OCR_PREPROCESS 環境變數開關（逗號分隔，"none" 表示全部關閉，
+只做舊版的等比縮放），並記錄各步驟耗時。
+"""
+import io
+import os
+import time
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+import ocr_tiling
+
+ALL_STEPS = ('exif', 'gray', 'crop', 'deskew', 'resize')
+
+# 偵測器最適合的字高（像素），以及縮放倍率的範圍
+TARGET_TEXT_HEIGHT = 20
+MIN_SCALE = 0.25
+MAX_SCALE = 1.5
+
+# 估算用的工作解析度（約 ANALYSIS_SIZE² 像素），避免在千萬像素原圖上做輪廓分析
+ANALYSIS_SIZE = 1000
+
+
+def configured_steps() -> Tuple[str, ...]:
+    """讀取 OCR_PREPROCESS 設定"""
+    value = os.environ.get("OCR_PREPROCESS", ",".join(ALL_STEPS)).strip().lower()
+    if value in ('', 'none', 'off'):
+        return ()
+    return tuple(step for step in ALL_STEPS if step in value.split(','))
+
+
+def preprocess(image_data: bytes, steps: Tuple[str, ...], max_size: int = 1600,
+               tiling: bool = False) -> Tuple[np.ndarray, Dict]:
+    """執行前處理，回傳 (送進 EasyOCR 的陣列, 各步驟耗時ms)
+
+    tiling=True 時長條圖片只限制寬度（高度上限 ocr_tiling.TILE_MAX_HEIGHT），交給分段辨識
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(image_data))
+    image.load()
+    timings['decode_ms'] = _elapsed(started)
+
+    if 'exif' in steps:
+        started = time.perf_counter()
+        image = ImageOps.exif_transpose(image)
+        timings['exif_ms'] = _elapsed(started)
+
+    # 舊版流程：只做等比縮放
+    if not steps or steps == ('exif',):
+        started = time.perf_counter()
+        ratio = max_scale((image.height, image.width), max_size, tiling)
+        if ratio < 1:
+            image = image.resize((int(image.width * ratio), int(image.height * ratio)), Image.LANCZOS)
+        array = np.array(image.convert('RGB'))
+        timings['resize_ms'] = _elapsed(started)
+        return array, timings
+
+    array = np.array(image.convert('RGB'))
+
+    if 'gray' in steps:
+        started = time.perf_counter()
+        array = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+        timings['gray_ms'] = _elapsed(started)
+
+    if 'crop' in steps:
+        started = time.perf_counter()
+        array = crop_receipt(array)
+        timings['crop_ms'] = _elapsed(started)
+
+    if 'deskew' in steps:
+        started = time.perf_counter()
+        array = deskew(array)
+        timings['deskew_ms'] = _elapsed(started)
+
+    started = time.perf_counter()
+    if 'resize' in steps:
+        scale = adaptive_scale(array, max_scale(array.shape, max_size, tiling))
+    else:
+        scale = min(1.0, max_scale(array.shape, max_size, tiling))
+    if abs(scale - 1.0) > 0.01:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        array = cv2.resize(array, None, fx=scale, fy=scale, interpolation=interpolation)
+    timings['resize_ms'] = _elapsed(started)
+
+    return array, timings
+
+
+def crop_receipt(array: np.ndarray) -> np.ndarray:
+    """找出最大的亮色紙張輪廓並裁切；找不到明顯的發票邊緣就原圖返回"""
+    gray, ratio = _analysis_gray(array)
+
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return array
+
+    contour = max(contours, key=cv2.contourArea)
+    area_ratio = cv2.contourArea(contour) / float(gray.shape[0] * gray.shape[1])
+
+    # 太小可能是雜訊，幾乎整張則代表本來就是掃描檔
+    if not 0.15 <= area_ratio <= 0.9:
+        return array
+
+    x, y, w, h = cv2.boundingRect(contour)
+    pad = int(0.01 * max(gray.shape))
+    x0 = max(0, int((x - pad) / ratio))
+    y0 = max(0, int((y - pad) / ratio))
+    x1 = min(array.shape[1], int((x + w + pad) / ratio))
+    y1 = min(array.shape[0], int((y + h + pad) / ratio))
+
+    return array[y0:y1, x0:x1]
+
+
+def deskew(array: np.ndarray, max_angle: float = 15.0) -> np.ndarray:
+    """用文字行的方向估計歪斜角度，0.5° 以上才旋轉"""
+    angle = estimate_skew(array)
+    if abs(angle) < 0.5 or abs(angle) > max_angle:
+        return array
+
+    h, w = array.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    border = 255 if array.ndim == 2 else (255, 255, 255)
+
+    return cv2.warpAffine(array, matrix, (w, h), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+
+def estimate_skew(array: np.ndarray) -> float:
+    """文字行（水平膨脹後的長條輪廓）長邊方向角度的中位數"""
+    gray, _ = _analysis_gray(array)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    lines = cv2.dilate(ink, cv2.getStructuringElement(cv2.MORPH_RECT, (25, 3)))
+
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    angles = []
+    for contour in contours:
+        rect = cv2.minAreaRect(contour)
+        w, h = rect[1]
+        # 只看細長的文字行
+        if max(w, h) < 40 or max(w, h) < 4 * min(w, h):
+            continue
+
+        # 用長邊的方向計算角度（不依賴各版 OpenCV 的角度慣例）
+        box = cv2.boxPoints(rect)
+        edges = [box[(i + 1) % 4] - box[i] for i in range(2)]
+        dx, dy = max(edges, key=lambda e: e[0] ** 2 + e[1] ** 2)
+        angle = float(np.degrees(np.arctan2(dy, dx)))
+        angle = (angle + 90) % 180 - 90
+        if angle > 45:
+            angle -= 90
+        elif angle <= -45:
+            angle += 90
+        angles.append(angle)
+
+    if len(angles) < 3:
+        return 0.0
+
+    return float(np.median(angles))
+
+
+def estimate_text_height(array: np.ndarray) -> float:
+    """連通元件高度的中位數（原圖像素），找不到字時回傳 0"""
+    gray, ratio = _analysis_gray(array)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+
+    # 排除雜點與表格線、大色塊
+    keep = (heights >= 3) & (heights <= gray.shape[0] / 8) & (widths <= heights * 4)
+    if count <= 1 or not np.any(keep):
+        return 0.0
+
+    return float(np.median(heights[keep])) / ratio
+
+
+def max_scale(shape, max_size: int, tiling: bool = False) -> float:
+    """尺寸上限對應的最大縮放倍率：一般圖片限制長邊，分段模式的長條圖片限制寬度與總高度"""
+    height, width = shape[:2]
+    if tiling and ocr_tiling.is_tall(shape):
+        return min(max_size / width, ocr_tiling.TILE_MAX_HEIGHT / height)
+    return max_size / max(height, width)
+
+
+def adaptive_scale(array: np.ndarray, limit: float) -> float:
+    """依估計字高決定縮放倍率，讓字高接近 TARGET_TEXT_HEIGHT，不超過尺寸上限 limit"""
+    text_height = estimate_text_height(array)
+    scale = TARGET_TEXT_HEIGHT / text_height if text_height else 1.0
+    scale = min(max(scale, MIN_SCALE), MAX_SCALE)
+
+    return min(scale, limit)
+
+
+def _analysis_gray(array: np.ndarray) -> Tuple[np.ndarray, float]:
+    """縮到約 ANALYSIS_SIZE² 像素的灰階圖（以面積計，長條圖片才不會縮到字看不見），回傳 (灰階圖, 縮放比例)"""
+    gray = array if array.ndim == 2 else cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+    ratio = min(1.0, ANALYSIS_SIZE / np.sqrt(gray.shape[0] * gray.shape[1]))
+    if ratio < 1.0:
+        gray = cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+    return gray, ratio
+
+
+def _elapsed(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,121 @@
+# ocr_tiling.py - 長條發票分段辨識
+"""又高又窄的感熱紙收據（家樂福、全聯）等比縮到 1600px 後字會小到辨識不出來。
+分段模式只限制寬度，把圖片切成有重疊的橫條，整批送進 Reader，再把結果拼回原座標：
+
+    split_tiles()  → 固定高度的橫條（最後一條補白），每條運算量固定
+    stitch()       → 座標平移、去掉重疊區的重複字串、依閱讀順序排序
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+# 高寬比超過這個值才分段
+TILE_ASPECT = 2.5
+
+# 每一條的高度與相鄰兩條的重疊（重疊要比一行字高，才能保證每行字至少完整出現一次）
+TILE_HEIGHT = 1280
+TILE_OVERLAP = 160
+
+# 分段模式下整張圖的最大高度，限制條數（約 8 條）
+TILE_MAX_HEIGHT = 8000
+
+
+def is_tall(shape) -> bool:
+    """是否需要分段辨識"""
+    return shape[0] >= TILE_ASPECT * shape[1] and shape[0] > TILE_HEIGHT
+
+
+def split_tiles(array: np.ndarray) -> Tuple[List[np.ndarray], List[int]]:
+    """切成同尺寸的重疊橫條，回傳 (橫條, 每條的起始y)"""
+    height = array.shape[0]
+    step = TILE_HEIGHT - TILE_OVERLAP
+
+    offsets = list(range(0, max(1, height - TILE_OVERLAP), step))
+    tiles = []
+    for y0 in offsets:
+        tile = array[y0:y0 + TILE_HEIGHT]
+        if tile.shape[0] < TILE_HEIGHT:
+            # readtext_batched 需要同尺寸輸入，最後一條補白
+            padded = np.full((TILE_HEIGHT,) + tile.shape[1:], 255, dtype=np.uint8)
+            padded[:tile.shape[0]] = tile
+            tile = padded
+        tiles.append(tile)
+
+    return tiles, offsets
+
+
+def stitch(tile_results: List[List], offsets: List[int], height: int) -> List:
+    """把各條的 (bbox, text, confidence) 平移回原圖座標、去重並依閱讀順序排列"""
+    candidates = []
+    for index, (results, y0) in enumerate(zip(tile_results, offsets)):
+        # 這一條被切斷的上下緣（原圖邊界不算）
+        top = y0 if index > 0 else None
+        bottom = y0 + TILE_HEIGHT if y0 + TILE_HEIGHT < height else None
+
+        for bbox, text, confidence in results:
+            box = [[float(x), float(y) + y0] for x, y in bbox]
+            ys = [y for _, y in box]
+            if min(ys) >= height:
+                continue  # 補白區
+
+            # 字串離切斷邊緣越遠越完整
+            center = (min(ys) + max(ys)) / 2
+            margin = min(
+                center - top if top is not None else float('inf'),
+                bottom - center if bottom is not None else float('inf')
+            )
+            candidates.append((margin, index, (box, text, confidence)))
+
+    # 重疊區同一段文字會出現兩次：保留最完整的那一個
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    kept = []
+    for _, index, token in candidates:
+        if not any(other_index != index and _overlap(token[0], other[0]) > 0.5
+                   for other_index, other in kept):
+            kept.append((index, token))
+
+    return reading_order([token for _, token in kept])
+
+
+def reading_order(tokens: List) -> List:
+    """由上而下分行，同一行由左而右"""
+    if not tokens:
+        return []
+
+    def extent(token):
+        xs = [x for x, _ in token[0]]
+        ys = [y for _, y in token[0]]
+        return min(xs), min(ys), max(ys)
+
+    heights = [extent(t)[2] - extent(t)[1] for t in tokens]
+    tolerance = max(1.0, float(np.median(heights)) / 2)
+
+    lines = []
+    for token in sorted(tokens, key=lambda t: sum(extent(t)[1:]) / 2):
+        center = sum(extent(token)[1:]) / 2
+        if lines and abs(center - lines[-1][0]) <= tolerance:
+            lines[-1][1].append(token)
+        else:
+            lines.append([center, [token]])
+
+    return [token for _, line in lines for token in sorted(line, key=lambda t: extent(t)[0])]
+
+
+def _overlap(a, b) -> float:
+    """交集面積 / 較小框面積（被切斷的半個字串也算重複）"""
+    ax0, ay0, ax1, ay1 = _bounds(a)
+    bx0, by0, bx1, by1 = _bounds(b)
+
+    width = min(ax1, bx1) - max(ax0, bx0)
+    height = min(ay1, by1) - max(ay0, by0)
+    if width <= 0 or height <= 0:
+        return 0.0
+
+    smaller = min((ax1 - ax0) * (ay1 - ay0), (bx1 - bx0) * (by1 - by0))
+    return width * height / smaller if smaller > 0 else 0.0
+
+
+def _bounds(box) -> Tuple[float, float, float, float]:
+    xs = [x for x, _ in box]
+    ys = [y for _, y in box]
+    return min(xs), min(ys), max(xs), max(ys)
@@ -0,0 +1,240 @@
+# ocr_worker.py - EasyOCR 推論工作程序
+"""EasyOCR 推論：執行緒後端與多程序後端共用同一套程式碼
+
+多程序模式下每個工作程序在啟動時呼叫 init_reader() 載入自己的 Reader，
+之後只接收圖片 bytes，回傳可序列化的辨識結果。
+"""
+import os
+import time
+from importlib import metadata
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+import numpy as np
+
+import ocr_preprocess
+import ocr_tiling
+
+OCR_LANGS = ['ch_tra', 'en']
+MAX_SIZE = 1600
+
+# 前處理/推論流程版本：改變辨識結果的修改要遞增，讓舊的OCR快取失效
+PIPELINE_VERSION = 3
+
+# 前處理步驟（OCR_PREPROCESS 環境變數）
+PREPROCESS_STEPS = ocr_preprocess.configured_steps()
+
+# 長條收據分段辨識（OCR_TILING=0 關閉）
+TILING = os.environ.get("OCR_TILING", "1") != "0"
+
+try:
+    _EASYOCR_VERSION = metadata.version('easyocr')
+except metadata.PackageNotFoundError:
+    _EASYOCR_VERSION = 'unknown'
+
+ENGINE_VERSION = (f"easyocr-{_EASYOCR_VERSION}/{'+'.join(OCR_LANGS)}/p{PIPELINE_VERSION}"
+                  f"/{'+'.join(PREPROCESS_STEPS) or 'raw'}{'/tiled' if TILING else ''}")
+
+# 辨識器每次推論的文字框數量（批次模式）
+RECOGNIZER_BATCH_SIZE = 16
+
+# 每個程序一個 Reader
+_reader = None
+
+# 本程序的模型載入耗時（秒）
+LOAD_TIMINGS = {}
+
+
+def _patch_pil():
+    """PIL版本兼容性修復（EasyOCR 仍使用舊常數）"""
+    try:
+        if not hasattr(Image, 'ANTIALIAS'):
+            Image.ANTIALIAS = Image.LANCZOS
+            print("🔧 PIL兼容性修復：ANTIALIAS -> LANCZOS")
+        if not hasattr(Image, 'BICUBIC'):
+            Image.BICUBIC = Image.LANCZOS
+            print("🔧 PIL兼容性修復：BICUBIC -> LANCZOS")
+    except Exception as e:
+        print(f"⚠️ PIL兼容性修復失敗: {e}")
+
+
+def init_reader(torch_threads: int = 0, warm: bool = False) -> bool:
+    """載入 EasyOCR Reader（每個程序只做一次），warm=True 時順便暖機"""
+    global _reader
+
+    if _reader is not None:
+        return True
+
+    _patch_pil()
+
+    try:
+        started = time.perf_counter()
+        import torch
+        import easyocr
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        LOAD_TIMINGS['import_s'] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        _reader = easyocr.Reader(OCR_LANGS, gpu=False)
+        LOAD_TIMINGS['reader_init_s'] = round(time.perf_counter() - started, 3)
+        print(f"🔧 EasyOCR 初始化完成（支援繁體中文，程序 {os.getpid()}）")
+
+    except Exception as e:
+        LOAD_TIMINGS['error'] = str(e)
+        print(f"⚠️ EasyOCR 初始化失敗（程序 {os.getpid()}）: {e}")
+        return False
+
+    if warm:
+        warmup()
+
+    return True
+
+
+def warmup() -> float:
+    """用假發票圖片跑一次完整推論，讓 torch 完成 JIT 與緩衝區配置"""
+    if _reader is None:
+        raise RuntimeError("EasyOCR 尚未載入")
+
+    image = Image.new('RGB', (320, 96), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((16, 16), "AB12345678", fill='black')
+    draw.text((16, 56), "NT$ 126", fill='black')
+
+    started = time.perf_counter()
+    _reader.readtext(np.array(image))
+    LOAD_TIMINGS['warmup_s'] = round(time.perf_counter() - started, 3)
+
+    return LOAD_TIMINGS['warmup_s']
+
+
+def load_report(hold: float = 0) -> Dict:
+    """回報本程序的載入狀態；hold 讓任務停留一下，使每個工作程序都能分到任務"""
+    time.sleep(hold)
+    return dict(LOAD_TIMINGS, pid=os.getpid(), ready=_reader is not None)
+
+
+def default_pool_size() -> Tuple[int, int]:
+    """依CPU核心數與torch執行緒數決定 (工作程序數, 每程序torch執行緒數)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    torch_threads = int(os.environ.get("OCR_TORCH_THREADS", 0)) or (2 if cores >= 4 else 1)
+    processes = int(os.environ.get("OCR_PROCESSES", 0)) or max(1, cores // torch_threads)
+
+    return processes, torch_threads
+
+
+def prepare_image(image_data: bytes, steps: Tuple[str, ...] = None) -> Tuple[np.ndarray, Dict]:
+    """解碼並前處理圖片，回傳 (陣列, 各步驟耗時ms)"""
+    if steps is None:
+        steps = PREPROCESS_STEPS
+
+    array, timings = ocr_preprocess.preprocess(image_data, steps, MAX_SIZE, tiling=TILING)
+    print(f"🔧 前處理完成: {array.shape[1]}x{array.shape[0]} {timings}")
+
+    return array, timings
+
+
+def _to_plain(results) -> List:
+    """轉成純 Python 型別，方便跨程序傳回"""
+    return [
+        ([[float(x), float(y)] for x, y in bbox], text, float(confidence))
+        for bbox, text, confidence in results
+    ]
+
+
+def recognize(image_data: bytes) -> Dict:
+    """解碼 → 前處理 → 辨識，回傳 {'tokens': [(bbox, text, confidence), ...], 'timings': {...}}"""
+    if _reader is None:
+        raise RuntimeError("EasyOCR 尚未載入")
+
+    array, timings = prepare_image(image_data)
+
+    started = time.perf_counter()
+    if TILING and ocr_tiling.is_tall(array.shape):
+        tokens, timings['tiles'] = recognize_tiled(array)
+    else:
+        tokens = _to_plain(_readtext(array, timings))
+    timings['ocr_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    return {'tokens': tokens, 'timings': timings}
+
+
+def _readtext(array: np.ndarray, timings: Dict) -> List:
+    """與 Reader.readtext 相同（預設參數），但分開量測文字偵測與文字辨識的耗時"""
+    from easyocr.utils import reformat_input
+
+    img, img_cv_grey = reformat_input(array)
+
+    started = time.perf_counter()
+    horizontal_list, free_list = _reader.detect(img, reformat=False)
+    timings['detect_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    results = _reader.recognize(img_cv_grey, horizontal_list[0], free_list[0], reformat=False)
+    timings['recognize_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    return results
+
+
+def recognize_tiled(array: np.ndarray) -> Tuple[List, int]:
+    """長條圖片切成重疊橫條，整批推論後拼回原座標，回傳 (tokens, 條數)"""
+    tiles, offsets = ocr_tiling.split_tiles(array)
+    tile_results = _reader.readtext_batched(tiles, batch_size=RECOGNIZER_BATCH_SIZE)
+    tokens = ocr_tiling.stitch([_to_plain(r) for r in tile_results], offsets, array.shape[0])
+
+    print(f"🔧 分段辨識: {len(tiles)} 條 → {len(tokens)} 個字串")
+
+    return tokens, len(tiles)
+
+
+def recognize_batch(images: List[bytes]) -> List[Optional[Dict]]:
+    """批次辨識多張圖片（readtext_batched），無法解碼的圖片回傳 None"""
+    if _reader is None:
+        raise RuntimeError("EasyOCR 尚未載入")
+
+    arrays = []
+    timings = []
+    for image_data in images:
+        try:
+            array, image_timings = prepare_image(image_data)
+        except Exception as e:
+            print(f"⚠️ 圖片解碼失敗: {e}")
+            array, image_timings = None, None
+        arrays.append(array)
+        timings.append(image_timings)
+
+    # 長條圖片各自分段辨識，其餘一起批次推論
+    results = {}
+    for i, array in enumerate(arrays):
+        if array is not None and TILING and ocr_tiling.is_tall(array.shape):
+            started = time.perf_counter()
+            tokens, timings[i]['tiles'] = recognize_tiled(array)
+            timings[i]['ocr_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            results[i] = {'tokens': tokens, 'timings': timings[i]}
+
+    valid = [a for i, a in enumerate(arrays) if a is not None and i not in results]
+    if not valid:
+        return [results.get(i) for i in range(len(images))]
+
+    # readtext_batched 需要同尺寸輸入：補白邊到同一張畫布（貼左上角，bbox座標不變）
+    height = max(a.shape[0] for a in valid)
+    width = max(a.shape[1] for a in valid)
+    canvases = []
+    for a in valid:
+        canvas = np.full((height, width) + a.shape[2:], 255, dtype=np.uint8)
+        canvas[:a.shape[0], :a.shape[1]] = a
+        canvases.append(canvas)
+
+    started = time.perf_counter()
+    batched = iter(_reader.readtext_batched(canvases, batch_size=RECOGNIZER_BATCH_SIZE))
+    ocr_ms = round((time.perf_counter() - started) * 1000 / len(valid), 2)
+
+    for i, (array, image_timings) in enumerate(zip(arrays, timings)):
+        if array is not None and i not in results:
+            results[i] = {'tokens': _to_plain(next(batched)), 'timings': dict(image_timings, ocr_ms=ocr_ms)}
+
+    return [results.get(i) for i in range(len(images))]
@@ -0,0 +1,185 @@
+# receipt_layout.py - 依文字框位置擷取品項
+"""EasyOCR 的每個字串都有文字框，用位置把品項拼回來（不需要再跑一次OCR）：
+
+    _words()    → 字串內有空白的（「御飯糰 x2 58」）依字元位置拆成單字，各自有 x 範圍
+    _rows()     → 依 y 中心排序，間距超過半個字高就換行（NumPy 向量運算）
+    _price_x()  → 價格欄：各行最右邊數字的右緣中位數
+    extract_items() → 每行「品名 … 價格欄的數字」就是一個品項，中間的數字是數量/單價；
+                      品名與價格分在上下兩行（品名一行、數量×單價 金額一行）時合併
+
+總計、稅額、找零這類行以關鍵字排除。輸出格式與電子發票QR Code的品項相同：
+    {'name': 品名, 'quantity': 數量, 'price': 單價}
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 價格欄容許的偏移（整張收據文字寬度的比例）
+PRICE_COLUMN_TOLERANCE = 0.12
+
+# 同一行的 y 中心最大間距（字高中位數的比例）
+ROW_TOLERANCE = 0.5
+
+# 不是品項的行
+_SKIP_KEYWORDS = ('總計', '合計', '小計', '總金額', '金額', '應收', '實收', '找零', '現金', '稅', '發票', '統編',
+                  '統一編號', '日期', '時間', '電話', '地址', '信用卡', '悠遊卡', '載具', '折扣', '品項', '數量',
+                  '單價', '隨機碼', '賣方', '買方', '收費', '總額', 'total', 'tax', 'cash', 'change', 'nt$')
+
+_PRICE = re.compile(r'\$?(\d{1,3}(?:,\d{3})+|\d{1,6})(?:\.(\d{1,2}))?(?:元|tx|t)?', re.IGNORECASE)
+_QUANTITY = re.compile(r'[x×*]\s*(\d{1,3})|(\d{1,3})\s*[x×*]|(\d{1,3})(?:個|份|件|杯|瓶|包|盒|張|入)',
+                       re.IGNORECASE)
+_LETTERS = re.compile(r'[^\W\d_]')
+_WORD = re.compile(r'\S+')
+_SKIP = re.compile('|'.join(re.escape(keyword) for keyword in _SKIP_KEYWORDS), re.IGNORECASE)
+
+# 單字種類：品名、數字、數量（x2、2個）、乘號（「1 x 120」中間的 x）
+NAME, NUMBER, QUANTITY, OPERATOR = 0, 1, 2, 3
+_OPERATORS = frozenset(['x', 'X', '×', '*', '@'])
+
+
+def extract_items(tokens: List) -> List[Dict]:
+    """從 (bbox, text, confidence) 擷取品項"""
+    boxes, kinds, values, texts = _words(tokens)
+    if not texts:
+        return []
+
+    rows = _rows(boxes)
+
+    # 每一行依 x 排序後的單字序號
+    order = np.lexsort((boxes[:, 0], rows))
+    starts = np.flatnonzero(np.diff(rows[order], prepend=-1))
+    lines = [line.tolist() for line in np.split(order, starts[1:])]
+
+    price_x = _price_x(boxes, kinds, lines)
+    if price_x is None:
+        return []
+    tolerance = PRICE_COLUMN_TOLERANCE * (boxes[:, 2].max() - boxes[:, 0].min())
+    left = boxes[:, 0].tolist()
+    right = boxes[:, 2].tolist()
+
+    items = []
+    pending_name = None
+    for line in lines:
+        name = ' '.join(texts[i] for i in line if kinds[i] == NAME)
+        if _SKIP.search(name):
+            pending_name = None
+            continue
+
+        # 價格：最右邊、右緣落在價格欄的數字
+        numbers = [i for i in line if kinds[i] in (NUMBER, QUANTITY)]
+        price_index = next((i for i in reversed(numbers)
+                            if kinds[i] == NUMBER and abs(right[i] - price_x) <= tolerance), None)
+
+        if price_index is None:
+            # 只有品名的行，可能是下一行數量×單價的品名
+            pending_name = name if name and _LETTERS.search(name) else None
+            continue
+
+        if not name:
+            if pending_name is None:
+                continue
+            name = pending_name
+        elif not _LETTERS.search(name):
+            pending_name = None
+            continue
+        pending_name = None
+
+        total = values[price_index]
+        middle = [(kinds[i], values[i]) for i in numbers if i != price_index and right[i] < left[price_index] + 1]
+        quantity, price = _quantity_price(total, middle)
+        items.append({'name': name, 'quantity': quantity, 'price': price})
+
+    return items
+
+
+def _words(tokens: List) -> Tuple[np.ndarray, List[int], List[float], List[str]]:
+    """單字的 (x0, y0, x1, y1) 陣列、種類、數值、文字；有空白的字串依字元位置切開"""
+    texts = [text.strip() for _, text, _ in tokens]
+    kept = [i for i, text in enumerate(texts) if text]
+    if not kept:
+        return np.empty((0, 4)), [], [], []
+
+    # 所有文字框一次算出範圍（EasyOCR 的框都是四個角）
+    points = np.array([tokens[i][0] for i in kept], dtype=np.float64)
+    x0, y0 = points[:, :, 0].min(axis=1), points[:, :, 1].min(axis=1)
+    x1, y1 = points[:, :, 0].max(axis=1), points[:, :, 1].max(axis=1)
+    lengths = np.array([len(texts[i]) for i in kept], dtype=np.float64)
+    per_char = (x1 - x0) / lengths
+
+    owners, spans, kinds, values, words = [], [], [], [], []
+    for position, i in enumerate(kept):
+        for match in _WORD.finditer(texts[i]):
+            word = match.group()
+            kind, value = _classify(word)
+            owners.append(position)
+            spans.append(match.span())
+            kinds.append(kind)
+            values.append(value)
+            words.append(word)
+
+    owners = np.array(owners)
+    spans = np.array(spans, dtype=np.float64)
+    boxes = np.column_stack((
+        x0[owners] + spans[:, 0] * per_char[owners], y0[owners],
+        x0[owners] + spans[:, 1] * per_char[owners], y1[owners]
+    ))
+
+    return boxes, kinds, values, words
+
+
+def _classify(word: str) -> Tuple[int, float]:
+    if word in _OPERATORS:
+        return OPERATOR, 0.0
+
+    match = _QUANTITY.fullmatch(word)
+    if match:
+        return QUANTITY, float(next(g for g in match.groups() if g))
+
+    match = _PRICE.fullmatch(word)
+    if match:
+        return NUMBER, float(match.group(1).replace(',', '') + '.' + (match.group(2) or '0'))
+
+    return NAME, 0.0
+
+
+def _rows(boxes: np.ndarray) -> np.ndarray:
+    """依 y 中心分行，回傳每個單字的行號（由上而下）"""
+    centers = (boxes[:, 1] + boxes[:, 3]) / 2
+    heights = boxes[:, 3] - boxes[:, 1]
+    tolerance = max(1.0, float(np.median(heights)) * ROW_TOLERANCE)
+
+    order = np.argsort(centers, kind='stable')
+    breaks = np.diff(centers[order], prepend=centers[order[0]]) > tolerance
+
+    rows = np.empty(len(boxes), dtype=np.int64)
+    rows[order] = np.cumsum(breaks)
+    return rows
+
+
+def _price_x(boxes: np.ndarray, kinds: List[int], lines: List[List[int]]) -> Optional[float]:
+    """價格欄的右緣：各行最右邊的數字右緣取中位數"""
+    rightmost = [next((i for i in reversed(line) if kinds[i] == NUMBER), None) for line in lines]
+    rightmost = [i for i in rightmost if i is not None]
+
+    return float(np.median(boxes[rightmost, 2])) if rightmost else None
+
+
+def _quantity_price(total: float, middle: List[Tuple[int, float]]) -> Tuple[float, float]:
+    """品名與金額之間的數字 → (數量, 單價)：明確標示的數量（x2、2個）優先；
+    數字是金額的因數時，數量取因數與商較小的一個（「咖啡 65 130」是 2 杯 65 元）；
+    其餘 1-99 的整數當數量"""
+    quantities = [value for kind, value in middle if kind == QUANTITY]
+    numbers = [value for kind, value in middle if kind == NUMBER and 0 < value < total]
+
+    quantity = quantities[0] if quantities else 1.0
+    if not quantities and numbers:
+        number = numbers[-1]
+        ratio = total / number
+        if abs(ratio - round(ratio)) < 0.001:
+            quantity = float(min(number, round(ratio)))
+        elif number.is_integer() and number <= 99:
+            quantity = number
+
+    quantity = quantity or 1.0
+    return quantity, round(total / quantity, 2)
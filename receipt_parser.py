@@ -0,0 +1,201 @@
+# receipt_parser.py - 發票欄位擷取（預先編譯樣式、關鍵字前置過濾）
+"""從 OCR 文字擷取發票號碼、金額、日期、商家、稅額
+
+舊版 _smart_parse 每張發票都用字串樣式呼叫約 20 次 re.search / re.findall。這裡：
+
+* 所有樣式在模組載入時編譯一次
+* 先對文字做一次前置掃描（小寫化 + 關鍵字是否出現），不可能成立的樣式直接跳過，
+  例如沒有「合計」兩字就不跑合計的樣式
+* 依原本的優先順序求值，取到第一個成立的就停，後備規則（最大數字、最長中文字串）
+  只在前面都落空時才執行
+
+每個樣式仍是最左邊匹配（re.search 的語意），所以結果與舊版完全相同，
+包含民國年樣式會先吃到西元年後三碼這類既有行為。
+
+把全部樣式合成一個 lookahead 交替樣式逐字掃描也試過，但 Python 的 re 在每個位置
+嘗試所有分支反而比舊版慢一倍（見 benchmarks/bench_parser.py），所以沒有採用。
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# 發票號碼：兩個英文字母+8個數字
+_INVOICE = re.compile(r'[A-Z]{2}[\-]?[0-9]{8}')
+
+# 總金額：(必須出現的關鍵字, 樣式)，順序即優先順序
+_AMOUNT_PATTERNS = [
+    ('總計', re.compile(r'總計[：:\s]*\$?[\s]*(\d{1,6})')),
+    ('合計', re.compile(r'合計[：:\s]*\$?[\s]*(\d{1,6})')),
+    ('含稅總計', re.compile(r'含稅總計[：:\s]*(\d{1,6})')),
+    ('總金額', re.compile(r'總金額[：:\s]*(\d{1,6})')),
+    ('小計', re.compile(r'小計[：:\s]*(\d{1,6})')),
+    ('金額', re.compile(r'金額[：:\s]*(\d{1,6})')),
+    ('NT$', re.compile(r'NT\$[\s]*(\d{1,6})')),
+    ('應收', re.compile(r'應收[：:\s]*(\d{1,6})')),
+    ('收費', re.compile(r'收費[：:\s]*(\d{1,6})')),
+]
+
+# 稅額（不分大小寫，關鍵字以 casefold 後的文字檢查）
+_TAX_PATTERNS = [
+    ('營業稅', re.compile(r'營業稅[：:\s]*(\d{1,4})', re.IGNORECASE)),
+    ('稅額', re.compile(r'稅額[：:\s]*(\d{1,4})', re.IGNORECASE)),
+    ('tax', re.compile(r'TAX[：:\s]*(\d{1,4})', re.IGNORECASE)),
+]
+
+# 日期：民國年、西元年、2024/12/16、2024-12-16（都需要分隔符號）
+_DATE_PATTERNS = [
+    re.compile(r'(\d{2,3})[年/\-.](\d{1,2})[月/\-.](\d{1,2})'),
+    re.compile(r'(\d{4})[年/\-.](\d{1,2})[月/\-.](\d{1,2})'),
+    re.compile(r'(\d{4})/(\d{1,2})/(\d{1,2})'),
+    re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'),
+]
+_DATE_SEPARATORS = ('年', '/', '-', '.')
+
+# 商家名稱（針對台灣商家優化，不分大小寫）：(任一關鍵字出現才需要跑, 樣式)
+_MERCHANT_PATTERNS = [
+    (None, re.compile(r'(來麵屋|星巴克|麥當勞|肯德基|全家|7-ELEVEN|誠品|屈臣氏|康是美|中油)', re.IGNORECASE)),
+    (('麵屋', '餐廳', '咖啡', '書店', '藥局', '醫院', '診所', '便利商店', '加油站'),
+     re.compile(r'([\u4e00-\u9fff]+(?:麵屋|餐廳|咖啡|書店|藥局|醫院|診所|便利商店|加油站))', re.IGNORECASE)),
+    (('公司', '企業', '行', '店', '館', '廳', '坊', '屋', '社', '中心'),
+     re.compile(r'([\u4e00-\u9fff]+(?:公司|企業|行|店|館|廳|坊|屋|社|中心))', re.IGNORECASE)),
+    (('starbucks', 'mcdonald', 'kfc', 'familymart'),
+     re.compile(r'([A-Za-z]+(?:Starbucks|McDonald|KFC|FamilyMart))', re.IGNORECASE)),
+]
+
+# 最長中文字串後備規則要排除的常見詞
+_STOPWORDS = frozenset(['統一發票', '電子發票', '營業稅', '總計', '合計', '小計',
+                        '品項', '數量', '單價', '金額', '日期', '時間', '發票號碼'])
+
+_CJK_RUN = re.compile(r'[\u4e00-\u9fff]+')
+_DIGITS = re.compile(r'\d{1,6}')
+
+# 統一編號：獨立的 8 位數字；前面有「統編」等標籤的優先，「買方」的是我們自己的統編
+_TAX_ID = re.compile(r'(?<!\d)\d{8}(?!\d)')
+_TAX_ID_LABEL = re.compile(r'(統一編號|統編|營業人|賣\s*方)[^\d\n]{0,6}$')
+_TAX_ID_BUYER = re.compile(r'買\s*方[^\d\n]{0,6}$')
+_TAX_ID_WEIGHTS = (1, 2, 1, 2, 1, 2, 4, 1)
+
+
+def parse(text: str, merchant: Optional[str] = None) -> Dict:
+    """擷取發票欄位（與舊版 _smart_parse 結果相同）；已知商家（例如由統編查到）時跳過商家推測"""
+    lowered = text.casefold()
+
+    result = {
+        'invoice_number': '',
+        'date': '',
+        'merchant': '',
+        'amount': 0,
+        'tax_amount': 0,
+        'items': []
+    }
+
+    invoice = _INVOICE.search(text)
+    if invoice:
+        result['invoice_number'] = invoice.group().replace('-', '')
+
+    # 總金額：依樣式優先順序；沒找到（或抓到 0）才取最大的合理數字
+    amount = _first_group(_AMOUNT_PATTERNS, text, text)
+    result['amount'] = int(amount) if amount is not None else 0
+    if result['amount'] == 0:
+        result['amount'] = _largest_number(text)
+
+    result['date'] = _parse_date(text) or datetime.now().strftime('%Y-%m-%d')
+
+    result['merchant'] = merchant or _merchant(text, lowered) or '未知商家'
+
+    # 稅額：先找明確的稅額，沒有就按5%計算
+    if result['amount'] > 0:
+        tax = _first_group(_TAX_PATTERNS, text, lowered)
+        if tax is not None:
+            result['tax_amount'] = int(tax)
+
+        if result['tax_amount'] == 0:
+            result['tax_amount'] = round(result['amount'] * 0.05)
+
+    return result
+
+
+def _first_group(patterns: List[Tuple[str, re.Pattern]], text: str, haystack: str) -> Optional[str]:
+    """依序找第一個成立的樣式（關鍵字沒出現在 haystack 就跳過）"""
+    for keyword, pattern in patterns:
+        if keyword in haystack:
+            match = pattern.search(text)
+            if match:
+                return match.group(1)
+    return None
+
+
+def _parse_date(text: str) -> str:
+    """依樣式順序，取第一個月/日合理的日期"""
+    if not any(separator in text for separator in _DATE_SEPARATORS):
+        return ''
+
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            year = int(match.group(1))
+            if year < 1000:  # 民國年轉西元年
+                year += 1911
+            month = int(match.group(2))
+            day = int(match.group(3))
+
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                return f"{year}-{month:02d}-{day:02d}"
+
+    return ''
+
+
+def _largest_number(text: str) -> int:
+    """沒找到總計時，取最大的合理數字（10-99999，排除統編、電話）"""
+    amounts = [int(n) for n in _DIGITS.findall(text) if len(n) <= 5 and 10 <= int(n) <= 99999]
+    return max(amounts) if amounts else 0
+
+
+def _merchant(text: str, lowered: str) -> str:
+    """商家樣式，再不行就取長度適中（2-8字）的最長中文字串"""
+    for keywords, pattern in _MERCHANT_PATTERNS:
+        if keywords is None or any(keyword in lowered for keyword in keywords):
+            match = pattern.search(text)
+            if match:
+                return match.group(1)
+
+    filtered = [t for t in _CJK_RUN.findall(text) if t not in _STOPWORDS]
+    if not filtered:
+        return ''
+
+    suitable = [t for t in filtered if 2 <= len(t) <= 8]
+    return max(suitable or filtered, key=len)
+
+
+def valid_tax_id(tax_id: str) -> bool:
+    """統一編號檢查碼：各位數乘上權重 1,2,1,2,1,2,4,1 後把乘積的各位數相加，
+    總和能被 5 整除即有效；第 7 位是 7 時（7×4=28→10 可算 1 或 0），總和 +1 能被 5 整除也有效"""
+    if len(tax_id) != 8 or not tax_id.isdigit():
+        return False
+
+    total = 0
+    for digit, weight in zip(tax_id, _TAX_ID_WEIGHTS):
+        product = int(digit) * weight
+        total += product // 10 + product % 10
+
+    return total % 5 == 0 or (tax_id[6] == '7' and (total + 1) % 5 == 0)
+
+
+def tax_id_candidates(text: str) -> Tuple[List[str], List[str]]:
+    """文字中檢查碼正確的統一編號，回傳 (有「統編/賣方」標籤的, 沒有標籤的)；標示為買方的排除"""
+    labeled = []
+    unlabeled = []
+    for match in _TAX_ID.finditer(text):
+        tax_id = match.group()
+        if not valid_tax_id(tax_id):
+            continue
+
+        before = text[max(0, match.start() - 12):match.start()]
+        if _TAX_ID_BUYER.search(before):
+            continue
+
+        target = labeled if _TAX_ID_LABEL.search(before) else unlabeled
+        if tax_id not in target:
+            target.append(tax_id)
+
+    return labeled, [t for t in unlabeled if t not in labeled]
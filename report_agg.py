@@ -0,0 +1,108 @@
+# report_agg.py - 月份×分類發票彙總表
+"""receipt_monthly_agg 存每個月份（YYYY-MM）× 分類的金額、稅額、張數與辨識信心度合計，
+由 receipts 的 INSERT/UPDATE/DELETE 觸發器（migrations 版本 9）逐筆維護，
+月報表只讀當月的幾列，不必每次重新彙總原始發票。
+
+觸發器涵蓋所有寫入（包括直接改資料庫），一般不需要手動處理；
+暫時停用觸發器做大量匯入、或懷疑彙總表與原始資料不一致時：
+
+    python report_agg.py check       # 與 receipts 重新彙總的結果比對，不一致時結束碼為 1
+    python report_agg.py rebuild     # 從 receipts 重建整張彙總表
+
+資料庫路徑同 db.DB_PATH（環境變數 RECEIPTS_DB）。
+"""
+import argparse
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import db
+
+# 從原始發票彙總，欄位順序同 receipt_monthly_agg
+RAW_AGGREGATE_SQL = '''
+    SELECT substr(date, 1, 7), IFNULL(category, ''),
+           IFNULL(SUM(amount), 0), IFNULL(SUM(tax_amount), 0), COUNT(*),
+           IFNULL(SUM(ocr_confidence), 0), COUNT(ocr_confidence)
+    FROM receipts
+    GROUP BY 1, 2
+'''
+
+COLUMNS = ('amount_sum', 'tax_sum', 'receipt_count', 'confidence_sum', 'confidence_count')
+
+# 金額逐筆加減的浮點誤差容許值
+TOLERANCE = 1e-6
+
+
+def rebuild(cursor) -> int:
+    """清空並從 receipts 重新彙總，回傳彙總列數（由呼叫端 commit）"""
+    cursor.execute('DELETE FROM receipt_monthly_agg')
+    cursor.execute(f'''
+        INSERT INTO receipt_monthly_agg (period, category, {', '.join(COLUMNS)})
+        {RAW_AGGREGATE_SQL}
+    ''')
+    cursor.execute('SELECT COUNT(*) FROM receipt_monthly_agg')
+    return cursor.fetchone()[0]
+
+
+def check(cursor) -> List[Dict]:
+    """比對彙總表與原始發票，回傳不一致的 [{period, category, expected, actual}]（expected/actual 為 None 表示缺列）"""
+    cursor.execute(RAW_AGGREGATE_SQL)
+    expected = _by_key(cursor.fetchall())
+    cursor.execute(f'SELECT period, category, {", ".join(COLUMNS)} FROM receipt_monthly_agg')
+    actual = _by_key(cursor.fetchall())
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want, have = expected.get(key), actual.get(key)
+        if want is not None and have is not None and \
+                all(abs(a - b) <= TOLERANCE for a, b in zip(want.values(), have.values())):
+            continue
+        mismatches.append({"period": key[0], "category": key[1], "expected": want, "actual": have})
+    return mismatches
+
+
+def _by_key(rows) -> Dict[Tuple[str, str], Dict]:
+    return {(row[0], row[1]): dict(zip(COLUMNS, row[2:])) for row in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月份×分類發票彙總表的檢查與重建")
+    parser.add_argument("command", choices=("check", "rebuild"), help="check: 比對原始資料；rebuild: 重建")
+    args = parser.parse_args()
+
+    # migrations 會匯入本模組，這裡才匯入；還沒建立彙總表的資料庫先遷移
+    import migrations
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    try:
+        migrations.migrate(conn)
+        if args.command == 'rebuild':
+            # 重建期間擋住其他寫入，避免觸發器的更新落在 DELETE 與 INSERT 之間
+            conn.execute('BEGIN IMMEDIATE')
+            rows = rebuild(cursor)
+            conn.commit()
+            print(f"✅ 已重建 receipt_monthly_agg：{rows} 列（{time.perf_counter() - started:.2f} 秒）")
+            return
+
+        # 兩次查詢在同一個讀取交易內，看到的是同一個快照
+        conn.execute('BEGIN')
+        mismatches = check(cursor)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    if not mismatches:
+        print(f"✅ receipt_monthly_agg 與 receipts 一致（{time.perf_counter() - started:.2f} 秒）")
+        return
+
+    print(f"⚠️ {len(mismatches)} 個月份×分類不一致（執行 python report_agg.py rebuild 重建）:")
+    for mismatch in mismatches:
+        print(f"  {mismatch['period']} {mismatch['category'] or '(無分類)'}: "
+              f"預期 {mismatch['expected']}，彙總表 {mismatch['actual']}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()